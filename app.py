@@ -1,239 +1,346 @@
-from flask import Flask, request, send_file, Response, jsonify
-import csv
-import math
+from flask import Flask, request, send_file, Response, jsonify, url_for, stream_with_context
+import numpy as np
 from datetime import datetime
-from collections import defaultdict, Counter
+from collections import deque
 import zipfile
-import io
 from flask_cors import CORS
-from concurrent.futures import ThreadPoolExecutor
+from result_cache import ResultCache
+from jobs import JobManager, JobQueueFull
+from fragment_cache import FragmentCache
+from ingest import (CLF_COLUMNS, COVERAGE_COLUMNS, POINTS_COLUMNS, ParseErrors, clf_collector, network_collector,
+                    read_many, read_network, read_points, points_collector)
+from uploads import Upload, UploadTooLarge
+from vector_tiles import BUFFER, EXTENT, LayerBuilder, TileCache, encode_tile, project, tile_bounds, tile_ring
+from datasets import DatasetStore
+from render import (CELL_BATCH_SIZE, COMPACT_MAX_SEGMENT, COMPACT_PRECISION, PROGRESS_INTERVAL, cell_params,
+                    cell_vertices, classifier, convert_clf_file, convert_csv_to_clf, iter_clf, iter_clf_chunks,
+                    polygon_steps, render_cells, render_chunk)
+from metrics import Metrics, Timings, activate, current_timings, iter_activated, stage, timed_iter
+import hashlib
+from xml.sax.saxutils import escape
+import json
+import cProfile
+import uuid
+import tempfile
+from functools import partial
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import threading
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+import os
 
 app = Flask(__name__)
-CORS(app)
-
-# Hàm phụ trợ từ mã gốc
-def standardize_system_name(system):
-    system = str(system).upper().strip()
-    if '2G' in system or 'GSM' in system: return '2G'
-    elif '3G' in system or 'UMTS' in system: return '3G'
-    elif '4G' in system or 'LTE' in system: return '4G'
-    elif '5G' in system or 'NR' in system: return '5G'
-    return system
-
-def standardize_frequency(freq, system):
-    freq = str(freq).strip()
-    system = standardize_system_name(system)
-    if freq == 'n77': return '3800'
-    elif freq == '1874' and system == '3G': return '10587'
-    cleaned_freq = ''.join(filter(str.isdigit, freq))
-    if system == '2G':
-        if cleaned_freq in ['900', '1800']: return cleaned_freq
-        elif int(cleaned_freq) < 1000: return '900'
-        else: return '1800'
-    return cleaned_freq
-
-def get_data_layer(data_usage, tech):
-    data_usage = float(data_usage)
-    tech = standardize_system_name(tech)
-    if tech == '2G':
-        if data_usage > 30: return 5
-        elif data_usage > 20: return 4
-        elif data_usage > 5: return 3
-        elif data_usage > 1: return 2
-        else: return 1
-    elif tech == '3G':
-        if data_usage > 5: return 5
-        elif data_usage > 3: return 4
-        elif data_usage > 1: return 3
-        elif data_usage > 0.3: return 2
-        else: return 1
-    elif tech == '4G':
-        if data_usage > 500: return 5
-        elif data_usage > 200: return 4
-        elif data_usage > 50: return 3
-        elif data_usage > 10: return 2
-        else: return 1
-    else:  # 5G
-        if data_usage > 10000: return 6
-        elif data_usage > 1000: return 5
-        elif data_usage > 5000: return 4
-        elif data_usage > 200: return 3
-        elif data_usage > 50: return 2
-        else: return 1
-
-# Logic Coverage KMZ từ mã gốc
-def process_cell(cell, sites, site_cell_counts, site_has_ibc):
-    PI = math.pi
-    COLORS = {
-        'L1': 'FF00FF00', 'L2': 'FFFFFF00', 'L3': 'FF00FFFF', 
-        'L4': 'FF9314FF', 'L5': 'FF0000FF', 'L6': 'FFCD0000'
-    }
-    FREQ_CONFIG = {
-        '2G': {
-            '900': {'radius': 0.0017, 'beamwidth': 10, 'ibc_radius': 0.00015, 'ibc_beamwidth': 360},
-            '1800': {'radius': 0.00125, 'beamwidth': 10, 'ibc_radius': 0.00012, 'ibc_beamwidth': 360}
-        },
-        '3G': {
-            '3088': {'radius': 0.00109, 'beamwidth': 55, 'ibc_radius': 0.0006, 'ibc_beamwidth': 360},
-            '10562': {'radius': 0.00103, 'beamwidth': 60, 'ibc_radius': 0.0006, 'ibc_beamwidth': 360},
-            '10587': {'radius': 0.00097, 'beamwidth': 60, 'ibc_radius': 0.00054, 'ibc_beamwidth': 360},
-            '10612': {'radius': 0.00091, 'beamwidth': 60, 'ibc_radius': 0.00048, 'ibc_beamwidth': 360}
-        },
-        '4G': {
-            '25': {'radius': 0.00071, 'beamwidth': 80, 'ibc_radius': 0.00042, 'ibc_beamwidth': 360},
-            '50': {'radius': 0.00071, 'beamwidth': 80, 'ibc_radius': 0.00042, 'ibc_beamwidth': 360},
-            '1501': {'radius': 0.00065, 'beamwidth': 80, 'ibc_radius': 0.00039, 'ibc_beamwidth': 360},
-            '1874': {'radius': 0.00059, 'beamwidth': 80, 'ibc_radius': 0.00036, 'ibc_beamwidth': 360},
-            '900': {'radius': 0.00053, 'beamwidth': 90, 'ibc_radius': 0.00033, 'ibc_beamwidth': 360},
-            '3150': {'radius': 0.00047, 'beamwidth': 90, 'ibc_radius': 0.0003, 'ibc_beamwidth': 360}
-        },
-        '5G': {
-            '3800': {'radius': 0.0004, 'beamwidth': 100, 'ibc_radius': 0.0005, 'ibc_beamwidth': 360}
-        }
-    }
-    
-    site_data = sites[cell['site_id']]
-    tech, freq = standardize_system_name(cell['system']), standardize_frequency(cell['frequency'], cell['system'])
-    kml_lines = []
-    
+CORS(app, expose_headers=['Content-Disposition', 'ETag', 'X-Cells-Reused', 'X-Cells-Rendered', 'X-Rows-Skipped',
+                                'X-Rows', 'X-Files', 'X-Cells', 'X-Sites', 'Server-Timing', 'X-Profile'])
+
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'network-visualization-cache'))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 1024 ** 3))
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, version=f'2-{classifier.fingerprint}')
+
+JOBS_DIR = os.environ.get('JOBS_DIR', os.path.join(tempfile.gettempdir(), 'network-visualization-jobs'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 8))
+JOB_TTL = int(os.environ.get('JOB_TTL', 3600))
+job_manager = JobManager(JOBS_DIR, JOB_WORKERS, JOB_MAX_PENDING, JOB_TTL)
+
+FRAGMENT_CACHE_PATH = os.environ.get('FRAGMENT_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'network-visualization-fragments', 'fragments.sqlite3'))
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 2000000))
+fragment_cache = FragmentCache(FRAGMENT_CACHE_PATH, FRAGMENT_CACHE_MAX_ENTRIES)
+
+# Số liệu cho /metrics, cộng dồn qua các gunicorn worker bằng thư mục dùng chung
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'network-visualization-metrics'))
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+ROW_BUCKETS = (100, 1000, 10000, 50000, 100000, 250000, 500000, 1000000, 2000000, 5000000)
+metrics = Metrics(METRICS_DIR, 'network_visualization_')
+metrics.counter('requests_total', 'Artifact requests by kind and result cache outcome')
+metrics.histogram('stage_duration_seconds', 'Time spent in each processing stage per request', STAGE_BUCKETS)
+metrics.histogram('input_rows', 'Data rows read per upload', ROW_BUCKETS)
+metrics.counter('rows_skipped_total', 'Rows skipped because they could not be parsed')
+metrics.counter('output_bytes_total', 'Bytes of generated output')
+
+# Dataset upload một lần qua POST /datasets, lưu trên đĩa; dùng cho truy vấn có bộ lọc và vector tile
+DATASET_DIR = os.environ.get('DATASET_DIR', os.path.join(tempfile.gettempdir(), 'network-visualization-datasets'))
+DATASET_MAX_STORED = int(os.environ.get('DATASET_MAX_STORED', 16))
+DATASET_MAX_LOADED = int(os.environ.get('DATASET_MAX_LOADED', 2))
+dataset_store = DatasetStore(DATASET_DIR, DATASET_MAX_STORED, DATASET_MAX_LOADED)
+
+# Vector tile (MVT): tile sinh khi được yêu cầu và giữ trong LRU của từng process
+TILE_CACHE_MAX_BYTES = int(os.environ.get('TILE_CACHE_MAX_BYTES', 256 * 1024 ** 2))
+tile_cache = TileCache(TILE_CACHE_MAX_BYTES)
+
+# Upload gửi dạng body thô (không multipart) được chép vào file tạm, quá ngưỡng này thì ghi ra đĩa.
+# File multipart do Werkzeug tự spool ra file tạm khi lớn.
+UPLOAD_SPOOL_MAX_BYTES = int(os.environ.get('UPLOAD_SPOOL_MAX_BYTES', 8 * 1024 * 1024))
+# Giới hạn kích thước request (413 khi vượt) và số byte sau giải nén của mỗi upload nén gzip/zstd/zip
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 1024 ** 3))
+UPLOAD_MAX_DECOMPRESSED_BYTES = int(os.environ.get('UPLOAD_MAX_DECOMPRESSED_BYTES', 8 * 1024 ** 3))
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_BYTES
+RAW_UPLOAD_MIMETYPES = {'text/csv', 'text/plain', 'application/octet-stream', 'application/gzip',
+                        'application/x-gzip', 'application/zstd', 'application/zip'}
+
+# Đặt PROFILE_DIR để bật profile=1 cho từng request: ghi file cProfile (.prof) vào thư mục này
+PROFILE_DIR = os.environ.get('PROFILE_DIR')
+
+COVERAGE_COLORS = {
+    'L1': 'FF00FF00', 'L2': 'FFFFFF00', 'L3': 'FF00FFFF',
+    'L4': 'FF9314FF', 'L5': 'FF0000FF', 'L6': 'FFCD0000',
+    'site_L1': 'FF0000FF', 'site_L2': 'FF00FF00', 'site_L3': 'FFFFFF00',
+    'site_L4': 'FF00FFFF', 'site_L5': 'FF00FF00', 'site_L6': 'FF9314FF',
+    'repeater': 'FFCD0000'
+}
+# Số process render cell (<= 1: render ngay trong worker hiện tại) và số cell mỗi lô gửi sang process.
+# Mỗi gunicorn worker có pool riêng: mặc định chia đều số core cho WEB_CONCURRENCY worker (biến gunicorn dùng
+# làm số worker mặc định, Procfile chạy gunicorn không có --workers), để W worker không tạo W x số core process
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS',
+                                    max((os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY', 1)), 1)))
+RENDER_CHUNK_SIZE = int(os.environ.get('RENDER_CHUNK_SIZE', CELL_BATCH_SIZE))
+# Cách tạo process render: forkserver (mặc định nếu có) hoặc spawn; không dùng fork (xem worker_pool)
+RENDER_START_METHOD = os.environ.get('RENDER_START_METHOD') or (
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+def check_cell_class(system, frequency):
+    # Cell có tần số không chuẩn hoá được (vd. ARFCN 2G không có chữ số) bị bỏ qua như một dòng lỗi khi parse,
+    # thay vì làm hỏng response đang stream khi cell_params chạy lúc render
     try:
-        config = FREQ_CONFIG[tech][freq]
-        radius = config['ibc_radius'] if cell['type'] == 2 else config['radius']
-        beamwidth = config['ibc_beamwidth'] if cell['type'] == 2 else config['beamwidth']
-        site_cell_count = site_cell_counts[cell['site_id']]
-        if site_cell_count > 3: radius *= 0.7
-        elif site_cell_count > 1: radius *= 0.85
-        if cell['type'] == 1: radius *= 0.1
-        if cell['type'] == 2: radius *= 0.3
-        if cell['type'] == 1 and cell['site_id'] in site_has_ibc: radius *= 0.5
-    except KeyError:
-        radius = 0.00014 if cell['type'] == 2 else 0.0002
-        beamwidth = 65 if cell['type'] == 2 else 90
-        if cell['type'] == 1: radius *= 0.3
-    
-    layer = get_data_layer(cell['data_usage'], tech)
-    
-    kml_lines.append(f'<Placemark>\n<name>{cell["cell_name"]}</name>\n')
-    kml_lines.append('<Snippet maxLines="0"></Snippet>\n')
-    kml_lines.append('<description><![CDATA[\n<h3>Thông tin Cell</h3>\n<table border="1" cellpadding="3">\n')
-    kml_lines.append(f'<tr><td><b>Công nghệ</b></td><td>{tech}</td></tr>\n')
-    kml_lines.append(f'<tr><td><b>Tần số</b></td><td>{freq}</td></tr>\n')
-    kml_lines.append(f'<tr><td><b>Nhà cung cấp</b></td><td>{cell["vendor"]}</td></tr>\n')
-    kml_lines.append(f'<tr><td><b>Hướng anten</b></td><td>{cell["azimuth"]}°</td></tr>\n')
-    if tech == '2G':
-        kml_lines.append(f'<tr><td><b>Lưu lượng dữ liệu</b></td><td>{cell["data_usage"]:,.2f} Erl</td></tr>\n')
-    else:
-        kml_lines.append(f'<tr><td><b>Lưu lượng dữ liệu</b></td><td>{cell["data_usage"]:,.2f} GB</td></tr>\n')
-    kml_lines.append('</table>\n]]></description>\n')
-    kml_lines.append(f'<styleUrl>#Style_L{layer}</styleUrl>\n')
-    kml_lines.append('<Polygon>\n<outerBoundaryIs>\n<LinearRing>\n<coordinates>\n')
-    
-    if cell['type'] == 0:
-        kml_lines.append(f'{site_data["lon"]},{site_data["lat"]},0\n')
-        azimuth = cell['azimuth']
-        half_bw = beamwidth / 2
-        steps = 12
-        for i in range(steps, -1, -1):
-            angle = azimuth - half_bw + (i * beamwidth / steps)
-            rad_angle = PI * angle / 180
-            kml_lines.append(f'{site_data["lon"] + radius * math.sin(rad_angle)},{site_data["lat"] + radius * math.cos(rad_angle)},0\n')
-        kml_lines.append(f'{site_data["lon"]},{site_data["lat"]},0\n')
-    else:
-        steps = 24
-        for i in range(steps + 1):
-            angle = 2 * PI * i / steps
-            kml_lines.append(f'{site_data["lon"] + radius * math.cos(angle)},{site_data["lat"] + radius * math.sin(angle)},0\n')
-    
-    kml_lines.append('</coordinates>\n</LinearRing>\n</outerBoundaryIs>\n</Polygon>\n')
-    
-    if cell['type'] == 2:
-        kml_lines.append('<Placemark>\n')
-        kml_lines.append(f'<name>{cell["cell_name"]}_beam</name>\n')
-        kml_lines.append('<Snippet maxLines="0"></Snippet>\n')
-        kml_lines.append('<LineString>\n<coordinates>\n')
-        kml_lines.append(f'{site_data["lon"]},{site_data["lat"]},0\n')
-        beam_length = radius * 1.2
-        beam_angle = cell['azimuth'] * PI / 180
-        kml_lines.append(f'{site_data["lon"] + beam_length * math.sin(beam_angle)},{site_data["lat"] + beam_length * math.cos(beam_angle)},0\n')
-        kml_lines.append('</coordinates>\n</LineString>\n')
-        kml_lines.append(f'<styleUrl>#Style_L{layer}</styleUrl>\n')
-        kml_lines.append('</Placemark>\n')
-    
-    kml_lines.append('</Placemark>\n')
-    return ''.join(kml_lines)
+        classifier.frequency(frequency, system)
+    except ValueError:
+        raise ValueError(f"Unrecognised frequency {frequency!r} for system {system!r}") from None
 
-def create_coverage_kml(csv_content):
-    PI = math.pi
-    COLORS = {
-        'L1': 'FF00FF00', 'L2': 'FFFFFF00', 'L3': 'FF00FFFF', 
-        'L4': 'FF9314FF', 'L5': 'FF0000FF', 'L6': 'FFCD0000',
-        'site_L1': 'FF0000FF', 'site_L2': 'FF00FF00', 'site_L3': 'FFFFFF00',
-        'site_L4': 'FF00FFFF', 'site_L5': 'FF00FF00', 'site_L6': 'FF9314FF',
-        'repeater': 'FFCD0000'
-    }
-    today = datetime.now().strftime("%Y%m%d_%H%M")
-    sites = defaultdict(dict)
-    cells = []
-    required_columns = {'SITEID', 'LAT', 'LONG', 'CELLNAME', 'CELLID', 'SYS', 
-                        'ARFCN/UARFCN/EARFCN/NR-ARFCN', 'AZIMUTH', 'ANT_HEIGHT', 
-                        'TILT', 'HBW', 'VBW', 'DATA', 'PLT', 'TYPE'}
-
-    with io.StringIO(csv_content) as f:
-        reader = csv.DictReader(f)
-        if not required_columns.issubset(reader.fieldnames):
-            missing = required_columns - set(reader.fieldnames)
-            raise ValueError(f"Missing required columns: {missing}")
-
-        processed_lines = 0
-        for i, row in enumerate(reader, start=2):
-            processed_lines += 1
-            try:
-                site_id = row['SITEID']
-                lat = float(row['LAT'])
-                lon = float(row['LONG'])
-                cell_name = row['CELLNAME']
-                cell_id = row['CELLID']
-                system = row['SYS']
-                vendor = row.get('VENDOR', 'N/A')
-                desc = row.get('DESC', 'N/A')
-                freq = row['ARFCN/UARFCN/EARFCN/NR-ARFCN']
-                azimuth = float(row['AZIMUTH'])
-                height = float(row['ANT_HEIGHT'])
-                tilt = float(row['TILT'])
-                hbw = float(row['HBW'])
-                vbw = float(row['VBW'])
-                data_usage = float(row['DATA'])
-                plt = int(row['PLT'])
-                cell_type = int(row['TYPE'])
-
-                if site_id not in sites:
-                    sites[site_id] = {'lat': lat, 'lon': lon, 'desc': desc, 'province': row.get('PROVINCE', 'N/A'),
-                                      'vendor': vendor, 'plt': plt}
-                
-                cells.append({'site_id': site_id, 'cell_name': cell_name, 'cell_id': cell_id, 'system': system,
-                              'frequency': freq, 'azimuth': azimuth, 'height': height, 'tilt': tilt,
-                              'h_beamwidth': hbw, 'v_beamwidth': vbw, 'data_usage': data_usage,
-                              'plt': plt, 'vendor': vendor, 'type': cell_type})
-            except ValueError as e:
-                continue
-
-    if not sites or not cells:
+def check_cell_classes(cells):
+    # Kiểm tra trước khi stream cho bảng cell không qua check_cell_class lúc parse; mỗi cặp (SYS, ARFCN) một lần
+    pairs = np.unique(np.stack([cells.system, cells.frequency], axis=1), axis=0) if len(cells) else ()
+    for system, frequency in pairs:
+        check_cell_class(cells.systems[system], cells.frequencies[frequency])
+
+def parse_coverage_csv(csv_content, progress=None, keep_clf=False):
+    sites, cells, errors = read_network(csv_content, progress, PROGRESS_INTERVAL, keep_clf, check_cell_class)
+    if not len(sites) or not len(cells):
         raise ValueError("No valid data to create KML.")
+    return sites, cells, errors
 
-    site_cell_counts = Counter(cell['site_id'] for cell in cells)
-    site_has_ibc = {cell['site_id'] for cell in cells if cell['type'] == 2}
+# Render cell song song bằng process pool
+# Một process pool cho cả process, tạo ở lần dùng đầu tiên và dùng lại cho mọi request/job.
+# Hàm gửi sang process con nằm trong module render, nên process con không import app (cache, job, metrics...).
+# Không dùng fork: pool có thể được tạo (và process con được tạo thêm) từ thread của request, job hoặc /export
+# trong lúc các thread khác đang chạy, fork một process nhiều thread có thể deadlock
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
 
-    kml_lines = [
-        '<?xml version="1.0" encoding="UTF-8"?>\n',
-        '<kml xmlns="http://www.opengis.net/kml/2.2">\n',
-        '<Document>\n',
-        f'<name>Network_Coverage_{today}</name>\n'
-    ]
-    
+def worker_pool():
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                               mp_context=multiprocessing.get_context(RENDER_START_METHOD))
+        return _worker_pool
+
+def shutdown_worker_pool():
+    # Dừng pool và chờ các process con thoát (vd. benchmark đo bộ nhớ của chúng qua RUSAGE_CHILDREN)
+    global _worker_pool
+    with _worker_pool_lock:
+        pool, _worker_pool = _worker_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+def discard_worker_pool(pool):
+    # Pool hỏng (process con bị kill...) được thay bằng pool mới ở lần dùng sau
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is pool:
+            _worker_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def chunk_sites(cells, sites, site_cell_counts, site_has_ibc):
+    # Chỉ gửi sang process con các site mà lô cell dùng tới, chỉ số site của lô được đánh lại theo tập con đó
+    used, site_index = np.unique(cells.site, return_inverse=True)
+    cells.site = site_index.astype(np.int32)
+    return cells, sites.take(used), site_cell_counts[used], site_has_ibc[used]
+
+def cell_spans(total, chunk_size, boundaries=None):
+    # Các khoảng [start, end) tối đa chunk_size cell, không vượt qua ranh giới (vd. ranh giới tile)
+    spans = []
+    start = 0
+    for end in boundaries or [total]:
+        spans.extend((s, min(s + chunk_size, end)) for s in range(start, end, chunk_size))
+        start = end
+    return spans
+
+def iter_rendered_cells(cells, sites, site_cell_counts, site_has_ibc, workers=None, chunk_size=None, progress=None,
+                        spans=None, compact=None):
+    # Mỗi khoảng trong spans sinh ra đúng một chuỗi KML
+    workers = RENDER_WORKERS if workers is None else workers
+    chunk_size = RENDER_CHUNK_SIZE if chunk_size is None else chunk_size
+    spans = cell_spans(len(cells), chunk_size) if spans is None else spans
+    chunks = (cells.take(slice(start, end)) for start, end in spans)
+    rendered = 0
+
+    def done(span, fragment, durations=None):
+        nonlocal rendered
+        rendered += span[1] - span[0]
+        timings = current_timings()
+        if durations and timings is not None:
+            for name, seconds in durations.items():
+                timings.add(name, seconds)
+        if progress:
+            progress('rendering', rendered)
+        return fragment
+
+    if workers <= 1 or len(spans) <= 1:
+        for chunk, span in zip(chunks, spans):
+            yield done(span, ''.join(render_cells(chunk, sites, site_cell_counts, site_has_ibc, compact)))
+        return
+
+    pool = worker_pool()
+    pending = deque()
+    try:
+        # Giữ tối đa 2 lô mỗi process đang chờ để bộ nhớ không tăng theo số cell, trả kết quả đúng thứ tự
+        for chunk, span in zip(chunks, spans):
+            pending.append((pool.submit(render_chunk, *chunk_sites(chunk, sites, site_cell_counts, site_has_ibc),
+                                        compact), span))
+            if len(pending) >= workers * 2:
+                future, done_span = pending.popleft()
+                yield done(done_span, *future.result())
+        while pending:
+            future, done_span = pending.popleft()
+            yield done(done_span, *future.result())
+    except BrokenProcessPool:
+        discard_worker_pool(pool)
+        raise
+    finally:
+        for future, _ in pending:
+            future.cancel()
+
+def site_cell_stats(sites, cells):
+    # Số cell và cờ có cell IBC của từng site, đánh chỉ số theo SiteTable
+    site_cell_counts = np.bincount(cells.site, minlength=len(sites))
+    site_has_ibc = np.zeros(len(sites), dtype=bool)
+    site_has_ibc[cells.site[cells.type == 2]] = True
+    return site_cell_counts, site_has_ibc
+
+# Render lại tăng dần: Placemark của cell được cache theo mọi thuộc tính ảnh hưởng tới nội dung của nó
+FRAGMENT_KEY_VERSION = '2'
+
+def cell_fragment_keys(cells, sites, site_cell_counts, site_has_ibc, compact=None):
+    techs, freqs, radius, beamwidths, layers = cell_params(cells, site_cell_counts, site_has_ibc)
+    counts = site_cell_counts[cells.site]
+    count_buckets = np.where(counts > 3, 3, np.where(counts > 1, 2, 1))
+    columns = (sites.lon[cells.site].tolist(), sites.lat[cells.site].tolist(), count_buckets.tolist(),
+               site_has_ibc[cells.site].tolist(), techs, freqs, cells.type.tolist(), cells.azimuth.tolist(),
+               layers.tolist(), radius.tolist(), beamwidths.tolist(), list(cells.cell_name),
+               [cells.vendors[k] for k in cells.vendor.tolist()], [f'{value:,.2f}' for value in cells.data_usage.tolist()])
+    # Fragment rút gọn có khoá riêng; khoá của định dạng gốc giữ nguyên để cache cũ vẫn dùng được
+    prefix = (FRAGMENT_KEY_VERSION,) if compact is None else (FRAGMENT_KEY_VERSION, compact)
+    return [hashlib.blake2b(repr(prefix + fields).encode('utf-8'), digest_size=16).digest()
+            for fields in zip(*columns)]
+
+def iter_incremental_cells(cells, sites, site_cell_counts, site_has_ibc, keys, progress=None, spans=None,
+                           compact=None, workers=None):
+    # Placemark đã có lấy từ fragment cache; cell còn thiếu của mỗi lô được render trong process pool
+    # giống iter_rendered_cells. Mỗi khoảng trong spans sinh ra đúng một chuỗi KML
+    workers = RENDER_WORKERS if workers is None else workers
+    spans = cell_spans(len(cells), CELL_BATCH_SIZE) if spans is None else spans
+
+    def lookup(start, end):
+        batch_keys = keys[start:end]
+        with stage('fragment_cache'):
+            fragments = fragment_cache.get_many(batch_keys)
+        missing = [k for k, key in enumerate(batch_keys) if key not in fragments]
+        missing_cells = cells.take(slice(start, end)).take(missing) if missing else None
+        return missing_cells, batch_keys, fragments, missing
+
+    def done(batch_keys, fragments, missing, fresh, end):
+        if missing:
+            fresh_items = [(batch_keys[k], fragment) for k, fragment in zip(missing, fresh)]
+            with stage('fragment_cache'):
+                fragment_cache.put_many(fresh_items)
+            fragments.update(fresh_items)
+        if progress:
+            progress('rendering', end)
+        return ''.join(fragments[key] for key in batch_keys)
+
+    if workers <= 1 or len(spans) <= 1:
+        for start, end in spans:
+            missing_cells, batch_keys, fragments, missing = lookup(start, end)
+            fresh = render_cells(missing_cells, sites, site_cell_counts, site_has_ibc, compact) if missing else []
+            yield done(batch_keys, fragments, missing, fresh, end)
+    else:
+        pool = worker_pool()
+        pending = deque()
+
+        def collect(future, batch_keys, fragments, missing, end):
+            fresh = []
+            if future is not None:
+                fresh, durations = future.result()
+                timings = current_timings()
+                if durations and timings is not None:
+                    for name, seconds in durations.items():
+                        timings.add(name, seconds)
+            return done(batch_keys, fragments, missing, fresh, end)
+
+        try:
+            # Giữ tối đa 2 lô mỗi process đang chờ, trả kết quả đúng thứ tự
+            for start, end in spans:
+                missing_cells, batch_keys, fragments, missing = lookup(start, end)
+                future = None
+                if missing:
+                    future = pool.submit(render_chunk, *chunk_sites(missing_cells, sites, site_cell_counts, site_has_ibc),
+                                         compact, False)
+                pending.append((future, batch_keys, fragments, missing, end))
+                if len(pending) >= workers * 2:
+                    yield collect(*pending.popleft())
+            while pending:
+                yield collect(*pending.popleft())
+        except BrokenProcessPool:
+            discard_worker_pool(pool)
+            raise
+        finally:
+            for future, *_ in pending:
+                if future is not None:
+                    future.cancel()
+    with stage('fragment_cache'):
+        fragment_cache.evict()
+
+KML_DOCUMENT_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+    '<Document>\n'
+)
+KML_DOCUMENT_FOOTER = '</Document>\n</kml>\n'
+
+# BalloonStyle dùng chung của chế độ rút gọn: $[...] được thay bằng ExtendedData của từng Placemark
+CELL_BALLOON_KML = (
+    '<BalloonStyle><text><![CDATA[\n<h3>Thông tin Cell</h3>\n<table border="1" cellpadding="3">\n'
+    '<tr><td><b>Công nghệ</b></td><td>$[tech]</td></tr>\n'
+    '<tr><td><b>Tần số</b></td><td>$[freq]</td></tr>\n'
+    '<tr><td><b>Nhà cung cấp</b></td><td>$[vendor]</td></tr>\n'
+    '<tr><td><b>Hướng anten</b></td><td>$[azimuth]°</td></tr>\n'
+    '<tr><td><b>Lưu lượng dữ liệu</b></td><td>$[data]</td></tr>\n'
+    '</table>\n]]></text></BalloonStyle>\n'
+)
+SITE_BALLOON_KML = (
+    '<BalloonStyle><text><![CDATA[\n<h3>Thông tin Site</h3>\n<table border="1" cellpadding="3">\n'
+    '<tr><td><b>Tỉnh</b></td><td>$[province]</td></tr>\n'
+    '<tr><td><b>Loại trạm </b></td><td>$[desc]</td></tr>\n'
+    '<tr><td><b>Phân Loại Trạm</b></td><td>$[plt]</td></tr>\n'
+    '</table>\n]]></text></BalloonStyle>\n'
+)
+POINT_BALLOON_KML = (
+    '<BalloonStyle><text><![CDATA[\n<h3>Thông tin Site</h3>\n<p><b>SiteID:</b> $[name]</p>\n'
+    '<p><b>Latitude:</b> $[lat]</p>\n<p><b>Longitude:</b> $[lon]</p>\n]]></text></BalloonStyle>\n'
+)
+
+def coverage_styles_kml(compact=None):
+    COLORS = COVERAGE_COLORS
+    kml_lines = []
     for layer in ['L1', 'L2', 'L3', 'L4', 'L5', 'L6']:
         kml_lines.append(f'<Style id="Style_{layer}">\n<IconStyle><Icon></Icon></IconStyle>\n')
         kml_lines.append(f'<LabelStyle><color>{COLORS[layer]}</color></LabelStyle>\n')
         kml_lines.append(f'<LineStyle><color>{COLORS[layer]}</color></LineStyle>\n')
+        if compact is not None:
+            kml_lines.append(CELL_BALLOON_KML)
         kml_lines.append(f'<PolyStyle><color>b3{COLORS[layer][2:]}</color></PolyStyle>\n</Style>\n')
     
     for i in range(1, 7):
@@ -242,196 +349,1146 @@ def create_coverage_kml(csv_content):
         kml_lines.append('<Icon><href>http://maps.google.com/mapfiles/kml/shapes/shaded_dot.png</href></Icon>\n')
         kml_lines.append('</IconStyle>\n')
         kml_lines.append('<LabelStyle><scale>1.0</scale></LabelStyle>\n')
+        if compact is not None:
+            kml_lines.append(SITE_BALLOON_KML)
         kml_lines.append('</Style>\n')
     
     kml_lines.append('<Style id="FolderStyleSites">\n<ListStyle>\n</ListStyle>\n<LabelStyle><scale>0</scale></LabelStyle>\n</Style>\n')
     kml_lines.append('<Style id="FolderStyleCells">\n<ListStyle>\n<listItemType>checkHideChildren</listItemType>\n</ListStyle>\n<LabelStyle><scale>0</scale></LabelStyle>\n</Style>\n')
+    return ''.join(kml_lines)
 
-    kml_lines.append('<Folder>\n<name>Sites</name>\n<open>1</open>\n<styleUrl>#FolderStyleSites</styleUrl>\n')
-    total_sites = len(sites)
-    for i, (site_id, site_data) in enumerate(sites.items(), 1):
-        kml_lines.append(f'<Placemark>\n<name>{site_id}</name>\n<Snippet maxLines="0"></Snippet>\n')
-        kml_lines.append('<description><![CDATA[\n<h3>Thông tin Site</h3>\n<table border="1" cellpadding="3">\n')
-        kml_lines.append(f'<tr><td><b>Tỉnh</b></td><td>{site_data["province"]}</td></tr>\n')
-        kml_lines.append(f'<tr><td><b>Loại trạm </b></td><td>{site_data["desc"]}</td></tr>\n')
-        kml_lines.append(f'<tr><td><b>Phân Loại Trạm</b></td><td>{site_data["plt"]}</td></tr>\n</table>\n]]></description>\n')
-        kml_lines.append(f'<styleUrl>#Style_site_L{min(site_data["plt"], 6)}</styleUrl>\n')
-        kml_lines.append(f'<Point>\n<coordinates>{site_data["lon"]},{site_data["lat"]},0</coordinates>\n</Point>\n</Placemark>\n')
-    kml_lines.append('</Folder>\n')
+def render_site(sites, k):
+    kml_lines = []
+    kml_lines.append(f'<Placemark>\n<name>{sites.ids[k]}</name>\n<Snippet maxLines="0"></Snippet>\n')
+    kml_lines.append('<description><![CDATA[\n<h3>Thông tin Site</h3>\n<table border="1" cellpadding="3">\n')
+    kml_lines.append(f'<tr><td><b>Tỉnh</b></td><td>{sites.province[k]}</td></tr>\n')
+    kml_lines.append(f'<tr><td><b>Loại trạm </b></td><td>{sites.desc[k]}</td></tr>\n')
+    kml_lines.append(f'<tr><td><b>Phân Loại Trạm</b></td><td>{sites.plt[k]}</td></tr>\n</table>\n]]></description>\n')
+    kml_lines.append(f'<styleUrl>#Style_site_L{min(sites.plt[k], 6)}</styleUrl>\n')
+    kml_lines.append(f'<Point>\n<coordinates>{float(sites.lon[k])},{float(sites.lat[k])},0</coordinates>\n</Point>\n</Placemark>\n')
+    return ''.join(kml_lines)
 
-    kml_lines.append('<Folder>\n<name>Cells</name>\n<open>0</open>\n<styleUrl>#FolderStyleCells</styleUrl>\n')
-    with ThreadPoolExecutor() as executor:
-        cell_results = list(executor.map(lambda c: process_cell(c, sites, site_cell_counts, site_has_ibc), cells))
-        for result in cell_results:
-            kml_lines.append(result)
+def render_compact_site(sites, k, precision):
+    kml_lines = []
+    kml_lines.append(f'<Placemark><name>{escape(sites.ids[k])}</name><styleUrl>#Style_site_L{min(sites.plt[k], 6)}</styleUrl>\n')
+    kml_lines.append(f'<ExtendedData><Data name="province"><value>{escape(sites.province[k])}</value></Data>'
+                     f'<Data name="desc"><value>{escape(sites.desc[k])}</value></Data>'
+                     f'<Data name="plt"><value>{sites.plt[k]}</value></Data></ExtendedData>\n')
+    kml_lines.append(f'<Point><coordinates>{round(float(sites.lon[k]), precision)},'
+                     f'{round(float(sites.lat[k]), precision)}</coordinates></Point></Placemark>\n')
+    return ''.join(kml_lines)
+
+def iter_coverage_folders(sites, site_indices, cell_fragments, compact=None):
+    yield '<Folder>\n<name>Sites</name>\n<open>1</open>\n<styleUrl>#FolderStyleSites</styleUrl>\n'
+    if compact is None:
+        render = render_site
+    else:
+        render = partial(render_compact_site, precision=compact[0])
+    kml_lines = []
+    for i, k in enumerate(site_indices, 1):
+        kml_lines.append(render(sites, k))
+        if i % CELL_BATCH_SIZE == 0:
+            yield ''.join(kml_lines)
+            kml_lines = []
     kml_lines.append('</Folder>\n')
-    kml_lines.append('</Document>\n</kml>\n')
-    
+    kml_lines.append('<Folder>\n<name>Cells</name>\n<open>0</open>\n<styleUrl>#FolderStyleCells</styleUrl>\n')
+    yield ''.join(kml_lines)
+    yield from cell_fragments
+    yield '</Folder>\n'
+
+def iter_coverage_kml(sites, cells, workers=None, chunk_size=None, progress=None, cell_fragments=None, compact=None):
+    today = datetime.now().strftime("%Y%m%d_%H%M")
+    yield KML_DOCUMENT_HEADER + f'<name>Network_Coverage_{today}</name>\n' + coverage_styles_kml(compact)
+
+    if cell_fragments is None:
+        site_cell_counts, site_has_ibc = site_cell_stats(sites, cells)
+        cell_fragments = iter_rendered_cells(cells, sites, site_cell_counts, site_has_ibc, workers, chunk_size, progress,
+                                             compact=compact)
+    yield from iter_coverage_folders(sites, range(len(sites)), cell_fragments, compact)
+
+    yield KML_DOCUMENT_FOOTER
+
+def create_coverage_kml(csv_content):
+    # csv_content: chuỗi CSV hoặc luồng text
+    sites, cells, _ = parse_coverage_csv(csv_content)
+    return ''.join(iter_coverage_kml(sites, cells))
+
+# Nén KMZ dạng luồng
+class _KmzStreamBuffer:
+    # File đích chỉ ghi (không seek được) để ZipFile ghi data descriptor cho từng entry
+    def __init__(self):
+        self._chunks = []
+        self._size = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        return data
+
+KMZ_STREAM_CHUNK_SIZE = 64 * 1024
+
+def zip_entry_info(arcname, date_time, compresslevel=None, stored=()):
+    # zf.open(tên, 'w') ghi ngày 1980-01-01 cho entry; ZipInfo mang thời điểm tạo như writestr của mã gốc
+    # stored: tên các entry đã nén sẵn (vd. KMZ), ghi nguyên vào zip thay vì deflate thêm lần nữa
+    info = zipfile.ZipInfo(arcname, date_time)
+    if arcname in stored:
+        info.compress_type = zipfile.ZIP_STORED
+    else:
+        info.compress_type = zipfile.ZIP_DEFLATED
+        # Cùng thuộc tính mà zf.open gán cho entry tạo từ tên
+        info._compresslevel = compresslevel
+    return info
+
+def iter_zip_entries(entries, compresslevel=None):
+    # entries: các cặp (tên file trong zip, các chunk bytes); zip được nén và trả dần theo từng khối
+    # compresslevel: mức nén deflate 0-9 (None: mặc định của zlib), đổi CPU lấy kích thước file
+    buffer = _KmzStreamBuffer()
+    date_time = datetime.now().timetuple()[:6]
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zf:
+        for arcname, chunks in entries:
+            with zf.open(zip_entry_info(arcname, date_time, compresslevel), 'w', force_zip64=True) as entry:
+                for chunk in chunks:
+                    with stage('deflate'):
+                        entry.write(chunk)
+                    if buffer._size >= KMZ_STREAM_CHUNK_SIZE:
+                        yield buffer.drain()
+    data = buffer.drain()
+    if data:
+        yield data
+
+def write_zip_file(path, entries, compresslevel=None, stored=()):
+    # Ghi zip ra file seek được: ZipFile quay lại điền CRC và kích thước vào local header của từng entry
+    # thay vì dùng data descriptor. Trình giải nén dạng luồng (vd. bsdtar) không đọc được entry stored
+    # có data descriptor vì không biết entry kết thúc ở đâu.
+    date_time = datetime.now().timetuple()[:6]
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zf:
+        for arcname, chunks in entries:
+            with zf.open(zip_entry_info(arcname, date_time, compresslevel, stored), 'w', force_zip64=True) as entry:
+                for chunk in chunks:
+                    with stage('deflate'):
+                        entry.write(chunk)
+
+def iter_kmz_entries(entries, compresslevel=None):
+    # entries: các cặp (tên file trong KMZ, các chunk KML); entry đầu tiên là tài liệu gốc
+    return iter_zip_entries(((arcname, timed_iter('kml', (chunk.encode('utf-8') for chunk in kml_chunks)))
+                             for arcname, kml_chunks in entries), compresslevel)
+
+def iter_kmz(kml_chunks, arcname='doc.kml', compresslevel=None):
+    return iter_kmz_entries([(arcname, kml_chunks)], compresslevel)
+
+# KMZ dạng tile: quadtree trên toạ độ site, mỗi tile một file KML, viewer chỉ nạp tile đang nhìn thấy qua Region/Lod
+TILE_MAX_DEPTH = 8
+TILE_MAX_FEATURES = 5000
+TILE_MIN_LOD_PIXELS = 128
+TILE_REGION_PADDING = 0.002
+
+def build_tile_tree(points, max_depth, max_features):
+    # points: các bộ (lon, lat, số feature, item); tách node khi số feature vượt max_features
+    bbox = (min(p[0] for p in points), min(p[1] for p in points),
+            max(p[0] for p in points), max(p[1] for p in points))
+
+    def split(node_points, bbox, path):
+        west, south, east, north = bbox
+        # Mọi điểm trùng một toạ độ thì tách tiếp cũng không chia được nữa
+        same_point = all(p[0] == node_points[0][0] and p[1] == node_points[0][1] for p in node_points)
+        if sum(p[2] for p in node_points) <= max_features or len(path) - 1 >= max_depth or same_point:
+            return {'path': path, 'bbox': bbox, 'items': [p[3] for p in node_points], 'children': []}
+        mid_lon, mid_lat = (west + east) / 2, (south + north) / 2
+        quadrants = [[], [], [], []]
+        for p in node_points:
+            quadrants[(p[0] >= mid_lon) + 2 * (p[1] >= mid_lat)].append(p)
+        boxes = [(west, south, mid_lon, mid_lat), (mid_lon, south, east, mid_lat),
+                 (west, mid_lat, mid_lon, north), (mid_lon, mid_lat, east, north)]
+        children = [split(q, box, path + str(k)) for k, (q, box) in enumerate(zip(quadrants, boxes)) if q]
+        return {'path': path, 'bbox': bbox, 'items': [], 'children': children}
+
+    return split(points, bbox, 'r')
+
+def iter_tiles(node):
+    yield node
+    for child in node['children']:
+        yield from iter_tiles(child)
+
+def tile_leaves(tree):
+    return [node for node in iter_tiles(tree) if not node['children']]
+
+def tile_links_kml(node, href_prefix):
+    kml_lines = []
+    for child in node['children']:
+        west, south, east, north = child['bbox']
+        kml_lines.append(f'<NetworkLink>\n<name>{child["path"]}</name>\n<Region>\n<LatLonAltBox>\n')
+        kml_lines.append(f'<north>{north + TILE_REGION_PADDING}</north><south>{south - TILE_REGION_PADDING}</south>\n')
+        kml_lines.append(f'<east>{east + TILE_REGION_PADDING}</east><west>{west - TILE_REGION_PADDING}</west>\n')
+        kml_lines.append(f'</LatLonAltBox>\n<Lod><minLodPixels>{TILE_MIN_LOD_PIXELS}</minLodPixels><maxLodPixels>-1</maxLodPixels></Lod>\n</Region>\n')
+        kml_lines.append(f'<Link><href>{href_prefix}{child["path"]}.kml</href><viewRefreshMode>onRegion</viewRefreshMode></Link>\n')
+        kml_lines.append('</NetworkLink>\n')
     return ''.join(kml_lines)
 
+def iter_tiled_kmz_entries(tree, doc_name, styles, render_leaf):
+    # doc.kml là node gốc; node trong chỉ chứa NetworkLink tới node con, lá chứa style + feature (render_leaf)
+    def document(node, name, href_prefix):
+        yield KML_DOCUMENT_HEADER + f'<name>{name}</name>\n'
+        if node['children']:
+            yield tile_links_kml(node, href_prefix)
+        else:
+            yield styles
+            yield from render_leaf(node)
+        yield KML_DOCUMENT_FOOTER
+
+    yield 'doc.kml', document(tree, doc_name, 'tiles/')
+    for node in iter_tiles(tree):
+        if node is not tree:
+            yield f'tiles/{node["path"]}.kml', document(node, node['path'], '')
+
+def tile_coverage(sites, cells, max_depth, max_features, chunk_size):
+    # Sắp xếp lại cell theo thứ tự tile lá; mỗi lá ghi số khoảng render (span) thuộc về nó
+    site_cell_counts = np.bincount(cells.site, minlength=len(sites))
+    by_site = np.argsort(cells.site, kind='stable')
+    site_starts = np.concatenate(([0], np.cumsum(site_cell_counts)))
+    tree = build_tile_tree(list(zip(sites.lon.tolist(), sites.lat.tolist(), (1 + site_cell_counts).tolist(),
+                                    range(len(sites)))), max_depth, max_features)
+    order = []
+    boundaries = []
+    for leaf in tile_leaves(tree):
+        leaf_start = len(order)
+        for k in leaf['items']:
+            order.extend(by_site[site_starts[k]:site_starts[k + 1]].tolist())
+        boundaries.append(len(order))
+        leaf['n_spans'] = len(cell_spans(len(order) - leaf_start, chunk_size))
+    return tree, cells.take(np.array(order, dtype=np.int64)), cell_spans(len(order), chunk_size, boundaries)
+
+def iter_tiled_coverage_kmz(sites, tree, cell_fragments, compact=None, compresslevel=None):
+    today = datetime.now().strftime("%Y%m%d_%H%M")
+    cell_fragments = iter(cell_fragments)
+
+    def render_leaf(leaf):
+        leaf_fragments = (next(cell_fragments) for _ in range(leaf['n_spans']))
+        return iter_coverage_folders(sites, leaf['items'], leaf_fragments, compact)
+
+    return iter_kmz_entries(iter_tiled_kmz_entries(tree, f'Network_Coverage_{today}', coverage_styles_kml(compact),
+                                                   render_leaf), compresslevel)
+
+KMZ_MIMETYPE = 'application/vnd.google-earth.kmz'
+
+def cached_response(kind, upload_digest, params, build, mimetype, download_name):
+    # ETag là khoá cache (nội dung upload + tham số), không phụ thuộc tên tài liệu có datetime.now()
+    # build(stats) trả về các chunk bytes; số liệu build ghi vào stats được trả qua header X-...
+    key = result_cache.key(kind, upload_digest, *params)
+    if request.if_none_match.contains(key):
+        response = Response(status=304)
+        metrics.inc('requests_total', kind=kind, cache='not_modified')
+    else:
+        cached = result_cache.open(key)
+        if cached is not None:
+            response = send_file(cached, mimetype=mimetype, download_name=download_name, as_attachment=True)
+            metrics.inc('requests_total', kind=kind, cache='hit')
+        else:
+            metrics.inc('requests_total', kind=kind, cache='miss')
+            stats = {}
+            chunks = build(stats)
+            # Giữ request context (và file upload của nó) tới khi stream xong, vì kết quả có thể còn đọc upload
+            response = Response(stream_with_context(result_cache.store(key, chunks)), mimetype=mimetype,
+                                headers={'Content-Disposition': f'attachment; filename="{download_name}"'})
+            for name, value in stats.items():
+                if isinstance(value, (int, float, str)):
+                    response.headers['X-' + name.replace('_', '-').title()] = str(value)
+    response.set_etag(key)
+    return response
+
 # Logic Points KMZ từ mã gốc
-def process_site(row, sites_set):
+def parse_points_csv(csv_content, progress=None):
+    sites, errors = read_points(csv_content, progress, PROGRESS_INTERVAL)
+    if not len(sites):
+        raise ValueError("No valid data to create KML.")
+    return sites, errors
+
+def points_style_kml(color, size, icon, compact=None):
+    return (
+        f'<Style id="customStyle">\n<IconStyle>\n<color>{color}</color>\n<scale>{size}</scale>\n'
+        f'<Icon><href>http://maps.google.com/mapfiles/kml/shapes/{icon}.png</href></Icon>\n'
+        '</IconStyle>\n' + ('' if compact is None else POINT_BALLOON_KML) + '</Style>\n'
+    )
+
+def render_point(sites, k):
+    site_id, lat, lon = sites.ids[k], float(sites.lat[k]), float(sites.lon[k])
+    kml_lines = []
+    kml_lines.append(f'<Placemark>\n<name>{site_id}</name>\n')
+    kml_lines.append('<Snippet maxLines="0"></Snippet>\n')
+    kml_lines.append('<description><![CDATA[\n')
+    kml_lines.append(f'<h3>Thông tin Site</h3>\n')
+    kml_lines.append(f'<p><b>SiteID:</b> {site_id}</p>\n')
+    kml_lines.append(f'<p><b>Latitude:</b> {lat}</p>\n')
+    kml_lines.append(f'<p><b>Longitude:</b> {lon}</p>\n')
+    kml_lines.append(']]></description>\n')
+    kml_lines.append('<styleUrl>#customStyle</styleUrl>\n')
+    kml_lines.append(f'<Point>\n<coordinates>{lon},{lat},0</coordinates>\n</Point>\n')
+    kml_lines.append('</Placemark>\n')
+    return ''.join(kml_lines)
+
+def render_compact_point(sites, k, precision):
+    site_id, lat, lon = sites.ids[k], round(float(sites.lat[k]), precision), round(float(sites.lon[k]), precision)
+    return (f'<Placemark><name>{escape(site_id)}</name><styleUrl>#customStyle</styleUrl>'
+            f'<ExtendedData><Data name="lat"><value>{lat}</value></Data><Data name="lon"><value>{lon}</value></Data>'
+            f'</ExtendedData><Point><coordinates>{lon},{lat}</coordinates></Point></Placemark>\n')
+
+def iter_points_folder(sites, site_indices, compact=None):
+    yield '<Folder>\n<name>Sites</name>\n<visibility>0</visibility>\n'
+    if compact is None:
+        render = render_point
+    else:
+        render = partial(render_compact_point, precision=compact[0])
+    for start in range(0, len(site_indices), CELL_BATCH_SIZE):
+        yield ''.join(render(sites, k) for k in site_indices[start:start + CELL_BATCH_SIZE])
+    yield '</Folder>\n'
+
+def iter_points_kml(sites, color, size, icon, compact=None):
+    yield (KML_DOCUMENT_HEADER + f'<name>Network_Sites_{datetime.now().strftime("%Y%m%d_%H%M")}</name>\n'
+           + points_style_kml(color, size, icon, compact))
+    yield from iter_points_folder(sites, range(len(sites)), compact)
+    yield KML_DOCUMENT_FOOTER
+
+def create_points_kml(csv_content, color, size, icon, progress=None):
+    sites, _ = parse_points_csv(csv_content, progress)
+    return ''.join(iter_points_kml(sites, color, size, icon))
+
+def iter_tiled_points_kmz(sites, color, size, icon, max_depth, max_features, compact=None, compresslevel=None):
+    tree = build_tile_tree(list(zip(sites.lon.tolist(), sites.lat.tolist(), [1] * len(sites), range(len(sites)))),
+                           max_depth, max_features)
+    return iter_kmz_entries(iter_tiled_kmz_entries(
+        tree, f'Network_Sites_{datetime.now().strftime("%Y%m%d_%H%M")}', points_style_kml(color, size, icon, compact),
+        lambda leaf: iter_points_folder(sites, leaf['items'], compact)
+    ), compresslevel)
+
+# Các loại kết quả: dùng chung cho endpoint đồng bộ và job nền
+def record_parse_errors(stats, errors):
+    if stats is not None:
+        stats['rows'] = errors.rows
+        stats['rows_skipped'] = errors.count
+        stats['parse_errors'] = errors.samples
+
+def build_coverage_kmz(upload, params, progress=None, stats=None):
+    # upload: Upload; giải nén và giải mã diễn ra dần trong lúc parse nên được tính vào giai đoạn parse
+    with stage('parse'), upload.text() as lines:
+        sites, cells, errors = parse_coverage_csv(lines, progress)
+    record_parse_errors(stats, errors)
+    with stage('aggregate'):
+        site_cell_counts, site_has_ibc = site_cell_stats(sites, cells)
+    return render_coverage_kmz(sites, cells, site_cell_counts, site_has_ibc, params, progress, stats)
+
+def render_coverage_kmz(sites, cells, site_cell_counts, site_has_ibc, params, progress=None, stats=None):
+    # site_cell_counts/site_has_ibc đánh chỉ số theo sites; với tập con của dataset chúng được tính trên toàn dataset
+    incremental, tiling, compact, compresslevel = params
+    with stage('aggregate'):
+        check_cell_classes(cells)
+    spans = None
+    if tiling:
+        with stage('aggregate'):
+            tree, cells, spans = tile_coverage(sites, cells, *tiling, RENDER_CHUNK_SIZE)
+    if incremental:
+        with stage('aggregate'):
+            keys = cell_fragment_keys(cells, sites, site_cell_counts, site_has_ibc, compact)
+        with stage('fragment_cache'):
+            cached_keys = fragment_cache.existing(keys)
+        reused = sum(1 for key in keys if key in cached_keys)
+        if stats is not None:
+            stats['cells_reused'] = reused
+            stats['cells_rendered'] = len(cells) - reused
+        cell_fragments = iter_incremental_cells(cells, sites, site_cell_counts, site_has_ibc, keys, progress, spans,
+                                                compact)
+    else:
+        cell_fragments = iter_rendered_cells(cells, sites, site_cell_counts, site_has_ibc, progress=progress, spans=spans,
+                                             compact=compact)
+    cell_fragments = timed_iter('render', cell_fragments)
+    if tiling:
+        return iter_tiled_coverage_kmz(sites, tree, cell_fragments, compact, compresslevel)
+    return iter_kmz(iter_coverage_kml(sites, cells, cell_fragments=cell_fragments, compact=compact),
+                    compresslevel=compresslevel)
+
+def build_points_kmz(upload, params, progress=None, stats=None):
+    with stage('parse'), upload.text() as lines:
+        sites, errors = parse_points_csv(lines, progress)
+    record_parse_errors(stats, errors)
+    return render_points_kmz(sites, params)
+
+def render_points_kmz(sites, params):
+    color, size, icon, tiling, compact, compresslevel = params
+    if tiling:
+        return iter_tiled_points_kmz(sites, color, size, icon, *tiling, compact, compresslevel)
+    return iter_kmz(iter_points_kml(sites, color, size, icon, compact), compresslevel=compresslevel)
+
+def build_clf(upload, params, progress=None, stats=None):
+    # Kết quả stream theo từng dòng nên số dòng/lỗi chỉ có sau khi chuyển đổi xong (ghi vào stats của job và metrics)
+    errors = ParseErrors()
+    with stage('convert'):
+        chunks = iter_clf(upload, progress, errors)
+
+    def iter_chunks():
+        yield from timed_iter('convert', chunks)
+        record_parse_errors(stats, errors)
+    return iter_chunks()
+
+# Chuyển đổi CLF hàng loạt: mỗi CSV (có thể nén) được chuyển thành một file .clf trong process riêng rồi nén chung một zip
+# CLF_BATCH_WORKERS <= 1: chuyển đổi lần lượt ngay trong request; ngược lại dùng process pool chung (worker_pool)
+CLF_BATCH_WORKERS = int(os.environ.get('CLF_BATCH_WORKERS', RENDER_WORKERS))
+CLF_BATCH_MAX_FILES = int(os.environ.get('CLF_BATCH_MAX_FILES', 64))
+CLF_INPUT_EXTENSIONS = ('.gz', '.zst', '.zip', '.csv')
+
+def clf_entry_names(filenames):
+    # network.csv.gz -> network.clf; tên trùng được thêm hậu tố _2, _3...
+    names = []
+    for k, filename in enumerate(filenames, 1):
+        stem = secure_filename(filename or '')
+        for ext in CLF_INPUT_EXTENSIONS:
+            if stem.lower().endswith(ext):
+                stem = stem[:-len(ext)]
+        stem = stem or f'file_{k}'
+        name, n = f'{stem}.clf', 1
+        while name in names:
+            n += 1
+            name = f'{stem}_{n}.clf'
+        names.append(name)
+    return names
+
+def iter_file_chunks(path, chunk_size=KMZ_STREAM_CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        yield from iter(lambda: f.read(chunk_size), b'')
+
+def build_clf_batch(inputs, scratch_dir, stats, compresslevel=None):
+    # inputs: các cặp (tên file .clf, đường dẫn upload); chuyển đổi xong hết rồi mới stream zip,
+    # nên lỗi của một file vẫn trả được mã lỗi và số dòng có trong header
+    outputs = [os.path.join(scratch_dir, f'{k}.clf') for k in range(len(inputs))]
+    workers = min(CLF_BATCH_WORKERS, len(inputs))
+    with stage('convert'):
+        if workers <= 1:
+            results = [partial(convert_clf_file, src, dst, UPLOAD_MAX_DECOMPRESSED_BYTES)
+                       for (_, src), dst in zip(inputs, outputs)]
+            all_errors = collect_clf_batch(inputs, results)
+        else:
+            pool = worker_pool()
+            futures = [pool.submit(convert_clf_file, src, dst, UPLOAD_MAX_DECOMPRESSED_BYTES)
+                       for (_, src), dst in zip(inputs, outputs)]
+            try:
+                all_errors = collect_clf_batch(inputs, [future.result for future in futures])
+            except BrokenProcessPool:
+                discard_worker_pool(pool)
+                raise
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    stats['files'] = len(inputs)
+    stats['rows'] = sum(errors.rows for errors in all_errors)
+    stats['rows_skipped'] = sum(errors.count for errors in all_errors)
+    stats['parse_errors'] = [dict(sample, file=name) for (name, _), errors in zip(inputs, all_errors)
+                             for sample in errors.samples]
+    return iter_zip_entries(((name, iter_file_chunks(path)) for (name, _), path in zip(inputs, outputs)), compresslevel)
+
+def collect_clf_batch(inputs, results):
+    # results: hàm trả kết quả của từng file (future.result hoặc lời gọi trực tiếp); lỗi được gắn tên file
+    all_errors = []
+    for (name, _), result in zip(inputs, results):
+        try:
+            all_errors.append(result())
+        except UploadTooLarge as e:
+            raise UploadTooLarge(f"{name}: {e}") from e
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}") from e
+    return all_errors
+
+# Xuất nhiều loại kết quả từ một upload: CSV parse một lần (read_many), các kết quả sinh song song từ bảng đã parse.
+# Dùng thread: phần nặng (render cell, deflate) chạy trong process pool hoặc zlib, không giữ GIL
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 3))
+
+def export_coverage(parsed, params, stats):
+    sites, cells, errors = parsed
+    record_parse_errors(stats, errors)
+    if not len(sites) or not len(cells):
+        raise ValueError("No valid data to create KML.")
+    with stage('aggregate'):
+        site_cell_counts, site_has_ibc = site_cell_stats(sites, cells)
+    return render_coverage_kmz(sites, cells, site_cell_counts, site_has_ibc, params, stats=stats)
+
+def export_points(parsed, params, stats):
+    sites, errors = parsed
+    record_parse_errors(stats, errors)
+    if not len(sites):
+        raise ValueError("No valid data to create KML.")
+    return render_points_kmz(sites, params)
+
+def export_clf(parsed, params, stats):
+    clf_lines, errors = parsed
+    record_parse_errors(stats, errors)
+    if not clf_lines:
+        raise ValueError("No valid data to convert to CLF.")
+    return timed_iter('convert', iter_clf_chunks(clf_lines))
+
+def _write_export_file(export, parsed, params, path, stats):
+    # Chạy trong thread riêng nên dùng Timings riêng; trả về để cộng vào timings của request
+    timings = Timings()
+    with activate(timings), open(path, 'wb') as out:
+        for chunk in export(parsed, params, stats):
+            out.write(chunk)
+    return timings
+
+def build_export(upload, params, progress=None, stats=None):
+    # Kết quả là zip gồm manifest.json và file của từng loại; loại nào lỗi (vd. không có dòng hợp lệ) được ghi
+    # vào manifest thay vì làm hỏng cả lần xuất. Thiếu cột bắt buộc (hợp các loại) vẫn là lỗi của cả request.
+    artifacts, compresslevel = params
+    with stage('parse'), upload.text() as lines:
+        parsed = read_many(lines, {kind: EXPORT_ARTIFACTS[kind][:2] for kind, _ in artifacts},
+                           progress, PROGRESS_INTERVAL)
+    scratch_dir = tempfile.mkdtemp(prefix='export-')
     try:
-        site_id = row['SITEID']
-        lat = float(row['LAT'])
-        lon = float(row['LONG'])
-        note = row['NOTE']
-        if site_id not in sites_set:
-            sites_set.add(site_id)
-            return {'site_id': site_id, 'lat': lat, 'lon': lon, 'note': note}
-    except ValueError:
+        entries = render_export_files(artifacts, parsed, scratch_dir, stats)
+    except BaseException:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        raise
+    stored = [EXPORT_ARTIFACTS[kind][4] for kind, _ in artifacts if EXPORT_ARTIFACTS[kind][4].endswith('.kmz')]
+    return _iter_export_zip(entries, scratch_dir, compresslevel, stored)
+
+def render_export_files(artifacts, parsed, scratch_dir, stats):
+    outputs = [os.path.join(scratch_dir, f'{k}.out') for k in range(len(artifacts))]
+    artifact_stats = [{} for _ in artifacts]
+    with ThreadPoolExecutor(max_workers=max(min(EXPORT_WORKERS, len(artifacts)), 1)) as executor:
+        futures = [executor.submit(_write_export_file, EXPORT_ARTIFACTS[kind][3], parsed[kind], kind_params, path,
+                                   kind_stats)
+                   for (kind, kind_params), path, kind_stats in zip(artifacts, outputs, artifact_stats)]
+    outer_timings = current_timings()
+    manifest, entries = [], []
+    for (kind, _), path, kind_stats, future in zip(artifacts, outputs, artifact_stats, futures):
+        filename = EXPORT_ARTIFACTS[kind][4]
+        try:
+            timings = future.result()
+        except ValueError as e:
+            manifest.append(dict(kind_stats, artifact=kind, file=None, error=str(e)))
+            continue
+        if outer_timings is not None:
+            for name, seconds in timings.durations.items():
+                outer_timings.add(name, seconds)
+        manifest.append(dict(kind_stats, artifact=kind, file=filename, error=None))
+        entries.append((filename, iter_file_chunks(path)))
+    if not entries:
+        raise ValueError('; '.join(f"{item['artifact']}: {item['error']}" for item in manifest))
+
+    # rows giống nhau ở mọi loại (một lượt đọc); rows_skipped là tổng số dòng bỏ qua của các loại
+    if stats is not None:
+        stats['files'] = len(entries)
+        stats['rows'] = manifest[0].get('rows', 0)
+        stats['rows_skipped'] = sum(item.get('rows_skipped', 0) for item in manifest)
+    document = json.dumps({'rows': manifest[0].get('rows', 0), 'artifacts': manifest}, indent=2)
+    return [('manifest.json', [document.encode('utf-8')])] + entries
+
+def _iter_export_zip(entries, scratch_dir, compresslevel, stored):
+    # KMZ được ghi nguyên (stored) nên zip ngoài được dựng trong scratch_dir (xem write_zip_file) rồi mới stream
+    try:
+        path = os.path.join(scratch_dir, 'export.zip')
+        write_zip_file(path, entries, compresslevel, stored)
+        yield from iter_file_chunks(path)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def no_params(form):
+    return ()
+
+def form_flag(form, name):
+    return form.get(name, '').lower() in ('1', 'true', 'yes', 'on')
+
+def tiling_params(form):
+    # None: một doc.kml; tiled=1: (độ sâu tối đa của cây tile 0-16, số feature tối đa mỗi tile lá)
+    if not form_flag(form, 'tiled'):
         return None
+    depth = int(form.get('tile_depth', TILE_MAX_DEPTH))
+    max_features = int(form.get('tile_max_features', TILE_MAX_FEATURES))
+    if not 0 <= depth <= 16:
+        raise ValueError("tile_depth must be between 0 and 16")
+    if max_features < 1:
+        raise ValueError("tile_max_features must be at least 1")
+    return (depth, max_features)
 
-def create_points_kml(csv_content, color, size, icon):
-    sites = []
-    sites_set = set()
-    required_columns = {'SITEID', 'LAT', 'LONG', 'NOTE'}
+def compact_params(form):
+    # None: định dạng KML gốc; compact=1: (số chữ số thập phân của toạ độ, độ dài đoạn tối đa của cung theo độ)
+    if not form_flag(form, 'compact'):
+        return None
+    precision = int(form.get('precision', COMPACT_PRECISION))
+    max_segment = float(form.get('max_segment', COMPACT_MAX_SEGMENT))
+    if not 0 <= precision <= 10:
+        raise ValueError("precision must be between 0 and 10")
+    if not max_segment > 0:
+        raise ValueError("max_segment must be positive")
+    return (precision, max_segment)
 
-    with io.StringIO(csv_content) as f:
-        reader = csv.DictReader(f)
-        if not required_columns.issubset(reader.fieldnames):
-            raise ValueError(f"Missing required columns: {required_columns - set(reader.fieldnames)}")
+def compression_params(form):
+    # Mức nén zip 0-9 (compression_level), mặc định của zlib khi không truyền
+    level = form.get('compression_level')
+    if not level:
+        return None
+    level = int(level)
+    if not 0 <= level <= 9:
+        raise ValueError("compression_level must be between 0 and 9")
+    return level
 
-        with ThreadPoolExecutor() as executor:
-            for site in executor.map(lambda row: process_site(row, sites_set), reader):
-                if site:
-                    sites.append(site)
+def coverage_params(form):
+    return (form_flag(form, 'incremental'), tiling_params(form), compact_params(form), compression_params(form))
 
-    if not sites:
-        raise ValueError("No valid data to create KML.")
+def points_params(form):
+    return (form.get('color', 'ff00ff00'), form.get('size', '1.0'), form.get('icon', 'placemark_circle'),
+            tiling_params(form), compact_params(form), compression_params(form))
 
-    kml_lines = [
-        '<?xml version="1.0" encoding="UTF-8"?>\n',
-        '<kml xmlns="http://www.opengis.net/kml/2.2">\n',
-        '<Document>\n',
-        f'<name>Network_Sites_{datetime.now().strftime("%Y%m%d_%H%M")}</name>\n',
-        f'<Style id="customStyle">\n<IconStyle>\n<color>{color}</color>\n<scale>{size}</scale>\n',
-        f'<Icon><href>http://maps.google.com/mapfiles/kml/shapes/{icon}.png</href></Icon>\n',
-        '</IconStyle>\n</Style>\n',
-        '<Folder>\n<name>Sites</name>\n<visibility>0</visibility>\n'
-    ]
-
-    for site in sites:
-        kml_lines.append(f'<Placemark>\n<name>{site["site_id"]}</name>\n')
-        kml_lines.append('<Snippet maxLines="0"></Snippet>\n')
-        kml_lines.append('<description><![CDATA[\n')
-        kml_lines.append(f'<h3>Thông tin Site</h3>\n')
-        kml_lines.append(f'<p><b>SiteID:</b> {site["site_id"]}</p>\n')
-        kml_lines.append(f'<p><b>Latitude:</b> {site["lat"]}</p>\n')
-        kml_lines.append(f'<p><b>Longitude:</b> {site["lon"]}</p>\n')
-        kml_lines.append(']]></description>\n')
-        kml_lines.append('<styleUrl>#customStyle</styleUrl>\n')
-        kml_lines.append(f'<Point>\n<coordinates>{site["lon"]},{site["lat"]},0</coordinates>\n</Point>\n')
-        kml_lines.append('</Placemark>\n')
+# loại -> (cột bắt buộc, hàm dựng collector, hàm đọc tham số, hàm sinh kết quả từ bảng đã parse, tên file trong zip)
+EXPORT_ARTIFACTS = {
+    'coverage-kmz': (COVERAGE_COLUMNS, partial(network_collector, check_cell=check_cell_class), coverage_params,
+                     export_coverage, 'Network_Coverage.kmz'),
+    'points-kmz': (POINTS_COLUMNS, points_collector, points_params, export_points, 'Network_Sites.kmz'),
+    'convert-clf': (CLF_COLUMNS, clf_collector, no_params, export_clf, 'Network.clf'),
+}
 
-    kml_lines.append('</Folder>\n')
-    kml_lines.append('</Document>\n</kml>\n')
-    return ''.join(kml_lines)
+def export_params(form):
+    # artifacts=coverage-kmz,points-kmz,convert-clf (mặc định: tất cả); tham số của từng loại đọc từ cùng form,
+    # compression_level áp dụng cho cả KMZ bên trong lẫn zip ngoài
+    kinds = []
+    for kind in (form.get('artifacts') or ','.join(EXPORT_ARTIFACTS)).split(','):
+        kind = kind.strip()
+        if kind and kind not in kinds:
+            if kind not in EXPORT_ARTIFACTS:
+                raise ValueError(f"Unknown artifact: {kind}")
+            kinds.append(kind)
+    if not kinds:
+        raise ValueError("No artifacts requested")
+    return (tuple((kind, EXPORT_ARTIFACTS[kind][2](form)) for kind in kinds), compression_params(form))
 
-# Logic Convert CLF từ mã gốc
-def convert_csv_to_clf(csv_content):
-    required_columns = {'MCCMNC', 'CELLID', 'LAC', 'TYPE', 'LAT', 'LONG', 'POS-RAT', 
-                        'DESC', 'SYSCLF', 'CELLNAME', 'AZIMUTH', 'ANT_HEIGHT', 'HBW', 
-                        'VBW', 'TILT', 'SITEID'}
-    
-    with io.StringIO(csv_content) as f:
-        reader = csv.DictReader(f)
-        if not required_columns.issubset(reader.fieldnames):
-            raise ValueError(f"Missing required columns: {required_columns - set(reader.fieldnames)}")
-        
-        clf_lines = []
-        for i, row in enumerate(reader, 1):
+# kind -> (hàm sinh kết quả, hàm đọc tham số từ form, mimetype, mẫu tên file tải về)
+ARTIFACTS = {
+    'coverage-kmz': (build_coverage_kmz, coverage_params, KMZ_MIMETYPE, 'Network_Coverage_{now}.kmz'),
+    'points-kmz': (build_points_kmz, points_params, KMZ_MIMETYPE, 'Network_Sites_{now}.kmz'),
+    'convert-clf': (build_clf, no_params, 'text/plain', 'x *.clf'),
+    'export': (build_export, export_params, 'application/zip', 'Network_Export_{now}.zip'),
+}
+
+def instrumented(kind, build, timings, profile_path=None):
+    # Bọc hàm build: đo thời gian từng giai đoạn, khi sinh xong kết quả thì ghi số liệu (và file profile nếu có)
+    def run(upload, params, progress=None, stats=None):
+        stats = {} if stats is None else stats
+        with activate(timings):
+            chunks = build(upload, params, progress, stats)
+        return iter_recorded(kind, timings, chunks, stats, profile_path)
+    return run
+
+def iter_recorded(kind, timings, chunks, stats, profile_path):
+    size = 0
+    try:
+        for chunk in iter_activated(timings, chunks):
+            size += len(chunk)
+            yield chunk
+    finally:
+        for name, seconds in timings.durations.items():
+            metrics.observe('stage_duration_seconds', seconds, kind=kind, stage=name)
+        if 'rows' in stats:
+            metrics.observe('input_rows', stats['rows'], kind=kind)
+        metrics.inc('rows_skipped_total', stats.get('rows_skipped', 0), kind=kind)
+        metrics.inc('output_bytes_total', size, kind=kind)
+        metrics.flush()
+        if profile_path:
+            timings.profiler.dump_stats(profile_path)
+
+def request_timings(kind):
+    # profile=1 (form hoặc query) chỉ có tác dụng khi PROFILE_DIR được đặt
+    if not PROFILE_DIR or not form_flag(request.values, 'profile'):
+        return Timings(), None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f'{kind}-{datetime.now().strftime("%Y%m%d_%H%M%S")}-{uuid.uuid4().hex[:8]}.prof'
+    return Timings(cProfile.Profile()), os.path.join(PROFILE_DIR, name)
+
+def artifact_download_name(kind):
+    return ARTIFACTS[kind][3].format(now=datetime.now().strftime('%Y%m%d_%H%M'))
+
+def timed_response(response, timings, profile_path):
+    # Response dạng luồng: header chỉ chứa các giai đoạn đã xong trước khi gửi byte đầu tiên
+    response.headers['Server-Timing'] = timings.server_timing()
+    response.headers['Timing-Allow-Origin'] = '*'
+    if profile_path:
+        response.headers['X-Profile'] = os.path.basename(profile_path)
+    return response
+
+def request_files():
+    # Werkzeug báo RequestEntityTooLarge khi request vượt MAX_CONTENT_LENGTH; đổi thành UploadTooLarge (413)
+    try:
+        return request.files
+    except RequestEntityTooLarge:
+        raise UploadTooLarge(f"Request exceeds {UPLOAD_MAX_BYTES} bytes") from None
+
+def error_status(e):
+    # Lỗi phía client (upload quá lớn, truy vấn dataset sai) có mã riêng; còn lại giữ 500 như trước
+    if isinstance(e, UploadTooLarge):
+        return 413
+    if isinstance(e, DatasetQueryError):
+        return e.status
+    return 500
+
+def read_upload():
+    # Upload là trường file của form multipart, hoặc cả body request (CSV thô hoặc nén gzip/zstd/zip).
+    # Không đọc hết vào bộ nhớ: Upload chỉ giữ file tạm (seek được) và digest tính dần theo từng khối.
+    files = request_files()
+    if 'file' in files:
+        return Upload(files['file'].stream, UPLOAD_MAX_DECOMPRESSED_BYTES)
+    if request.mimetype in RAW_UPLOAD_MIMETYPES:
+        try:
+            upload = Upload.from_stream(request.stream, UPLOAD_SPOOL_MAX_BYTES, UPLOAD_MAX_DECOMPRESSED_BYTES)
+        except RequestEntityTooLarge:
+            raise UploadTooLarge(f"Request exceeds {UPLOAD_MAX_BYTES} bytes") from None
+        if upload.size:
+            return upload
+        upload.close()
+    return None
+
+def artifact_response(kind):
+    try:
+        build, read_params, mimetype, _ = ARTIFACTS[kind]
+        timings, profile_path = request_timings(kind)
+        with activate(timings), stage('upload'):
+            upload = read_upload()
+        if upload is None:
+            return jsonify({"error": "No file uploaded"}), 400
+        # request.values: tham số lấy từ form hoặc query string (khi upload là body thô)
+        params = read_params(request.values)
+        run = instrumented(kind, build, timings, profile_path)
+
+        response = cached_response(kind, upload.digest, params, lambda stats: run(upload, params, stats=stats),
+                                   mimetype, artifact_download_name(kind))
+        response.call_on_close(upload.close)
+        return timed_response(response, timings, profile_path)
+    except Exception as e:
+        metrics.inc('requests_total', kind=kind, cache='error')
+        metrics.flush()
+        return jsonify({"error": str(e)}), error_status(e)
+
+# Dataset lưu lâu dài: chỉ tập cell khớp bộ lọc đi qua logic render như upload thường
+def prepare_dataset(tables):
+    # Tham số cell và cột dùng để lọc tính một lần cho cả dataset, dùng chung cho mọi truy vấn và tile
+    sites, cells = tables
+    site_cell_counts, site_has_ibc = site_cell_stats(sites, cells)
+    techs, freqs, radius, beamwidths, layers = cell_params(cells, site_cell_counts, site_has_ibc)
+    return {'sites': sites, 'cells': cells, 'site_cell_counts': site_cell_counts, 'site_has_ibc': site_has_ibc,
+            'techs': techs, 'freqs': freqs, 'radius': radius, 'beamwidths': beamwidths, 'layers': layers,
+            'tech_array': np.array(techs, dtype=str), 'freq_array': np.array(freqs, dtype=str),
+            'province_array': np.array([str(p) for p in sites.province], dtype=str),
+            'cell_lon': sites.lon[cells.site], 'cell_lat': sites.lat[cells.site], 'max_radius': float(radius.max())}
+
+def dataset_info(source, errors):
+    # Mô tả dataset, kèm các giá trị có thể dùng cho từng bộ lọc
+    sites, cells = source['sites'], source['cells']
+    return {
+        'rows': errors.rows, 'rows_skipped': errors.count, 'parse_errors': errors.samples,
+        'sites': len(sites), 'cells': len(cells), 'clf': cells.clf is not None,
+        'bbox': [float(sites.lon.min()), float(sites.lat.min()), float(sites.lon.max()), float(sites.lat.max())],
+        'values': {
+            'province': sorted(set(source['province_array'].tolist())),
+            'tech': sorted(set(source['techs'])),
+            'frequency': sorted(set(source['freqs'])),
+            'layer': sorted(set(source['layers'].tolist())),
+            'plt': sorted(set(cells.plt.tolist())),
+            'vendor': sorted({str(vendor) for vendor in cells.vendors}),
+        },
+    }
+
+class DatasetQueryError(ValueError):
+    # Truy vấn dataset sai (400) hoặc không có cell nào khớp (404)
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+# Bộ lọc -> hàm (dataset, các giá trị) trả về mặt nạ cell; giá trị trong một bộ lọc là OR, giữa các bộ lọc là AND
+DATASET_FILTERS = {
+    'province': lambda source, values: np.isin(source['province_array'], values)[source['cells'].site],
+    'tech': lambda source, values: np.isin(source['tech_array'], values),
+    'frequency': lambda source, values: np.isin(source['freq_array'], values),
+    'layer': lambda source, values: np.isin(source['layers'], values),
+    'plt': lambda source, values: np.isin(source['cells'].plt, values),
+    'vendor': lambda source, values: np.isin(source['cells'].vendor, [code for code, vendor in
+                                                                      enumerate(source['cells'].vendors)
+                                                                      if vendor in values]),
+}
+INT_FILTERS = ('layer', 'plt')
+
+def dataset_filters(form):
+    # bbox=west,south,east,north (toạ độ site); bộ lọc khác nhận danh sách cách nhau bởi dấu phẩy (vd. tech=4G,5G),
+    # tên bộ lọc viết thường hoặc viết hoa như cột CSV (PROVINCE)
+    filters = []
+    bbox = form.get('bbox')
+    if bbox:
+        try:
+            values = tuple(float(value) for value in bbox.split(','))
+        except ValueError:
+            values = ()
+        if len(values) != 4:
+            raise DatasetQueryError("bbox must be west,south,east,north")
+        filters.append(('bbox', values))
+    for name in DATASET_FILTERS:
+        value = form.get(name) or form.get(name.upper())
+        if not value:
+            continue
+        values = {item.strip() for item in value.split(',') if item.strip()}
+        if name in INT_FILTERS:
             try:
-                cell_id = row['CELLID']
-                if row['SYSCLF'] == '4':
-                    try:
-                        eNodeB_id, cid = map(int, cell_id.split('-'))
-                        cell_id = (eNodeB_id * 256) + cid
-                    except (ValueError, AttributeError):
-                        pass
-                line = (
-                    f"{row['MCCMNC']};{cell_id};{row['LAC']};{row['TYPE']};{row['LAT']};{row['LONG']};"
-                    f"{row['POS-RAT']};{row['DESC']};{row['SYSCLF']};{row['CELLNAME']};{row['AZIMUTH']};"
-                    f"{row['ANT_HEIGHT']};{row['HBW']};{row['VBW']};{row['TILT']};{row['SITEID']}"
-                )
-                clf_lines.append(line)
-            except Exception:
-                continue
-        
-        if not clf_lines:
-            raise ValueError("No valid data to convert to CLF.")
-        return '\n'.join(clf_lines)
+                values = {int(item) for item in values}
+            except ValueError:
+                raise DatasetQueryError(f"{name} must be a comma separated list of integers") from None
+        filters.append((name, tuple(sorted(values))))
+    return tuple(filters)
+
+def select_dataset(source, filters):
+    # Tập con khớp bộ lọc: (sites, cells, site_cell_counts, site_has_ibc), chỉ số site của cell được đánh lại;
+    # số cell/cờ IBC của site lấy từ toàn dataset để bán kính vẽ giống hệt khi render cả mạng
+    sites, cells = source['sites'], source['cells']
+    mask = np.ones(len(cells), dtype=bool)
+    for name, values in filters:
+        if name == 'bbox':
+            west, south, east, north = values
+            lon, lat = source['cell_lon'], source['cell_lat']
+            mask &= (lon >= west) & (lon <= east) & (lat >= south) & (lat <= north)
+        else:
+            mask &= DATASET_FILTERS[name](source, list(values))
+    idx = np.flatnonzero(mask)
+    if not len(idx):
+        raise DatasetQueryError("No cells match the filters.", 404)
+    used = np.unique(cells.site[idx])
+    site_index = np.full(len(sites), -1, dtype=np.int32)
+    site_index[used] = np.arange(len(used), dtype=np.int32)
+    subset = cells.take(idx)
+    subset.site = site_index[subset.site]
+    return sites.take(used), subset, source['site_cell_counts'][used], source['site_has_ibc'][used]
+
+def record_selection(stats, sites, cells):
+    if stats is not None:
+        stats['sites'] = len(sites)
+        stats['cells'] = len(cells)
+
+def build_dataset_coverage_kmz(source, params, progress=None, stats=None):
+    with stage('select'):
+        sites, cells, site_cell_counts, site_has_ibc = select_dataset(source, params[0])
+    record_selection(stats, sites, cells)
+    return render_coverage_kmz(sites, cells, site_cell_counts, site_has_ibc, params[1:], progress, stats)
+
+def build_dataset_points_kmz(source, params, progress=None, stats=None):
+    with stage('select'):
+        sites, cells, _, _ = select_dataset(source, params[0])
+    record_selection(stats, sites, cells)
+    return render_points_kmz(sites, params[1:])
+
+def build_dataset_clf(source, params, progress=None, stats=None):
+    if source['cells'].clf is None:
+        raise ValueError("Dataset has no CLF data (upload is missing CLF columns).")
+    with stage('select'):
+        sites, cells, _, _ = select_dataset(source, params[0])
+        clf_lines = [line for line in cells.clf if line is not None]
+    if not clf_lines:
+        raise ValueError("No valid data to convert to CLF.")
+    record_selection(stats, sites, cells)
+    return timed_iter('convert', iter_clf_chunks(clf_lines))
+
+def filtered(read_params):
+    return lambda form: (dataset_filters(form),) + read_params(form)
+
+# artifact -> (hàm sinh kết quả từ dataset, hàm đọc tham số, mimetype, mẫu tên file tải về)
+DATASET_ARTIFACTS = {
+    'coverage-kmz': (build_dataset_coverage_kmz, filtered(coverage_params), KMZ_MIMETYPE, 'Network_Coverage_{now}.kmz'),
+    'points-kmz': (build_dataset_points_kmz, filtered(points_params), KMZ_MIMETYPE, 'Network_Sites_{now}.kmz'),
+    'clf': (build_dataset_clf, filtered(no_params), 'text/plain', 'x *.clf'),
+}
+
+# Vector tile (MVT): polygon sector/hình tròn dùng chung logic hình học với KML, đơn giản hoá theo zoom
+MVT_VERSION = '1'
+MVT_LAYERS = ('coverage', 'sites')
+MVT_MAX_ZOOM = 22
+# Kích thước hiển thị của tile (pixel): cell nhỏ hơn MVT_MIN_FEATURE_PIXELS bị bỏ ở zoom đó,
+# mỗi đoạn cung dài tối đa MVT_MAX_SEGMENT_PIXELS; site trùng pixel chỉ giữ site đầu tiên
+MVT_TILE_PIXELS = 256
+MVT_MIN_FEATURE_PIXELS = 1.0
+MVT_MAX_SEGMENT_PIXELS = 2.0
+MVT_MIMETYPE = 'application/vnd.mapbox-vector-tile'
+
+def coverage_tile_layer(source, z, x, y):
+    west, south, east, north = tile_bounds(z, x, y)
+    pixel = (east - west) / MVT_TILE_PIXELS
+    margin = source['max_radius'] + (east - west) * BUFFER / EXTENT
+    radius, cell_lon, cell_lat = source['radius'], source['cell_lon'], source['cell_lat']
+    idx = np.flatnonzero((cell_lon >= west - margin) & (cell_lon <= east + margin) & (cell_lat >= south - margin)
+                         & (cell_lat <= north + margin) & (radius >= pixel * MVT_MIN_FEATURE_PIXELS))
+    layer = LayerBuilder('coverage')
+    if not len(idx):
+        return layer
+
+    cells = source['cells'].take(idx)
+    beamwidths = source['beamwidths'][idx]
+    steps = polygon_steps(radius[idx], beamwidths, cells.type == 0, pixel * MVT_MAX_SEGMENT_PIXELS)
+    rings = [None] * len(idx)
+    for group, xs, ys in cell_vertices(cells, source['sites'], radius[idx], beamwidths, steps):
+        px, py = project(xs, ys, z, x, y)
+        for k, row_x, row_y in zip(group.tolist(), px, py):
+            rings[k] = tile_ring(row_x, row_y)
+
+    techs, freqs, layers = source['techs'], source['freqs'], source['layers']
+    for k, (i, ring, cell) in enumerate(zip(idx.tolist(), rings, cells.rows())):
+        if ring is None:
+            continue
+        layer.add_polygon(ring, {'name': cell.cell_name, 'tech': techs[i], 'freq': freqs[i], 'layer': int(layers[i]),
+                                 'plt': cell.plt, 'vendor': cell.vendor, 'type': cell.type}, feature_id=i)
+    return layer
+
+def sites_tile_layer(source, z, x, y):
+    sites = source['sites']
+    west, south, east, north = tile_bounds(z, x, y)
+    margin = (east - west) * BUFFER / EXTENT
+    idx = np.flatnonzero((sites.lon >= west - margin) & (sites.lon <= east + margin)
+                         & (sites.lat >= south - margin) & (sites.lat <= north + margin))
+    layer = LayerBuilder('sites')
+    if not len(idx):
+        return layer
+
+    px, py = project(sites.lon[idx], sites.lat[idx], z, x, y)
+    px, py = np.rint(px).astype(np.int64), np.rint(py).astype(np.int64)
+    pixel = EXTENT // MVT_TILE_PIXELS
+    _, first = np.unique(np.stack([px // pixel, py // pixel]), axis=1, return_index=True)
+    for k in np.sort(first).tolist():
+        i = int(idx[k])
+        layer.add_point((int(px[k]), int(py[k])), {'name': sites.ids[i], 'plt': int(sites.plt[i]),
+                                                   'province': sites.province[i], 'desc': sites.desc[i],
+                                                   'vendor': sites.vendor[i]}, feature_id=i)
+    return layer
+
+TILE_LAYER_BUILDERS = {'coverage': coverage_tile_layer, 'sites': sites_tile_layer}
+
+def build_vector_tile(source, layer, z, x, y):
+    with stage('render'):
+        tile_layer = TILE_LAYER_BUILDERS[layer](source, z, x, y)
+    with stage('format'):
+        return encode_tile([tile_layer])
 
 # API Endpoints
 @app.route('/coverage-kmz', methods=['POST'])
 def coverage_kmz():
+    return artifact_response('coverage-kmz')
+
+@app.route('/points-kmz', methods=['POST'])
+def points_kmz():
+    return artifact_response('points-kmz')
+
+@app.route('/convert-clf', methods=['POST'])
+def convert_clf():
+    return artifact_response('convert-clf')
+
+@app.route('/export', methods=['POST'])
+def export():
+    return artifact_response('export')
+
+@app.route('/convert-clf/batch', methods=['POST'])
+def convert_clf_batch():
+    # Nhiều trường 'file' trong một form multipart -> một zip gồm các file .clf cùng tên
+    kind = 'convert-clf-batch'
+    scratch_dir = None
     try:
-        if 'file' not in request.files:
+        files = [storage for storage in request_files().getlist('file') if storage.filename]
+        if not files:
             return jsonify({"error": "No file uploaded"}), 400
-        file = request.files['file']
-        csv_content = file.read().decode('utf-8-sig')
-        
-        kml_content = create_coverage_kml(csv_content)
-        
-        output_kmz = io.BytesIO()
-        with zipfile.ZipFile(output_kmz.kmz, 'w', zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr("doc.kml", kml_content)
-        output_kmz.seek(0)
-        
-        return send_file(
-            output_kmz,
-            mimetype='application/vnd.google-earth.kmz',
-            download_name=f"Network_Coverage_{datetime.now().strftime('%Y%m%d_%H%M')}.kmz",
-            as_attachment=True
-        )
+        if len(files) > CLF_BATCH_MAX_FILES:
+            return jsonify({"error": f"Too many files (limit {CLF_BATCH_MAX_FILES})"}), 400
+        timings, profile_path = request_timings(kind)
+        compresslevel = compression_params(request.values)
+        scratch_dir = tempfile.mkdtemp(prefix='clf-batch-')
+        inputs = []
+        digest = hashlib.sha256()
+        with activate(timings), stage('upload'):
+            for name, storage in zip(clf_entry_names([storage.filename for storage in files]), files):
+                upload = Upload(storage.stream, UPLOAD_MAX_DECOMPRESSED_BYTES)
+                path = os.path.join(scratch_dir, f'{len(inputs)}.upload')
+                storage.save(path)
+                inputs.append((name, path))
+                digest.update(f'{name}\0{upload.digest}\0'.encode('utf-8'))
+
+        def build(stats):
+            with activate(timings):
+                chunks = build_clf_batch(inputs, scratch_dir, stats, compresslevel)
+            return iter_recorded(kind, timings, chunks, stats, profile_path)
+
+        response = cached_response(kind, digest.hexdigest(), (compresslevel,), build, 'application/zip',
+                                   f'Network_CLF_{datetime.now().strftime("%Y%m%d_%H%M")}.zip')
+        response.call_on_close(partial(shutil.rmtree, scratch_dir, ignore_errors=True))
+        return timed_response(response, timings, profile_path)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        if scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        metrics.inc('requests_total', kind=kind, cache='error')
+        metrics.flush()
+        return jsonify({"error": str(e)}), error_status(e)
 
-@app.route('/points-kmz', methods=['POST'])
-def points_kmz():
+@app.route('/jobs', methods=['POST'])
+def create_job():
     try:
-        if 'file' not in request.files:
+        kind = request.values.get('kind', 'coverage-kmz')
+        if kind not in ARTIFACTS:
+            return jsonify({"error": f"Unknown job kind: {kind}"}), 400
+        build, read_params, mimetype, _ = ARTIFACTS[kind]
+        upload = read_upload()
+        if upload is None:
             return jsonify({"error": "No file uploaded"}), 400
-        file = request.files['file']
-        csv_content = file.read().decode('utf-8-sig')
-        color = request.form.get('color', 'ff00ff00')
-        size = request.form.get('size', '1.0')
-        icon = request.form.get('icon', 'placemark_circle')
-        
-        kml_content = create_points_kml(csv_content, color, size, icon)
-        
-        output_kmz = io.BytesIO()
-        with zipfile.ZipFile(output_kmz.kmz, 'w', zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr("doc.kml", kml_content)
-        output_kmz.seek(0)
-        
-        return send_file(
-            output_kmz,
-            mimetype='application/vnd.google-earth.kmz',
-            download_name=f"Network_Sites_{datetime.now().strftime('%Y%m%d_%H%M')}.kmz",
-            as_attachment=True
-        )
+
+        try:
+            job_id = job_manager.submit(kind, upload, read_params(request.values),
+                                        instrumented(kind, build, Timings()), mimetype, artifact_download_name(kind))
+        finally:
+            upload.close()
+        return jsonify({
+            "job_id": job_id,
+            "status_url": url_for('job_status', job_id=job_id),
+            "result_url": url_for('job_result', job_id=job_id)
+        }), 202
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 429
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": str(e)}), error_status(e)
 
-@app.route('/convert-clf', methods=['POST'])
-def convert_clf():
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = job_manager.status(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    status = job_manager.status(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    if status['status'] == 'failed':
+        return jsonify(status), 500
+    if status['status'] != 'done':
+        return jsonify(status), 409
+    return send_file(
+        job_manager.result_path(job_id),
+        mimetype=status['mimetype'],
+        download_name=status['download_name'],
+        as_attachment=True
+    )
+
+@app.route('/datasets', methods=['POST'])
+@app.route('/tiles', methods=['POST'])
+def create_dataset():
+    # Parse upload coverage một lần và lưu lại; dataset này trở thành dataset mặc định của GET /tiles/...
     try:
-        if 'file' not in request.files:
+        upload = read_upload()
+        if upload is None:
             return jsonify({"error": "No file uploaded"}), 400
-        file = request.files['file']
-        csv_content = file.read().decode('utf-8-sig')
-        
-        clf_content = convert_csv_to_clf(csv_content)
-        
-        return send_file(
-            io.BytesIO(clf_content.encode('utf-8')),
-            mimetype='text/plain',
-            download_name=f"x *.clf",
-            as_attachment=True
-        )
+        try:
+            with upload.text() as lines:
+                sites, cells, errors = parse_coverage_csv(lines, keep_clf=True)
+        finally:
+            upload.close()
+        source = prepare_dataset((sites, cells))
+        info = dataset_info(source, errors)
+        info['tile_url'] = f'/tiles/{{layer}}/{{z}}/{{x}}/{{y}}.pbf?dataset={upload.digest}'
+        # Giữ sẵn bản đã prepare để truy vấn/tile đầu tiên ở worker này không phải nạp lại
+        return jsonify(dataset_store.save(upload.digest, (sites, cells), info, source)), 201
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": str(e)}), error_status(e)
+
+@app.route('/datasets/<dataset_id>', methods=['GET'])
+def get_dataset(dataset_id):
+    info = dataset_store.info(dataset_id)
+    if info is None:
+        return jsonify({"error": "Dataset not found"}), 404
+    return jsonify(info)
+
+@app.route('/datasets/<dataset_id>', methods=['DELETE'])
+def delete_dataset(dataset_id):
+    if not dataset_store.delete(dataset_id):
+        return jsonify({"error": "Dataset not found"}), 404
+    return jsonify({"dataset": dataset_id, "deleted": True})
+
+def dataset_response(dataset_id, artifact):
+    # Bộ lọc (bbox, province, tech, frequency, layer, plt, vendor) và tham số render lấy từ form hoặc query string
+    kind = 'dataset-' + artifact
+    try:
+        if dataset_store.info(dataset_id) is None:
+            return jsonify({"error": "Dataset not found"}), 404
+        build, read_params, mimetype, download_name = DATASET_ARTIFACTS[artifact]
+        timings, profile_path = request_timings(kind)
+        params = read_params(request.values)
+        run = instrumented(kind, build, timings, profile_path)
+
+        def build_selection(stats):
+            with activate(timings), stage('load'):
+                source = dataset_store.load(dataset_id, prepare_dataset)
+            if source is None:
+                raise DatasetQueryError("Dataset not found", 404)
+            return run(source, params, stats=stats)
+
+        response = cached_response(kind, dataset_id, params, build_selection, mimetype,
+                                   download_name.format(now=datetime.now().strftime('%Y%m%d_%H%M')))
+        return timed_response(response, timings, profile_path)
+    except Exception as e:
+        metrics.inc('requests_total', kind=kind, cache='error')
+        metrics.flush()
+        return jsonify({"error": str(e)}), error_status(e)
+
+@app.route('/datasets/<dataset_id>/coverage-kmz', methods=['GET', 'POST'])
+def dataset_coverage_kmz(dataset_id):
+    return dataset_response(dataset_id, 'coverage-kmz')
+
+@app.route('/datasets/<dataset_id>/points-kmz', methods=['GET', 'POST'])
+def dataset_points_kmz(dataset_id):
+    return dataset_response(dataset_id, 'points-kmz')
+
+@app.route('/datasets/<dataset_id>/clf', methods=['GET', 'POST'])
+def dataset_clf(dataset_id):
+    return dataset_response(dataset_id, 'clf')
+
+@app.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>.pbf', methods=['GET'])
+def vector_tile(layer, z, x, y):
+    # ?dataset=<id> chọn dataset cụ thể, mặc định là dataset nạp gần nhất
+    if layer not in MVT_LAYERS:
+        return jsonify({"error": f"Unknown layer: {layer}"}), 404
+    if not 0 <= z <= MVT_MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        return jsonify({"error": "Tile out of range"}), 404
+    dataset_id = request.args.get('dataset') or dataset_store.current()
+    if not dataset_id:
+        return jsonify({"error": "No dataset loaded"}), 404
+
+    etag = hashlib.sha256(f'{MVT_VERSION}/{classifier.fingerprint}/{dataset_id}/{layer}/{z}/{x}/{y}'.encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag):
+        metrics.inc('requests_total', kind='tile', cache='not_modified')
+        response = Response(status=304)
+    else:
+        timings = Timings()
+        with activate(timings):
+            key = (dataset_id, layer, z, x, y)
+            data = tile_cache.get(key)
+            if data is None:
+                with stage('load'):
+                    source = dataset_store.load(dataset_id, prepare_dataset)
+                if source is None:
+                    return jsonify({"error": "Dataset not found"}), 404
+                data = build_vector_tile(source, layer, z, x, y)
+                tile_cache.put(key, data)
+                metrics.inc('requests_total', kind='tile', cache='miss')
+            else:
+                metrics.inc('requests_total', kind='tile', cache='hit')
+        metrics.flush()
+        response = timed_response(Response(data, mimetype=MVT_MIMETYPE), timings, None)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
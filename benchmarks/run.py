@@ -0,0 +1,250 @@
+import argparse
+import gzip
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Bộ benchmark cho các hàm sinh kết quả và các endpoint Flask.
+# Chạy từ thư mục gốc repo:  python -m benchmarks.run --sizes 1000,10000,100000
+# Mỗi case chạy trong một tiến trình con riêng; peak RSS là đỉnh tổng RSS của tiến trình đó và các process render
+# (lấy mẫu trong lúc chạy case); CSV giả lập được sinh một lần
+# cho mỗi kích thước; số process render (--workers) cố định cho mọi case và được ghi trong kết quả. --save-baseline ghi kết quả làm mốc, các lần chạy sau so với mốc và báo hồi quy.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines.json')
+POINTS_ARGS = ('ff00ff00', '1.0', 'placemark_circle')
+
+def _coverage_kml(app, content):
+    return app.create_coverage_kml(content.decode('utf-8-sig')).encode('utf-8')
+
+def _points_kml(app, content):
+    return app.create_points_kml(content.decode('utf-8-sig'), *POINTS_ARGS).encode('utf-8')
+
+def _clf(app, content):
+    return app.convert_csv_to_clf(content.decode('utf-8-sig')).encode('utf-8')
+
+def _endpoint(path, compress=None, **form):
+    # compress: hàm nén upload trước khi gửi (vd. gzip.compress) để đo đường upload nén
+    def run(app, content):
+        if compress:
+            content = compress(content)
+        response = app.app.test_client().post(path, data={'file': (io.BytesIO(content), 'network.csv'), **form})
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response.get_data()
+    return run
+
+# tên case -> hàm(app, nội dung upload) trả về bytes kết quả
+CASES = {
+    'create_coverage_kml': _coverage_kml,
+    'create_points_kml': _points_kml,
+    'convert_csv_to_clf': _clf,
+    'POST /coverage-kmz': _endpoint('/coverage-kmz'),
+    'POST /points-kmz': _endpoint('/points-kmz'),
+    'POST /convert-clf': _endpoint('/convert-clf'),
+    'POST /coverage-kmz gz': _endpoint('/coverage-kmz', gzip.compress),
+    'POST /coverage-kmz cpt': _endpoint('/coverage-kmz', compact='1'),
+    'POST /export': _endpoint('/export'),
+}
+
+RSS_SAMPLE_INTERVAL = 0.01
+
+def _process_tree(root):
+    # root và mọi process con cháu của nó, theo ppid trong /proc/<pid>/stat
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Tên process (trường 2) có thể chứa dấu cách: ppid là trường thứ hai sau dấu ')' cuối cùng
+        children.setdefault(int(stat[stat.rindex(b')') + 2:].split()[1]), []).append(int(name))
+    tree = [root]
+    for pid in tree:
+        tree.extend(children.get(pid, ()))
+    return tree
+
+def _tree_rss_kb(root):
+    total = 0
+    for pid in _process_tree(root):
+        try:
+            with open(f'/proc/{pid}/status', encoding='ascii', errors='replace') as f:
+                total += next((int(line.split()[1]) for line in f if line.startswith('VmRSS:')), 0)
+        except OSError:
+            pass
+    return total
+
+class RssSampler:
+    # Lấy mẫu định kỳ tổng RSS (KB) của tiến trình này và các process con (process render của pool).
+    # ru_maxrss chỉ cho đỉnh của từng process riêng lẻ: RUSAGE_CHILDREN là process con lớn nhất đã thoát,
+    # không phải tổng các process chạy cùng lúc. Không có /proc (vd. macOS) thì không lấy mẫu được (peak_kb = 0)
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak_kb = 0
+        self._enabled = os.path.isdir('/proc/self')
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        if self._enabled:
+            self.peak_kb = max(self.peak_kb, _tree_rss_kb(os.getpid()))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+def peak_rss_mb(sampled_kb=0):
+    # Đỉnh tổng RSS đã lấy mẫu; đỉnh của từng process (ru_maxrss) là cận dưới, bắt được cả đỉnh ngắn giữa hai mẫu
+    # và là giá trị duy nhất có khi không lấy mẫu được
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux trả về KB, macOS trả về byte
+    peak = peak / 1024 if sys.platform == 'darwin' else peak
+    return max(peak, sampled_kb) / 1024
+
+def run_case(case, csv_path, rows):
+    # Chạy trong tiến trình con: cache kết quả/fragment trỏ vào thư mục tạm để luôn đo trường hợp miss,
+    # metrics và dataset cũng vậy để benchmark không ghi vào thư mục của server thật
+    scratch = tempfile.mkdtemp(prefix='bench-')
+    os.environ['RESULT_CACHE_DIR'] = os.path.join(scratch, 'results')
+    os.environ['JOBS_DIR'] = os.path.join(scratch, 'jobs')
+    os.environ['FRAGMENT_CACHE_PATH'] = os.path.join(scratch, 'fragments.sqlite3')
+    os.environ['METRICS_DIR'] = os.path.join(scratch, 'metrics')
+    os.environ['DATASET_DIR'] = os.path.join(scratch, 'datasets')
+    # spawn: process render là con trực tiếp của tiến trình này (không qua forkserver), RssSampler tính cả chúng
+    os.environ['RENDER_START_METHOD'] = 'spawn'
+    sys.path.insert(0, ROOT)
+    import app
+    import render
+
+    with open(csv_path, 'rb') as f:
+        content = f.read()
+    if app.RENDER_WORKERS > 1:
+        # Pool render được dùng lại giữa các request: tạo process (và import render trong đó) trước khi bấm giờ
+        workers = app.RENDER_WORKERS
+        list(app.worker_pool().map(render.circle_table, [render.CIRCLE_STEPS] * workers))
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        output = CASES[case](app, content)
+        wall = time.perf_counter() - start
+    app.shutdown_worker_pool()
+    return {'case': case, 'rows': rows, 'workers': app.RENDER_WORKERS, 'wall_s': round(wall, 4),
+            'rows_per_s': round(rows / wall, 1), 'peak_rss_mb': round(peak_rss_mb(rss.peak_kb), 1),
+            'output_bytes': len(output)}
+
+def measure(case, csv_path, rows, repeat, workers):
+    # Lấy lần chạy nhanh nhất trong repeat lần, mỗi lần một tiến trình mới
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-m', 'benchmarks.run', '--child', case, csv_path, str(rows)],
+                              cwd=ROOT, capture_output=True, text=True,
+                              env=dict(os.environ, RENDER_WORKERS=str(workers)))
+        if proc.returncode != 0:
+            raise RuntimeError(f"{case} @ {rows} rows failed:\n{proc.stderr}")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if best is None or result['wall_s'] < best['wall_s']:
+            best = result
+    return best
+
+def compare(result, baseline, tolerance):
+    # Hồi quy khi thời gian hoặc bộ nhớ vượt mốc quá tolerance; kích thước kết quả đổi chỉ để thông báo
+    flags = []
+    if baseline is None:
+        return flags
+    if result['wall_s'] > baseline['wall_s'] * (1 + tolerance):
+        flags.append(f"REGRESSION wall {baseline['wall_s']}s -> {result['wall_s']}s")
+    if result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        flags.append(f"REGRESSION rss {baseline['peak_rss_mb']}MB -> {result['peak_rss_mb']}MB")
+    if result['output_bytes'] != baseline['output_bytes']:
+        flags.append(f"output {baseline['output_bytes']} -> {result['output_bytes']} bytes")
+    return flags
+
+def baseline_key(result):
+    # Kết quả với số process render khác nhau không được so với nhau
+    return f"{result['case']}@{result['rows']}/{result['workers']}w"
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        case, csv_path, rows = sys.argv[2:5]
+        print(json.dumps(run_case(case, csv_path, int(rows))))
+        return
+
+    parser = argparse.ArgumentParser(description='Benchmark KMZ/CLF generation on synthetic network data.')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma separated row counts, e.g. 1000,100000,2000000')
+    parser.add_argument('--cases', help='comma separated case names (default: all)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1, help='runs per case, the fastest is kept')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('RENDER_WORKERS', os.cpu_count() or 1)),
+                        help='render processes per case (RENDER_WORKERS), <= 1 renders in-process')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before flagging, 0.2 = 20%%')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    cases = args.cases.split(',') if args.cases else list(CASES)
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))} (available: {', '.join(CASES)})")
+
+    from benchmarks.synthetic import GENERATOR_VERSION, write_network_csv
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baselines = json.load(f)
+
+    results = []
+    regressions = 0
+    data_dir = os.path.join(tempfile.gettempdir(), 'network-visualization-bench')
+    os.makedirs(data_dir, exist_ok=True)
+    print(f"{'case':<22}{'rows':>10}{'workers':>9}{'wall s':>10}{'rows/s':>12}{'rss MB':>9}{'out bytes':>13}")
+    for rows in sizes:
+        csv_path = os.path.join(data_dir, f'network_v{GENERATOR_VERSION}_s{args.seed}_{rows}.csv')
+        if not os.path.exists(csv_path):
+            with open(csv_path + '.tmp', 'w', encoding='utf-8', newline='') as f:
+                write_network_csv(f, rows, args.seed)
+            os.replace(csv_path + '.tmp', csv_path)
+        for case in cases:
+            result = measure(case, csv_path, rows, args.repeat, args.workers)
+            results.append(result)
+            flags = compare(result, baselines.get(baseline_key(result)), args.tolerance)
+            regressions += any(flag.startswith('REGRESSION') for flag in flags)
+            print(f"{case:<22}{rows:>10}{result['workers']:>9}{result['wall_s']:>10.3f}{result['rows_per_s']:>12.0f}"
+                  f"{result['peak_rss_mb']:>9.1f}{result['output_bytes']:>13}  {'; '.join(flags)}", flush=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        baselines.update({baseline_key(result): result for result in results})
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"{regressions} case(s) regressed by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
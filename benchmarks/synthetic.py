@@ -0,0 +1,86 @@
+import argparse
+import csv
+import math
+import random
+import sys
+
+# Sinh file CSV mạng lưới giả lập (có seed) để benchmark.
+# File có đủ cột của cả ba endpoint (coverage, points, CLF); phân bố công nghệ, loại cell
+# và số cell mỗi site mô phỏng dữ liệu thật: phần lớn là site macro 3 sector, một ít cell IBC/small cell.
+
+GENERATOR_VERSION = 1
+
+COLUMNS = ['SITEID', 'LAT', 'LONG', 'CELLNAME', 'CELLID', 'SYS', 'ARFCN/UARFCN/EARFCN/NR-ARFCN', 'AZIMUTH',
+           'ANT_HEIGHT', 'TILT', 'HBW', 'VBW', 'DATA', 'PLT', 'TYPE', 'VENDOR', 'DESC', 'PROVINCE', 'NOTE',
+           'MCCMNC', 'LAC', 'POS-RAT', 'SYSCLF']
+
+# (SYS, danh sách ARFCN, trọng số, SYSCLF, trung vị lưu lượng)
+TECHS = [
+    ('2G', ['900', '1800', '62', '695'], 15, '2', 8),
+    ('3G', ['10562', '10587', '10612', '3088', '1874'], 20, '3', 1.5),
+    ('4G', ['1501', '1874', '3150', '25', '50', '900', '6300'], 42, '4', 120),
+    ('LTE', ['1501', '3150'], 8, '4', 120),
+    ('5G', ['n77', '3800', '643334'], 15, '5', 900),
+]
+# TYPE: 0 = macro, 1 = small cell, 2 = IBC
+CELL_TYPES = [0, 1, 2]
+CELL_TYPE_WEIGHTS = [80, 8, 12]
+SECTORS_PER_SITE = [1, 2, 3, 3, 3, 3, 4, 6]
+VENDORS = ['Ericsson', 'Huawei', 'Nokia', 'ZTE']
+DESCS = ['Macro', 'Indoor', 'Rooftop', 'Monopole', 'Repeater']
+# (tỉnh, vĩ độ, kinh độ, độ phân tán) quanh các thành phố lớn
+CITIES = [('HN', 21.03, 105.85, 0.25), ('HCM', 10.78, 106.70, 0.3), ('DN', 16.05, 108.20, 0.15),
+          ('HP', 20.85, 106.68, 0.12), ('CT', 10.03, 105.78, 0.12), ('NT', 12.24, 109.19, 0.1)]
+
+def iter_network_rows(rows, seed=0):
+    rng = random.Random(seed)
+    tech_weights = [tech[2] for tech in TECHS]
+    produced = 0
+    site = 0
+    while produced < rows:
+        province, lat0, lon0, spread = rng.choice(CITIES)
+        lat = round(lat0 + rng.gauss(0, spread), 6)
+        lon = round(lon0 + rng.gauss(0, spread), 6)
+        site_id = f'{province}{site:06d}'
+        plt = rng.choices([1, 2, 3, 4, 5, 6, 7], weights=[5, 15, 30, 25, 15, 8, 2])[0]
+        vendor = rng.choice(VENDORS)
+        desc = rng.choice(DESCS)
+        lac = 10000 + site // 50
+        enodeb = 100000 + site
+        sectors = rng.choice(SECTORS_PER_SITE)
+        azimuth0 = rng.randrange(0, 120)
+        techs = rng.choices(TECHS, weights=tech_weights, k=rng.choice([1, 1, 2, 2, 3]))
+        for system, arfcns, _, sysclf, median in techs:
+            arfcn = rng.choice(arfcns)
+            for sector in range(sectors):
+                if produced >= rows:
+                    return
+                cell_type = rng.choices(CELL_TYPES, weights=CELL_TYPE_WEIGHTS)[0]
+                azimuth = (azimuth0 + sector * 360 // sectors + rng.randrange(-10, 11)) % 360
+                cell_id = f'{enodeb}-{sector + 1}' if sysclf == '4' else str(produced + 1)
+                data = round(rng.lognormvariate(math.log(median), 1.0), 2)
+                yield [site_id, lat, lon, f'{site_id}_{system}_{arfcn}_{sector + 1}', cell_id, system, arfcn,
+                       azimuth, rng.choice([15, 20, 25, 30, 35, 40]), rng.choice([0, 2, 4, 6]), 65, 10, data,
+                       plt, cell_type, vendor, desc, province, f'note {site}', '45204', lac, 'GPS', sysclf]
+                produced += 1
+        site += 1
+
+def write_network_csv(f, rows, seed=0):
+    writer = csv.writer(f, lineterminator='\n')
+    writer.writerow(COLUMNS)
+    writer.writerows(iter_network_rows(rows, seed))
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic network CSV for benchmarking.')
+    parser.add_argument('rows', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            write_network_csv(f, args.rows, args.seed)
+    else:
+        write_network_csv(sys.stdout, args.rows, args.seed)
+
+if __name__ == '__main__':
+    main()
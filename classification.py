@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Phân loại công nghệ / tần số / lớp lưu lượng cho cell.
+# Cấu hình (bán kính, beamwidth, ngưỡng lưu lượng) được biên dịch một lần khi khởi động;
+# nhãn SYS/ARFCN thô được chuẩn hoá qua bảng tra có nhớ, lớp lưu lượng tính cho cả cột bằng searchsorted.
+# Có thể nạp cấu hình từ file JSON/YAML (có trường version) để chỉnh mà không cần deploy lại code.
+
+CONFIG_VERSION = 1
+MAX_DATA_LAYER = 6
+
+DEFAULT_CONFIG = {
+    'version': CONFIG_VERSION,
+    'freq_config': {
+        '2G': {
+            '900': {'radius': 0.0017, 'beamwidth': 10, 'ibc_radius': 0.00015, 'ibc_beamwidth': 360},
+            '1800': {'radius': 0.00125, 'beamwidth': 10, 'ibc_radius': 0.00012, 'ibc_beamwidth': 360}
+        },
+        '3G': {
+            '3088': {'radius': 0.00109, 'beamwidth': 55, 'ibc_radius': 0.0006, 'ibc_beamwidth': 360},
+            '10562': {'radius': 0.00103, 'beamwidth': 60, 'ibc_radius': 0.0006, 'ibc_beamwidth': 360},
+            '10587': {'radius': 0.00097, 'beamwidth': 60, 'ibc_radius': 0.00054, 'ibc_beamwidth': 360},
+            '10612': {'radius': 0.00091, 'beamwidth': 60, 'ibc_radius': 0.00048, 'ibc_beamwidth': 360}
+        },
+        '4G': {
+            '25': {'radius': 0.00071, 'beamwidth': 80, 'ibc_radius': 0.00042, 'ibc_beamwidth': 360},
+            '50': {'radius': 0.00071, 'beamwidth': 80, 'ibc_radius': 0.00042, 'ibc_beamwidth': 360},
+            '1501': {'radius': 0.00065, 'beamwidth': 80, 'ibc_radius': 0.00039, 'ibc_beamwidth': 360},
+            '1874': {'radius': 0.00059, 'beamwidth': 80, 'ibc_radius': 0.00036, 'ibc_beamwidth': 360},
+            '900': {'radius': 0.00053, 'beamwidth': 90, 'ibc_radius': 0.00033, 'ibc_beamwidth': 360},
+            '3150': {'radius': 0.00047, 'beamwidth': 90, 'ibc_radius': 0.0003, 'ibc_beamwidth': 360}
+        },
+        '5G': {
+            '3800': {'radius': 0.0004, 'beamwidth': 100, 'ibc_radius': 0.0005, 'ibc_beamwidth': 360}
+        }
+    },
+    # Dùng khi cặp công nghệ/tần số không có trong freq_config
+    'fallback': {'radius': 0.0002, 'beamwidth': 90, 'ibc_radius': 0.00014, 'ibc_beamwidth': 65},
+    # Ngưỡng lưu lượng (giá trị > ngưỡng thứ i thì lên lớp i + 2); 'default' áp dụng cho 5G và công nghệ lạ
+    'data_layers': {
+        '2G': [1, 5, 20, 30],
+        '3G': [0.3, 1, 3, 5],
+        '4G': [10, 50, 200, 500],
+        'default': [50, 200, 1000, 5000, 10000]
+    }
+}
+
+def standardize_system_name(system):
+    system = str(system).upper().strip()
+    if '2G' in system or 'GSM' in system: return '2G'
+    elif '3G' in system or 'UMTS' in system: return '3G'
+    elif '4G' in system or 'LTE' in system: return '4G'
+    elif '5G' in system or 'NR' in system: return '5G'
+    return system
+
+def standardize_frequency(freq, system):
+    freq = str(freq).strip()
+    system = standardize_system_name(system)
+    if freq == 'n77': return '3800'
+    elif freq == '1874' and system == '3G': return '10587'
+    cleaned_freq = ''.join(filter(str.isdigit, freq))
+    if system == '2G':
+        if cleaned_freq in ['900', '1800']: return cleaned_freq
+        elif int(cleaned_freq) < 1000: return '900'
+        else: return '1800'
+    return cleaned_freq
+
+def load_config(path=None):
+    # Không có path: dùng cấu hình mặc định. Các mục có trong file sẽ thay thế mục mặc định tương ứng.
+    config = dict(DEFAULT_CONFIG)
+    if not path:
+        return config
+    with open(path, encoding='utf-8') as f:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            if yaml is None:
+                raise ValueError(f"PyYAML is required to load {path}")
+            loaded = yaml.safe_load(f)
+        else:
+            loaded = json.load(f)
+    if not isinstance(loaded, dict) or loaded.get('version') != CONFIG_VERSION:
+        raise ValueError(f"Unsupported classification config version in {path}: expected {CONFIG_VERSION}")
+    unknown = set(loaded) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown classification config sections in {path}: {unknown}")
+    config.update(loaded)
+    return config
+
+def _beam_config(entry):
+    return (float(entry['radius']), float(entry['beamwidth']), float(entry['ibc_radius']), float(entry['ibc_beamwidth']))
+
+class Classifier:
+    def __init__(self, config):
+        self.fingerprint = hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        self.freq_config = {(tech, freq): _beam_config(entry)
+                            for tech, freqs in config['freq_config'].items()
+                            for freq, entry in freqs.items()}
+        self.fallback = _beam_config(config['fallback'])
+        if 'default' not in config['data_layers']:
+            raise ValueError("Classification config data_layers must define a 'default' entry")
+        self.thresholds = {}
+        for tech, values in config['data_layers'].items():
+            values = np.sort(np.array(values, dtype=np.float64))
+            if len(values) > MAX_DATA_LAYER - 1:
+                raise ValueError(f"Too many data layer thresholds for {tech}: at most {MAX_DATA_LAYER - 1}")
+            self.thresholds[tech] = values
+        self._techs = {}
+        self._frequencies = {}
+
+    def tech(self, system):
+        tech = self._techs.get(system)
+        if tech is None:
+            tech = self._techs[system] = standardize_system_name(system)
+        return tech
+
+    def frequency(self, freq, system):
+        key = (freq, system)
+        value = self._frequencies.get(key)
+        if value is None:
+            value = self._frequencies[key] = standardize_frequency(freq, system)
+        return value
+
+    def beam_config(self, tech, freq):
+        # (radius, beamwidth, ibc_radius, ibc_beamwidth, có trong freq_config hay không)
+        config = self.freq_config.get((tech, freq))
+        return (self.fallback + (False,)) if config is None else (config + (True,))
+
+    def data_layers(self, data_usage, techs):
+        # Lớp lưu lượng cho cả cột: số ngưỡng nhỏ hơn hẳn giá trị + 1 (tương đương chuỗi if data_usage > ngưỡng)
+        data_usage = np.asarray(data_usage, dtype=np.float64)
+        techs = np.asarray(techs)
+        layers = np.ones(len(data_usage), dtype=np.int64)
+        for tech in np.unique(techs).tolist():
+            idx = np.flatnonzero(techs == tech)
+            thresholds = self.thresholds.get(tech, self.thresholds['default'])
+            layers[idx] += np.searchsorted(thresholds, data_usage[idx], side='left')
+        layers[np.isnan(data_usage)] = 1
+        return layers
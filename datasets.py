@@ -0,0 +1,160 @@
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from ingest import CellTable, SiteTable
+from storage import private_directory
+
+# Kho dataset lưu lâu dài: upload một lần (POST /datasets), truy vấn nhiều lần với bộ lọc.
+# Mỗi dataset là bảng site/cell đã parse (dạng cột) lưu thành một file .npz trong directory, id là digest của upload,
+# kèm file JSON mô tả. Cột NumPy lưu dạng mảng .npy, cột chuỗi và danh sách nhãn gom thành một khối JSON; khi đọc
+# dùng allow_pickle=False nên file trong thư mục không thể chứa object Python tuỳ ý.
+# Các gunicorn worker dùng chung thư mục; mỗi process giữ tối đa max_loaded dataset
+# (đã qua prepare) trong bộ nhớ. File "current" trỏ tới dataset nạp gần nhất (dataset mặc định của vector tile).
+
+DATASET_ID_PATTERN = re.compile(r'[0-9a-f]{64}')
+SITE_FIELDS = ('ids', 'lat', 'lon', 'plt', 'desc', 'province', 'vendor')
+
+def pack_tables(sites, cells):
+    arrays, values = {}, {}
+    for prefix, table, names in (('sites', sites, SITE_FIELDS), ('cells', cells, CellTable.__slots__)):
+        for name in names:
+            value = getattr(table, name)
+            if isinstance(value, np.ndarray):
+                arrays[f'{prefix}.{name}'] = value
+            else:
+                values[f'{prefix}.{name}'] = value
+    arrays['values'] = np.frombuffer(json.dumps(values).encode('utf-8'), dtype=np.uint8)
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+def unpack_tables(f):
+    with np.load(f, allow_pickle=False) as data:
+        values = {name: data[name] for name in data.files}
+    values.update(json.loads(values.pop('values').tobytes().decode('utf-8')))
+    sites = SiteTable(**{name: values[f'sites.{name}'] for name in SITE_FIELDS})
+    cells = CellTable.__new__(CellTable)
+    for name in CellTable.__slots__:
+        setattr(cells, name, values[f'cells.{name}'])
+    return sites, cells
+
+class DatasetStore:
+    def __init__(self, directory, max_stored, max_loaded):
+        self.directory = directory
+        self.max_stored = max_stored
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        private_directory(directory)
+
+    def _path(self, dataset_id, suffix):
+        if not DATASET_ID_PATTERN.fullmatch(dataset_id):
+            return None
+        return os.path.join(self.directory, dataset_id + suffix)
+
+    def _write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def save(self, dataset_id, tables, info, source=None):
+        # tables: (SiteTable, CellTable); info: dict mô tả trả về qua GET /datasets/<id>;
+        # source: kết quả prepare(tables) đã tính sẵn (nếu có), giữ trong bộ nhớ như khi load
+        path = self._path(dataset_id, '.npz')
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            self._write(path, pack_tables(*tables))
+        info = dict(info, dataset=dataset_id, created=time.time())
+        self._write(self._path(dataset_id, '.json'), json.dumps(info).encode('utf-8'))
+        self._write(os.path.join(self.directory, 'current'), dataset_id.encode('ascii'))
+        self._evict()
+        if source is not None:
+            with self._lock:
+                self._remember(dataset_id, source)
+        return info
+
+    def info(self, dataset_id):
+        path = self._path(dataset_id, '.json')
+        if path is None:
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def current(self):
+        try:
+            with open(os.path.join(self.directory, 'current'), encoding='ascii') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def load(self, dataset_id, prepare):
+        # prepare(tables) dựng dữ liệu dùng chung cho mọi truy vấn của dataset, chỉ chạy một lần mỗi process
+        path = self._path(dataset_id, '.npz')
+        if path is None:
+            return None
+        with self._lock:
+            source = self._loaded.get(dataset_id)
+            if source is not None:
+                self._loaded.move_to_end(dataset_id)
+                return source
+            try:
+                with open(path, 'rb') as f:
+                    tables = unpack_tables(f)
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+            source = prepare(tables)
+            self._remember(dataset_id, source)
+            return source
+
+    def _remember(self, dataset_id, source):
+        # Gọi khi đang giữ _lock
+        self._loaded[dataset_id] = source
+        self._loaded.move_to_end(dataset_id)
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+
+    def delete(self, dataset_id):
+        path = self._path(dataset_id, '.npz')
+        if path is None or not os.path.exists(path):
+            return False
+        self._remove(dataset_id)
+        return True
+
+    def _remove(self, dataset_id):
+        # Process khác có thể còn giữ bản đã nạp trong bộ nhớ cho tới khi bị đẩy khỏi LRU của nó
+        with self._lock:
+            self._loaded.pop(dataset_id, None)
+        for suffix in ('.npz', '.json'):
+            try:
+                os.remove(self._path(dataset_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        # Giữ max_stored dataset dùng gần nhất (theo mtime của file .npz)
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.npz'):
+                    entries.append((entry.stat().st_mtime, entry.name[:-len('.npz')]))
+        entries.sort()
+        for _, dataset_id in entries[:max(len(entries) - self.max_stored, 0)]:
+            self._remove(dataset_id)
@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import threading
+import time
+
+from storage import private_directory
+
+# Cache Placemark của từng cell (SQLite, dùng chung giữa các gunicorn worker và giữa các lần upload).
+# Cột used lưu thời điểm dùng gần nhất để xoá bớt theo LRU khi vượt max_entries.
+
+QUERY_BATCH = 500
+
+class FragmentCache:
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        private_directory(os.path.dirname(path) or '.')
+        self._conn()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS fragments (key BLOB PRIMARY KEY, fragment TEXT NOT NULL, used REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS fragments_used ON fragments (used)')
+            self._local.conn = conn
+        return conn
+
+    def _select(self, columns, keys):
+        conn = self._conn()
+        for start in range(0, len(keys), QUERY_BATCH):
+            batch = keys[start:start + QUERY_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            yield from conn.execute(f'SELECT {columns} FROM fragments WHERE key IN ({placeholders})', batch)
+
+    def existing(self, keys):
+        return {key for key, in self._select('key', keys)}
+
+    def get_many(self, keys):
+        found = dict(self._select('key, fragment', keys))
+        if found:
+            conn = self._conn()
+            now = time.time()
+            with conn:
+                conn.executemany('UPDATE fragments SET used = ? WHERE key = ?', ((now, key) for key in found))
+        return found
+
+    def put_many(self, items):
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO fragments (key, fragment, used) VALUES (?, ?, ?)',
+                             ((key, fragment, now) for key, fragment in items))
+
+    def evict(self):
+        conn = self._conn()
+        count, = conn.execute('SELECT COUNT(*) FROM fragments').fetchone()
+        if count > self.max_entries:
+            with conn:
+                conn.execute('DELETE FROM fragments WHERE key IN (SELECT key FROM fragments ORDER BY used LIMIT ?)',
+                             (count - self.max_entries,))
@@ -0,0 +1,335 @@
+import csv
+import io
+import math
+from array import array
+
+import numpy as np
+
+# Đọc CSV một lượt vào bảng dạng cột, dùng chung cho mọi endpoint.
+# Nguồn là chuỗi hoặc luồng text (Upload.text()): csv.reader đọc từng dòng, không cần giữ cả file trong bộ nhớ.
+# Cột số lưu bằng mảng NumPy, cột chuỗi lặp nhiều (SYS, tần số, vendor, SITEID) lưu bằng mã đã intern.
+# Dòng lỗi không bị bỏ qua im lặng mà được ghi vào ParseErrors (số dòng + lý do).
+
+COVERAGE_COLUMNS = {'SITEID', 'LAT', 'LONG', 'CELLNAME', 'CELLID', 'SYS',
+                    'ARFCN/UARFCN/EARFCN/NR-ARFCN', 'AZIMUTH', 'ANT_HEIGHT',
+                    'TILT', 'HBW', 'VBW', 'DATA', 'PLT', 'TYPE'}
+POINTS_COLUMNS = {'SITEID', 'LAT', 'LONG', 'NOTE'}
+CLF_COLUMNS = {'MCCMNC', 'CELLID', 'LAC', 'TYPE', 'LAT', 'LONG', 'POS-RAT',
+               'DESC', 'SYSCLF', 'CELLNAME', 'AZIMUTH', 'ANT_HEIGHT', 'HBW',
+               'VBW', 'TILT', 'SITEID'}
+CLF_FIELDS = ('MCCMNC', 'CELLID', 'LAC', 'TYPE', 'LAT', 'LONG', 'POS-RAT', 'DESC', 'SYSCLF', 'CELLNAME',
+              'AZIMUTH', 'ANT_HEIGHT', 'HBW', 'VBW', 'TILT', 'SITEID')
+
+MAX_ERROR_SAMPLES = 100
+
+class ParseErrors:
+    # rows: số dòng dữ liệu đã đọc (kể cả dòng lỗi); count: số dòng bị bỏ qua
+    __slots__ = ('rows', 'count', 'samples')
+
+    def __init__(self):
+        self.rows = 0
+        self.count = 0
+        self.samples = []
+
+    def add(self, line, message):
+        self.count += 1
+        if len(self.samples) < MAX_ERROR_SAMPLES:
+            self.samples.append({'line': line, 'error': message})
+
+class Interner:
+    __slots__ = ('codes', 'labels')
+
+    def __init__(self):
+        self.codes = {}
+        self.labels = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.labels)
+            self.labels.append(value)
+        return code
+
+def _take(values, index):
+    if isinstance(values, np.ndarray) or isinstance(index, slice):
+        return values[index]
+    return [values[k] for k in index]
+
+class SiteTable:
+    __slots__ = ('ids', 'index', 'lat', 'lon', 'plt', 'desc', 'province', 'vendor')
+
+    def __init__(self, ids, lat, lon, plt=None, desc=None, province=None, vendor=None):
+        self.ids = ids
+        self.index = {site_id: k for k, site_id in enumerate(ids)}
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.plt = None if plt is None else np.asarray(plt, dtype=np.int64)
+        self.desc = desc
+        self.province = province
+        self.vendor = vendor
+
+    def __len__(self):
+        return len(self.ids)
+
+    def take(self, index):
+        index = list(index)
+        optional = {name: None if getattr(self, name) is None else _take(getattr(self, name), index)
+                    for name in ('plt', 'desc', 'province', 'vendor')}
+        return SiteTable(_take(self.ids, index), self.lat[index], self.lon[index], **optional)
+
+class Cell:
+    # Một dòng cell lấy ra từ CellTable khi cần render từng Placemark
+    __slots__ = ('site', 'cell_name', 'cell_id', 'system', 'frequency', 'vendor', 'azimuth', 'height', 'tilt',
+                 'h_beamwidth', 'v_beamwidth', 'data_usage', 'plt', 'type')
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+class CellTable:
+    # site: chỉ số vào SiteTable; system/frequency/vendor: mã vào các danh sách nhãn tương ứng
+    # clf: dòng CLF của từng cell (read_network(keep_clf=True) và upload có đủ cột CLF), không có thì None
+    COLUMNS = ('site', 'cell_name', 'cell_id', 'system', 'frequency', 'vendor', 'azimuth', 'height', 'tilt',
+               'h_beamwidth', 'v_beamwidth', 'data_usage', 'plt', 'type')
+    __slots__ = COLUMNS + ('systems', 'frequencies', 'vendors', 'clf')
+
+    def __len__(self):
+        return len(self.cell_name)
+
+    def take(self, index):
+        # index là slice hoặc dãy chỉ số; nhãn intern được dùng chung với bảng gốc
+        table = CellTable.__new__(CellTable)
+        for name in self.COLUMNS:
+            setattr(table, name, _take(getattr(self, name), index))
+        table.systems, table.frequencies, table.vendors = self.systems, self.frequencies, self.vendors
+        table.clf = None if self.clf is None else _take(self.clf, index)
+        return table
+
+    def rows(self):
+        systems, frequencies, vendors = self.systems, self.frequencies, self.vendors
+        columns = [getattr(self, name) for name in self.COLUMNS]
+        columns = [values.tolist() if isinstance(values, np.ndarray) else values for values in columns]
+        for (site, cell_name, cell_id, system, frequency, vendor, azimuth, height, tilt,
+             hbw, vbw, data_usage, plt, cell_type) in zip(*columns):
+            yield Cell(site, cell_name, cell_id, systems[system], frequencies[frequency], vendors[vendor],
+                       azimuth, height, tilt, hbw, vbw, data_usage, plt, cell_type)
+
+def open_csv(source, required_columns):
+    reader = csv.reader(io.StringIO(source) if isinstance(source, str) else source)
+    header = next(reader, None) or []
+    if not required_columns.issubset(header):
+        raise ValueError(f"Missing required columns: {required_columns - set(header)}")
+    return reader, {name: k for k, name in enumerate(header)}
+
+def _getter(columns, name, default=None):
+    k = columns.get(name)
+    if k is None:
+        return lambda row: default
+    return lambda row: row[k] if k < len(row) else None
+
+def clf_converter(columns):
+    # Hàm chuyển một dòng CSV thành một dòng CLF (không kèm xuống dòng); IndexError nếu dòng thiếu cột
+    field_indices = [columns[name] for name in CLF_FIELDS]
+    cell_id_index, sysclf_index = columns['CELLID'], columns['SYSCLF']
+
+    def convert(row):
+        values = [row[k] for k in field_indices]
+        if row[sysclf_index] == '4':
+            try:
+                eNodeB_id, cid = map(int, row[cell_id_index].split('-'))
+                values[1] = str((eNodeB_id * 256) + cid)
+            except ValueError:
+                pass
+        return ';'.join(values)
+    return convert
+
+def read_rows(reader, consumers, progress=None, progress_interval=5000):
+    # Một lượt đọc CSV: mỗi dòng không rỗng được đưa cho mọi consume(line_num, row); trả về số dòng đã đọc
+    if len(consumers) == 1:
+        consume = consumers[0]
+    else:
+        def consume(line_num, row):
+            for each in consumers:
+                each(line_num, row)
+    rows = 0
+    for row in reader:
+        if not row:
+            continue
+        rows += 1
+        if progress and rows % progress_interval == 0:
+            progress('parsing', rows)
+        consume(reader.line_num, row)
+    return rows
+
+def read_many(source, collectors, progress=None, progress_interval=5000):
+    # collectors: tên -> (cột bắt buộc, hàm dựng collector từ header); header phải có hợp các cột bắt buộc.
+    # CSV chỉ được đọc và tách cột một lần, trả về tên -> kết quả finish(rows) của từng collector
+    required = set().union(*(columns for columns, _ in collectors.values()))
+    reader, columns = open_csv(source, required)
+    built = {name: make(columns) for name, (_, make) in collectors.items()}
+    rows = read_rows(reader, [consume for consume, _ in built.values()], progress, progress_interval)
+    return {name: finish(rows) for name, (_, finish) in built.items()}
+
+def network_collector(columns, keep_clf=False, check_cell=None):
+    # (consume(line_num, row), finish(rows) -> (SiteTable, CellTable, ParseErrors)) cho dữ liệu coverage
+    # check_cell(system, frequency): ValueError nếu cell không phân loại được, dòng đó được ghi vào ParseErrors;
+    # kết quả được nhớ theo từng cặp (SYS, ARFCN) nên chỉ kiểm tra một lần cho mỗi cặp
+    col = {name: columns[name] for name in COVERAGE_COLUMNS}
+    n_required = max(col.values()) + 1
+    get_vendor = _getter(columns, 'VENDOR', 'N/A')
+    get_desc = _getter(columns, 'DESC', 'N/A')
+    get_province = _getter(columns, 'PROVINCE', 'N/A')
+    convert_clf = clf_converter(columns) if keep_clf and CLF_COLUMNS.issubset(columns) else None
+    lat_k, lon_k, azimuth_k, height_k, tilt_k = col['LAT'], col['LONG'], col['AZIMUTH'], col['ANT_HEIGHT'], col['TILT']
+    hbw_k, vbw_k, data_k, plt_k, type_k = col['HBW'], col['VBW'], col['DATA'], col['PLT'], col['TYPE']
+    site_k, name_k, id_k, sys_k, freq_k = (col['SITEID'], col['CELLNAME'], col['CELLID'], col['SYS'],
+                                           col['ARFCN/UARFCN/EARFCN/NR-ARFCN'])
+
+    site_codes = Interner()
+    systems, frequencies, vendors = Interner(), Interner(), Interner()
+    site_lat, site_lon, site_plt, site_desc, site_province, site_vendor = [], [], [], [], [], []
+    cell_site, cell_system, cell_frequency, cell_vendor = array('i'), array('i'), array('i'), array('i')
+    cell_name, cell_id = [], []
+    azimuth, height, tilt, hbw, vbw, data_usage = (array('d') for _ in range(6))
+    cell_plt, cell_type = array('q'), array('q')
+    cell_clf = []
+    checked = {}
+    errors = ParseErrors()
+
+    def consume(line_num, row):
+        if len(row) < n_required:
+            errors.add(line_num, f"Expected at least {n_required} fields, got {len(row)}")
+            return
+        try:
+            values = (float(row[lat_k]), float(row[lon_k]), float(row[azimuth_k]), float(row[height_k]),
+                      float(row[tilt_k]), float(row[hbw_k]), float(row[vbw_k]), float(row[data_k]),
+                      int(row[plt_k]), int(row[type_k]))
+        except ValueError as e:
+            errors.add(line_num, str(e))
+            return
+        if check_cell is not None:
+            pair = (row[sys_k], row[freq_k])
+            problem = checked.get(pair)
+            if problem is None:
+                try:
+                    check_cell(*pair)
+                    problem = ''
+                except ValueError as e:
+                    problem = str(e)
+                checked[pair] = problem
+            if problem:
+                errors.add(line_num, problem)
+                return
+        lat, lon, row_azimuth, row_height, row_tilt, row_hbw, row_vbw, row_data, plt, row_type = values
+        if not (math.isfinite(lat) and math.isfinite(lon) and math.isfinite(row_azimuth)):
+            errors.add(line_num, "LAT, LONG and AZIMUTH must be finite numbers")
+            return
+        vendor = get_vendor(row)
+
+        site = site_codes.code(row[site_k])
+        if site == len(site_lat):
+            site_lat.append(lat)
+            site_lon.append(lon)
+            site_plt.append(plt)
+            site_desc.append(get_desc(row))
+            site_province.append(get_province(row))
+            site_vendor.append(vendor)
+
+        cell_site.append(site)
+        cell_name.append(row[name_k])
+        cell_id.append(row[id_k])
+        cell_system.append(systems.code(row[sys_k]))
+        cell_frequency.append(frequencies.code(row[freq_k]))
+        cell_vendor.append(vendors.code(vendor))
+        azimuth.append(row_azimuth)
+        height.append(row_height)
+        tilt.append(row_tilt)
+        hbw.append(row_hbw)
+        vbw.append(row_vbw)
+        data_usage.append(row_data)
+        cell_plt.append(plt)
+        cell_type.append(row_type)
+        if convert_clf is not None:
+            try:
+                cell_clf.append(convert_clf(row))
+            except IndexError:
+                cell_clf.append(None)
+
+    def finish(rows):
+        errors.rows = rows
+        sites = SiteTable(site_codes.labels, site_lat, site_lon, site_plt, site_desc, site_province, site_vendor)
+        cells = CellTable.__new__(CellTable)
+        cells.site = np.array(cell_site, dtype=np.int32)
+        cells.cell_name = cell_name
+        cells.cell_id = cell_id
+        cells.system = np.array(cell_system, dtype=np.int32)
+        cells.frequency = np.array(cell_frequency, dtype=np.int32)
+        cells.vendor = np.array(cell_vendor, dtype=np.int32)
+        for name, values in (('azimuth', azimuth), ('height', height), ('tilt', tilt), ('h_beamwidth', hbw),
+                             ('v_beamwidth', vbw), ('data_usage', data_usage)):
+            setattr(cells, name, np.array(values, dtype=np.float64))
+        cells.plt = np.array(cell_plt, dtype=np.int64)
+        cells.type = np.array(cell_type, dtype=np.int64)
+        cells.systems, cells.frequencies, cells.vendors = systems.labels, frequencies.labels, vendors.labels
+        cells.clf = None if convert_clf is None else cell_clf
+        return sites, cells, errors
+    return consume, finish
+
+def read_network(source, progress=None, progress_interval=5000, keep_clf=False, check_cell=None):
+    reader, columns = open_csv(source, COVERAGE_COLUMNS)
+    consume, finish = network_collector(columns, keep_clf, check_cell)
+    return finish(read_rows(reader, [consume], progress, progress_interval))
+
+def points_collector(columns):
+    # (consume, finish(rows) -> (SiteTable, ParseErrors)): mỗi SITEID lấy dòng hợp lệ đầu tiên
+    col = {name: columns[name] for name in POINTS_COLUMNS}
+    n_required = max(col.values()) + 1
+    ids, lat, lon = [], array('d'), array('d')
+    seen = set()
+    errors = ParseErrors()
+
+    def consume(line_num, row):
+        if len(row) < n_required:
+            errors.add(line_num, f"Expected at least {n_required} fields, got {len(row)}")
+            return
+        try:
+            row_lat, row_lon = float(row[col['LAT']]), float(row[col['LONG']])
+        except ValueError as e:
+            errors.add(line_num, str(e))
+            return
+        if not (math.isfinite(row_lat) and math.isfinite(row_lon)):
+            errors.add(line_num, "LAT and LONG must be finite numbers")
+            return
+        site_id = row[col['SITEID']]
+        if site_id not in seen:
+            seen.add(site_id)
+            ids.append(site_id)
+            lat.append(row_lat)
+            lon.append(row_lon)
+
+    def finish(rows):
+        errors.rows = rows
+        return SiteTable(ids, np.array(lat, dtype=np.float64), np.array(lon, dtype=np.float64)), errors
+    return consume, finish
+
+def read_points(source, progress=None, progress_interval=5000):
+    reader, columns = open_csv(source, POINTS_COLUMNS)
+    consume, finish = points_collector(columns)
+    return finish(read_rows(reader, [consume], progress, progress_interval))
+
+def clf_collector(columns):
+    # (consume, finish(rows) -> (các dòng CLF, ParseErrors)); dòng thiếu cột bị bỏ qua như iter_clf_lines
+    convert = clf_converter(columns)
+    lines = []
+    errors = ParseErrors()
+
+    def consume(line_num, row):
+        try:
+            lines.append(convert(row))
+        except IndexError:
+            errors.add(line_num, f"Expected {len(columns)} fields, got {len(row)}")
+
+    def finish(rows):
+        errors.rows = rows
+        return lines, errors
+    return consume, finish
@@ -0,0 +1,147 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import private_directory
+from uploads import COPY_CHUNK_SIZE, Upload
+
+# Hàng đợi job nền cho các render lớn.
+# Trạng thái và kết quả job nằm trên đĩa nên worker gunicorn nào cũng trả lời được GET /jobs/<id>,
+# còn việc chạy job diễn ra trong thread nền của worker đã nhận upload.
+
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+PROGRESS_WRITE_INTERVAL = 1.0
+
+class JobQueueFull(Exception):
+    pass
+
+class JobManager:
+    def __init__(self, directory, max_workers, max_pending, ttl):
+        self.directory = directory
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_cleanup = 0
+        private_directory(directory)
+
+    def _job_dir(self, job_id):
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            return None
+        return os.path.join(self.directory, job_id)
+
+    def _write_status(self, job_dir, status):
+        tmp_path = os.path.join(job_dir, 'status.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, os.path.join(job_dir, 'status.json'))
+
+    def submit(self, kind, upload, params, run, mimetype, download_name):
+        # upload: Upload, được chép sang thư mục job; run(upload, params, progress, stats) trả về các chunk bytes
+        self.cleanup()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"Too many pending jobs (limit {self.max_pending})")
+            self._pending += 1
+
+        # Lỗi ở bất kỳ bước nào (vd. đầy đĩa khi chép upload) phải trả lại chỗ trong hàng đợi và xoá thư mục job
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.directory, job_id)
+        try:
+            os.makedirs(job_dir)
+            upload.file.seek(0)
+            with open(os.path.join(job_dir, 'upload'), 'wb') as f:
+                shutil.copyfileobj(upload.file, f, COPY_CHUNK_SIZE)
+            status = {
+                'job_id': job_id, 'kind': kind, 'status': 'queued',
+                'created': time.time(), 'started': None, 'finished': None,
+                'progress': {'stage': None, 'processed': 0, 'total_rows': upload.total_rows},
+                'mimetype': mimetype, 'download_name': download_name, 'size': None, 'stats': {}, 'error': None
+            }
+            self._write_status(job_dir, status)
+            self._executor.submit(self._run, job_dir, status, params, run, upload.max_decompressed)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        return job_id
+
+    def _run(self, job_dir, status, params, run, max_decompressed):
+        last_write = 0
+
+        def progress(stage, processed):
+            nonlocal last_write
+            status['progress']['stage'] = stage
+            status['progress']['processed'] = processed
+            now = time.monotonic()
+            if now - last_write >= PROGRESS_WRITE_INTERVAL:
+                last_write = now
+                self._write_status(job_dir, status)
+
+        try:
+            status['status'] = 'running'
+            status['started'] = time.time()
+            self._write_status(job_dir, status)
+            upload_path = os.path.join(job_dir, 'upload')
+            result_path = os.path.join(job_dir, 'result')
+            with open(upload_path, 'rb') as f, open(result_path + '.tmp', 'wb') as out:
+                for chunk in run(Upload(f, max_decompressed), params, progress, status['stats']):
+                    out.write(chunk)
+            os.remove(upload_path)
+            os.replace(result_path + '.tmp', result_path)
+            status['status'] = 'done'
+            status['size'] = os.path.getsize(result_path)
+        except Exception as e:
+            traceback.print_exc()
+            status['status'] = 'failed'
+            status['error'] = str(e)
+            for name in ('upload', 'result.tmp'):
+                try:
+                    os.remove(os.path.join(job_dir, name))
+                except OSError:
+                    pass
+        finally:
+            status['finished'] = time.time()
+            self._write_status(job_dir, status)
+            with self._lock:
+                self._pending -= 1
+
+    def status(self, job_id):
+        self.cleanup()
+        job_dir = self._job_dir(job_id)
+        if job_dir is None:
+            return None
+        try:
+            with open(os.path.join(job_dir, 'status.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def result_path(self, job_id):
+        job_dir = self._job_dir(job_id)
+        return None if job_dir is None else os.path.join(job_dir, 'result')
+
+    def cleanup(self):
+        # Xoá job quá TTL kể từ lần cập nhật trạng thái cuối (job đang chạy cập nhật liên tục nên không bị xoá)
+        now = time.time()
+        if now - self._last_cleanup < min(self.ttl, 60):
+            return
+        self._last_cleanup = now
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_dir() or not JOB_ID_PATTERN.fullmatch(entry.name):
+                    continue
+                try:
+                    updated = os.path.getmtime(os.path.join(entry.path, 'status.json'))
+                except FileNotFoundError:
+                    updated = entry.stat().st_mtime
+                if now - updated > self.ttl:
+                    shutil.rmtree(entry.path, ignore_errors=True)
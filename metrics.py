@@ -0,0 +1,246 @@
+import bisect
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from storage import private_directory
+
+# Số liệu Prometheus và đo thời gian từng giai đoạn xử lý.
+# Mỗi process (gunicorn worker) giữ số liệu trong bộ nhớ và ghi ra một file JSON riêng trong thư mục dùng chung;
+# /metrics cộng dồn mọi file nên worker nào trả lời cũng thấy số liệu toàn bộ.
+# File của process đã thoát (vd. worker bị restart) được cộng dồn vào merged.json khi một process mới khởi động,
+# nên số file không tăng mãi mà counter cũng không bị giảm. Thư mục chỉ dùng chung giữa các process cùng máy
+# (cùng pid namespace), vì process còn sống hay không được kiểm tra theo pid.
+# Timings đo thời gian riêng (exclusive) của từng giai đoạn: khi giai đoạn con bắt đầu, giai đoạn cha tạm dừng.
+
+PROCESS_FILE_PATTERN = re.compile(r'(\d+)-[0-9a-f]{8}\.json')
+MERGED_FILE = 'merged.json'
+
+class Metrics:
+    def __init__(self, directory, prefix):
+        self.directory = directory
+        self.prefix = prefix
+        self._path = os.path.join(directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        self._lock = threading.Lock()
+        self._definitions = {}
+        self._values = {}
+        private_directory(directory)
+        self._merge_exited()
+
+    @contextmanager
+    def _locked(self, operation):
+        # Khoá trên cả thư mục: gộp file (LOCK_EX) và đọc để trả /metrics (LOCK_SH) không chen nhau
+        with open(os.path.join(self.directory, '.lock'), 'a') as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _merge_exited(self):
+        merged_path = os.path.join(self.directory, MERGED_FILE)
+        with self._locked(fcntl.LOCK_EX):
+            totals = _read_values(merged_path) or {}
+            exited = []
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    match = PROCESS_FILE_PATTERN.fullmatch(entry.name)
+                    if match and entry.path != self._path and not _process_alive(int(match.group(1))):
+                        _add_values(totals, _read_values(entry.path) or {})
+                        exited.append(entry.path)
+            if not exited:
+                return
+            tmp_path = merged_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(totals, f)
+            os.replace(tmp_path, merged_path)
+            for path in exited:
+                os.remove(path)
+
+    def counter(self, name, help_text):
+        self._definitions[name] = ('counter', help_text, None)
+
+    def histogram(self, name, help_text, buckets):
+        self._definitions[name] = ('histogram', help_text, tuple(float(b) for b in buckets))
+
+    def _key(self, name, labels):
+        return json.dumps([name, sorted(labels.items())])
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = self._definitions[name][2]
+        key = self._key(name, labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {'buckets': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+            entry['buckets'][bisect.bisect_left(buckets, value)] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+
+    def flush(self):
+        # Ghi qua file tạm rồi os.replace để /metrics ở worker khác không đọc phải file dở dang
+        with self._lock:
+            data = json.dumps(self._values)
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path)
+
+    def _collect(self):
+        totals = {}
+        with self._locked(fcntl.LOCK_SH), os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.json'):
+                    _add_values(totals, _read_values(entry.path) or {})
+        return totals
+
+    def render(self):
+        # Định dạng text exposition của Prometheus
+        series = {}
+        for key, value in self._collect().items():
+            name, labels = json.loads(key)
+            series.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, (kind, help_text, buckets) in self._definitions.items():
+            full_name = self.prefix + name
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {kind}')
+            for labels, value in sorted(series.get(name, []), key=lambda item: item[0]):
+                if kind == 'counter':
+                    lines.append(f'{full_name}{_labels(labels)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), value['buckets']):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{full_name}_bucket{_labels(labels + [["le", le]])} {cumulative}')
+                lines.append(f'{full_name}_sum{_labels(labels)} {value["sum"]}')
+                lines.append(f'{full_name}_count{_labels(labels)} {value["count"]}')
+        return '\n'.join(lines) + '\n'
+
+def _read_values(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _add_values(totals, values):
+    for key, value in values.items():
+        if isinstance(value, dict):
+            total = totals.setdefault(key, {'buckets': [0] * len(value['buckets']), 'sum': 0.0, 'count': 0})
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], value['buckets'])]
+            total['sum'] += value['sum']
+            total['count'] += value['count']
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+def _process_alive(pid):
+    # pid được cấp lại cho process khác thì file cũ chỉ được gộp ở lần khởi động sau, không bị gộp nhầm
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+class Timings:
+    def __init__(self, profiler=None):
+        self.durations = {}
+        self.profiler = profiler
+        self._stack = []
+        self._started = None
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def push(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            self.add(self._stack[-1], now - self._started)
+        self._stack.append(name)
+        self._started = now
+
+    def pop(self):
+        now = time.perf_counter()
+        self.add(self._stack.pop(), now - self._started)
+        self._started = now
+
+    def server_timing(self):
+        return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.durations.items())
+
+_local = threading.local()
+
+def current_timings():
+    return getattr(_local, 'timings', None)
+
+@contextmanager
+def activate(timings):
+    # Gắn timings vào thread hiện tại (và bật profiler nếu có) trong phạm vi with
+    previous = current_timings()
+    _local.timings = timings
+    if timings is not None and timings.profiler is not None:
+        timings.profiler.enable()
+    try:
+        yield timings
+    finally:
+        if timings is not None and timings.profiler is not None:
+            timings.profiler.disable()
+        _local.timings = previous
+
+@contextmanager
+def stage(name):
+    timings = current_timings()
+    if timings is None:
+        yield
+        return
+    timings.push(name)
+    try:
+        yield
+    finally:
+        timings.pop()
+
+def timed_iter(name, iterable):
+    # Thời gian sinh mỗi phần tử được tính cho giai đoạn name
+    it = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+def iter_activated(timings, iterable):
+    # Response dạng luồng được duyệt sau khi view trả về (hoặc trong thread của job): gắn lại timings cho mỗi lần next
+    it = iter(iterable)
+    try:
+        while True:
+            with activate(timings):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        close = getattr(it, 'close', None)
+        if close is not None:
+            with activate(timings):
+                close()
@@ -0,0 +1,331 @@
+import csv
+import math
+import os
+from itertools import chain
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from classification import Classifier, load_config
+from ingest import CLF_COLUMNS, ParseErrors, clf_converter, open_csv
+from metrics import Timings, activate, stage
+from uploads import Upload
+
+# Phần sinh kết quả thuần, chạy được trong process render: hình học và Placemark của cell, chuyển đổi CSV -> CLF.
+# Process con của worker_pool (forkserver/spawn) chỉ import module này chứ không import app, nên module không được
+# có side effect lúc import (cache, thư mục dùng chung, thread...); bảng phân loại chỉ đọc CLASSIFICATION_CONFIG.
+
+
+# Bảng phân loại công nghệ/tần số/lớp lưu lượng, có thể thay bằng file JSON/YAML qua CLASSIFICATION_CONFIG
+classifier = Classifier(load_config(os.environ.get('CLASSIFICATION_CONFIG')))
+
+CELL_BATCH_SIZE = 2000
+PROGRESS_INTERVAL = 5000
+
+# Logic Coverage KMZ từ mã gốc
+SECTOR_STEPS = 12
+CIRCLE_STEPS = 24
+
+# Chế độ rút gọn (compact=1): toạ độ làm tròn còn precision chữ số thập phân và bỏ độ cao ",0";
+# số đoạn của cung/hình tròn giảm theo bán kính sao cho mỗi đoạn không dài quá max_segment (độ);
+# thông tin cell/site nằm trong ExtendedData, bảng HTML dùng chung đặt một lần trong BalloonStyle của Style
+COMPACT_PRECISION = 5
+COMPACT_MAX_SEGMENT = 0.0001
+MIN_SECTOR_STEPS = 2
+MIN_CIRCLE_STEPS = 8
+
+_circle_tables = {}
+_sector_tables = {}
+
+def circle_table(steps):
+    # Bảng sin/cos đơn vị cho hình tròn steps đoạn (không phụ thuộc cell)
+    table = _circle_tables.get(steps)
+    if table is None:
+        table = _circle_tables[steps] = (np.array([math.cos(2 * math.pi * i / steps) for i in range(steps + 1)]),
+                                         np.array([math.sin(2 * math.pi * i / steps) for i in range(steps + 1)]))
+    return table
+
+def sector_table(beamwidth, steps=SECTOR_STEPS):
+    # Góc lệch so với hướng anten, thêm tâm site (hệ số 0) ở hai đầu đa giác
+    table = _sector_tables.get((beamwidth, steps))
+    if table is None:
+        offsets = [math.pi * (i * beamwidth / steps - beamwidth / 2) / 180
+                   for i in range(steps, -1, -1)]
+        cos_off = np.array([0.0] + [math.cos(o) for o in offsets] + [0.0])
+        sin_off = np.array([0.0] + [math.sin(o) for o in offsets] + [0.0])
+        table = _sector_tables[(beamwidth, steps)] = (cos_off, sin_off)
+    return table
+
+def polygon_steps(radius, beamwidths, sector, max_segment):
+    # Số đoạn trên cung (sector) hoặc đường tròn: mỗi đoạn dài tối đa max_segment, không nhiều hơn định dạng gốc
+    arc = radius * np.where(sector, np.radians(beamwidths), 2 * np.pi)
+    steps = np.clip(np.ceil(arc / max_segment), np.where(sector, MIN_SECTOR_STEPS, MIN_CIRCLE_STEPS),
+                    np.where(sector, SECTOR_STEPS, CIRCLE_STEPS))
+    return steps.astype(np.int64)
+
+def cell_params(cells, site_cell_counts, site_has_ibc):
+    # Tham số của cả bảng cell: công nghệ, tần số (list), bán kính, beamwidth, lớp lưu lượng (mảng)
+    system_techs = [classifier.tech(system) for system in cells.systems]
+    systems, frequencies = cells.systems, cells.frequencies
+    techs = [system_techs[k] for k in cells.system.tolist()]
+    freqs = [classifier.frequency(frequencies[f], systems[k])
+             for k, f in zip(cells.system.tolist(), cells.frequency.tolist())]
+    configs = np.array([classifier.beam_config(tech, freq) for tech, freq in zip(techs, freqs)],
+                       dtype=np.float64).reshape(-1, 5)
+    known = configs[:, 4] == 1
+    cell_type = cells.type
+    ibc = cell_type == 2
+    radius = np.where(ibc, configs[:, 2], configs[:, 0])
+    beamwidth = np.where(ibc, configs[:, 3], configs[:, 1])
+
+    # Nhân lần lượt từng hệ số (đúng thứ tự như tính cho từng cell) để bán kính không đổi so với tính từng cell
+    counts = site_cell_counts[cells.site]
+    radius = radius * np.where(known & (counts > 3), 0.7, np.where(known & (counts > 1), 0.85, 1.0))
+    radius = radius * np.where(cell_type == 1, np.where(known, 0.1, 0.3), 1.0)
+    radius = radius * np.where(known & ibc, 0.3, 1.0)
+    radius = radius * np.where(known & (cell_type == 1) & site_has_ibc[cells.site], 0.5, 1.0)
+
+    layers = classifier.data_layers(cells.data_usage, techs)
+    return techs, freqs, radius, beamwidth, layers
+
+def format_coordinates(xs, ys, precision=None):
+    # Định dạng cả ma trận toạ độ một lần bằng repr của list (chạy trong C), mỗi hàng là một chuỗi <coordinates>.
+    # Cột phụ inf/-inf đánh dấu cuối mỗi đỉnh/cuối mỗi hàng rồi được thay bằng ",0\n".
+    # precision: làm tròn toạ độ, bỏ độ cao, các đỉnh cách nhau bằng dấu cách (chế độ rút gọn)
+    xs = xs if precision is None else np.round(xs, precision)
+    ys = ys if precision is None else np.round(ys, precision)
+    if not (np.isfinite(xs).all() and np.isfinite(ys).all()):
+        # Dấu phân cách inf/-inf sẽ lẫn với dữ liệu: định dạng từng đỉnh
+        return _format_coordinates_rows(xs, ys, precision)
+    vertices = np.empty(xs.shape + (3,))
+    vertices[..., 0] = xs
+    vertices[..., 1] = ys
+    vertices[..., 2] = np.inf
+    vertices[:, -1, 2] = -np.inf
+    text = repr(vertices.ravel().tolist())[1:-1] + ', '
+    if precision is None:
+        text = text.replace(', -inf, ', ',0\n\x00').replace(', inf, ', ',0\n').replace(', ', ',')
+    else:
+        text = text.replace(', -inf, ', '\n\x00').replace(', inf, ', ' ').replace(', ', ',')
+    rows = text.split('\x00')[:-1]
+    if len(rows) != len(xs):
+        raise ValueError(f"format_coordinates produced {len(rows)} rows for {len(xs)} polygons")
+    return rows
+
+def _format_coordinates_rows(xs, ys, precision=None):
+    if precision is None:
+        return [''.join(f'{x},{y},0\n' for x, y in zip(row_x, row_y))
+                for row_x, row_y in zip(xs.tolist(), ys.tolist())]
+    return [' '.join(f'{x},{y}' for x, y in zip(row_x, row_y)) + '\n'
+            for row_x, row_y in zip(xs.tolist(), ys.tolist())]
+
+def cell_vertices(cells, sites, radius, beamwidths, steps):
+    # Đỉnh đa giác sector/hình tròn theo từng nhóm cùng hình dạng: (chỉ số cell, xs, ys), mỗi hàng là một cell.
+    # cells: CellTable, sites: SiteTable; toạ độ site được lấy theo cột chỉ số site; steps: số đoạn của từng cell
+    lon = sites.lon[cells.site]
+    lat = sites.lat[cells.site]
+    azimuth = np.radians(cells.azimuth)
+    sin_az, cos_az = np.sin(azimuth), np.cos(azimuth)
+
+    # Đỉnh sector tính bằng công thức cộng góc từ sin/cos của azimuth và bảng góc lệch, nên so với
+    # sin/cos(azimuth + góc lệch) của từng đỉnh như mã gốc, chữ số cuối của một số toạ độ có thể khác (~1e-15 độ)
+    # Nhóm cell theo hình dạng và số đoạn: sector theo beamwidth (-1 là hình tròn)
+    shapes = np.where(cells.type == 0, beamwidths, -1.0)
+    for beamwidth, n in sorted(set(zip(shapes.tolist(), steps.tolist()))):
+        idx = np.flatnonzero((shapes == beamwidth) & (steps == n))
+        r = radius[idx, None]
+        if beamwidth == -1.0:
+            cos_circle, sin_circle = circle_table(n)
+            xs = lon[idx, None] + r * cos_circle
+            ys = lat[idx, None] + r * sin_circle
+        else:
+            cos_off, sin_off = sector_table(beamwidth, n)
+            s, c = sin_az[idx, None], cos_az[idx, None]
+            xs = lon[idx, None] + r * (s * cos_off + c * sin_off)
+            ys = lat[idx, None] + r * (c * cos_off - s * sin_off)
+        yield idx, xs, ys
+
+def cell_geometries(cells, sites, radius, beamwidths, compact=None):
+    # compact: None (định dạng gốc) hoặc (precision, max_segment)
+    precision = None if compact is None else compact[0]
+    sector = cells.type == 0
+    if compact is None:
+        steps = np.where(sector, SECTOR_STEPS, CIRCLE_STEPS)
+    else:
+        steps = polygon_steps(radius, beamwidths, sector, compact[1])
+
+    polygons = [None] * len(cells)
+    for idx, xs, ys in cell_vertices(cells, sites, radius, beamwidths, steps):
+        for k, text in zip(idx.tolist(), format_coordinates(xs, ys, precision)):
+            polygons[k] = text
+
+    lon = sites.lon[cells.site]
+    lat = sites.lat[cells.site]
+    azimuth = np.radians(cells.azimuth)
+    sin_az, cos_az = np.sin(azimuth), np.cos(azimuth)
+
+    # Tia hướng anten của cell IBC
+    beams = [None] * len(cells)
+    idx = np.flatnonzero(cells.type == 2)
+    if len(idx):
+        beam_length = radius[idx] * 1.2
+        xs = np.stack([lon[idx], lon[idx] + beam_length * sin_az[idx]], axis=1)
+        ys = np.stack([lat[idx], lat[idx] + beam_length * cos_az[idx]], axis=1)
+        for k, text in zip(idx.tolist(), format_coordinates(xs, ys, precision)):
+            beams[k] = text
+    return polygons, beams
+
+def render_cell(cell, tech, freq, layer, polygon, beam):
+    kml_lines = []
+    kml_lines.append(f'<Placemark>\n<name>{cell.cell_name}</name>\n')
+    kml_lines.append('<Snippet maxLines="0"></Snippet>\n')
+    kml_lines.append('<description><![CDATA[\n<h3>Thông tin Cell</h3>\n<table border="1" cellpadding="3">\n')
+    kml_lines.append(f'<tr><td><b>Công nghệ</b></td><td>{tech}</td></tr>\n')
+    kml_lines.append(f'<tr><td><b>Tần số</b></td><td>{freq}</td></tr>\n')
+    kml_lines.append(f'<tr><td><b>Nhà cung cấp</b></td><td>{cell.vendor}</td></tr>\n')
+    kml_lines.append(f'<tr><td><b>Hướng anten</b></td><td>{cell.azimuth}°</td></tr>\n')
+    if tech == '2G':
+        kml_lines.append(f'<tr><td><b>Lưu lượng dữ liệu</b></td><td>{cell.data_usage:,.2f} Erl</td></tr>\n')
+    else:
+        kml_lines.append(f'<tr><td><b>Lưu lượng dữ liệu</b></td><td>{cell.data_usage:,.2f} GB</td></tr>\n')
+    kml_lines.append('</table>\n]]></description>\n')
+    kml_lines.append(f'<styleUrl>#Style_L{layer}</styleUrl>\n')
+    kml_lines.append('<Polygon>\n<outerBoundaryIs>\n<LinearRing>\n<coordinates>\n')
+    kml_lines.append(polygon)
+    kml_lines.append('</coordinates>\n</LinearRing>\n</outerBoundaryIs>\n</Polygon>\n')
+    
+    if beam is not None:
+        kml_lines.append('<Placemark>\n')
+        kml_lines.append(f'<name>{cell.cell_name}_beam</name>\n')
+        kml_lines.append('<Snippet maxLines="0"></Snippet>\n')
+        kml_lines.append('<LineString>\n<coordinates>\n')
+        kml_lines.append(beam)
+        kml_lines.append('</coordinates>\n</LineString>\n')
+        kml_lines.append(f'<styleUrl>#Style_L{layer}</styleUrl>\n')
+        kml_lines.append('</Placemark>\n')
+    
+    kml_lines.append('</Placemark>\n')
+    return ''.join(kml_lines)
+
+def render_compact_cell(cell, tech, freq, layer, polygon, beam):
+    # Bảng thông tin cell được dựng từ ExtendedData bởi BalloonStyle của Style_L{layer}.
+    # Giá trị nằm ngoài CDATA nên chuỗi lấy từ CSV phải escape (vd. VENDOR=AT&T)
+    unit = 'Erl' if tech == '2G' else 'GB'
+    name = escape(cell.cell_name)
+    kml_lines = []
+    kml_lines.append(f'<Placemark><name>{name}</name><styleUrl>#Style_L{layer}</styleUrl>\n')
+    kml_lines.append(f'<ExtendedData><Data name="tech"><value>{escape(tech)}</value></Data>'
+                     f'<Data name="freq"><value>{escape(freq)}</value></Data>'
+                     f'<Data name="vendor"><value>{escape(cell.vendor)}</value></Data>'
+                     f'<Data name="azimuth"><value>{cell.azimuth}</value></Data>'
+                     f'<Data name="data"><value>{cell.data_usage:,.2f} {unit}</value></Data></ExtendedData>\n')
+    kml_lines.append('<Polygon><outerBoundaryIs><LinearRing><coordinates>')
+    kml_lines.append(polygon)
+    kml_lines.append('</coordinates></LinearRing></outerBoundaryIs></Polygon>\n')
+    if beam is not None:
+        kml_lines.append(f'<Placemark><name>{name}_beam</name><styleUrl>#Style_L{layer}</styleUrl>'
+                         f'<LineString><coordinates>{beam}</coordinates></LineString></Placemark>\n')
+    kml_lines.append('</Placemark>\n')
+    return ''.join(kml_lines)
+
+def render_cells(cells, sites, site_cell_counts, site_has_ibc, compact=None):
+    with stage('geometry'):
+        techs, freqs, radius, beamwidths, layers = cell_params(cells, site_cell_counts, site_has_ibc)
+        polygons, beams = cell_geometries(cells, sites, radius, beamwidths, compact)
+    render = render_cell if compact is None else render_compact_cell
+    with stage('format'):
+        return [render(*row) for row in zip(cells.rows(), techs, freqs, layers.tolist(), polygons, beams)]
+
+def render_chunk(cells, sites, site_cell_counts, site_has_ibc, compact, joined=True):
+    # Trả kèm thời gian từng giai đoạn đo trong process con để cộng vào timings của request.
+    # joined=False: trả danh sách Placemark của từng cell (render tăng dần lưu riêng từng cell vào cache)
+    timings = Timings()
+    with activate(timings):
+        fragments = render_cells(cells, sites, site_cell_counts, site_has_ibc, compact)
+    return (''.join(fragments) if joined else fragments), timings.durations
+
+# Logic Convert CLF từ mã gốc
+CLF_CHUNK_LINES = CELL_BATCH_SIZE
+
+def iter_clf_lines(source, progress=None, errors=None):
+    # Chuyển từng dòng CSV thành một dòng CLF ngay khi đọc (không kèm ký tự xuống dòng).
+    # Kết quả được stream nên dòng lỗi CSV (csv.Error) hay byte không phải UTF-8 (nguồn giải mã bằng
+    # surrogateescape) được ghi vào errors và bỏ qua, thay vì làm đứt response đang gửi
+    reader, columns = open_csv(source, CLF_COLUMNS)
+    convert = clf_converter(columns)
+
+    i = 0
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            if errors is not None:
+                errors.rows += 1
+                errors.add(reader.line_num, str(e))
+            continue
+        i += 1
+        if progress and i % PROGRESS_INTERVAL == 0:
+            progress('converting', i)
+        if not row:
+            continue
+        if errors is not None:
+            errors.rows += 1
+        try:
+            line = convert(row)
+        except IndexError:
+            if errors is not None:
+                errors.add(reader.line_num, f"Expected {len(columns)} fields, got {len(row)}")
+            continue
+        if not line.isascii():
+            try:
+                line.encode('utf-8')
+            except UnicodeEncodeError:
+                if errors is not None:
+                    errors.add(reader.line_num, "Row is not valid UTF-8")
+                continue
+        yield line
+
+def convert_csv_to_clf(csv_content, progress=None, errors=None):
+    clf_lines = list(iter_clf_lines(csv_content, progress, errors))
+    if not clf_lines:
+        raise ValueError("No valid data to convert to CLF.")
+    return '\n'.join(clf_lines)
+
+def iter_clf(upload, progress=None, errors=None):
+    # Các chunk bytes của file CLF, đọc dần từ upload. Dòng đầu tiên được chuyển đổi ngay khi gọi hàm,
+    # để lỗi thiếu cột / không có dữ liệu được báo trước khi response bắt đầu stream.
+    lines = upload.text(errors='surrogateescape')
+    try:
+        clf_lines = iter_clf_lines(lines, progress, errors)
+        first = next(clf_lines, None)
+        if first is None:
+            raise ValueError("No valid data to convert to CLF.")
+    except BaseException:
+        lines.close()
+        raise
+    return _iter_clf_upload(lines, chain([first], clf_lines))
+
+def _iter_clf_upload(lines, clf_lines):
+    with lines:
+        yield from iter_clf_chunks(clf_lines)
+
+def iter_clf_chunks(clf_lines):
+    # Chunk sau bắt đầu bằng '' để join thêm '\n' ở đầu: ghép các chunk lại giống hệt convert_csv_to_clf
+    batch = []
+    for line in clf_lines:
+        batch.append(line)
+        if len(batch) >= CLF_CHUNK_LINES:
+            yield '\n'.join(batch).encode('utf-8')
+            batch = ['']
+    if batch and batch != ['']:
+        yield '\n'.join(batch).encode('utf-8')
+
+def convert_clf_file(src_path, dst_path, max_decompressed=None):
+    # Chạy trong process con: chuyển đổi một file upload, trả về ParseErrors của file đó
+    errors = ParseErrors()
+    with open(src_path, 'rb') as f, open(dst_path, 'wb') as out:
+        for chunk in iter_clf(Upload(f, max_decompressed), errors=errors):
+            out.write(chunk)
+    return errors
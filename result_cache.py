@@ -0,0 +1,81 @@
+import hashlib
+import os
+import tempfile
+
+from storage import private_directory
+
+# Cache kết quả KMZ/CLF trên đĩa, khoá theo digest nội dung upload + tham số.
+# Các gunicorn worker dùng chung thư mục; ghi qua file tạm rồi os.replace nên không worker nào đọc phải file dở dang.
+# LRU dựa trên mtime: mỗi lần đọc trúng cache sẽ cập nhật mtime, khi vượt dung lượng thì xoá file cũ nhất.
+
+class ResultCache:
+    def __init__(self, directory, max_bytes, version='1'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version
+        private_directory(directory)
+
+    def key(self, kind, upload_digest, *params):
+        # upload_digest: sha256 của upload (Upload.digest) đã tính khi đọc upload, không phải băm lại nội dung
+        digest = hashlib.sha256()
+        for part in (self.version, kind, *params, upload_digest):
+            digest.update(str(part).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def open(self, key):
+        path = self._path(key)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    def store(self, key, chunks):
+        # Vừa trả từng chunk cho client vừa ghi vào cache; chỉ lưu khi sinh xong toàn bộ
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        stored = False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, self._path(key))
+            stored = True
+            self._evict()
+        finally:
+            if not stored:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp') or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
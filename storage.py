@@ -0,0 +1,14 @@
+import os
+import stat
+
+# Thư mục lưu dữ liệu dùng chung giữa các gunicorn worker (cache, job, số liệu, dataset).
+# Mặc định chúng nằm dưới /tmp: user khác có thể tạo trước thư mục cùng tên và đặt sẵn file trong đó,
+# nên chỉ nhận thư mục của chính user này và không ai khác ghi được.
+
+def private_directory(directory):
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"Directory {directory!r} must be owned by the current user "
+                              f"and not writable by others")
+    return directory
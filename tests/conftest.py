@@ -0,0 +1,40 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app đọc cấu hình từ biến môi trường lúc import: cache/job/metrics/dataset nằm trong thư mục riêng của lượt test,
+# cell được render ngay trong process
+SCRATCH = tempfile.mkdtemp(prefix='network-visualization-tests-')
+for name in ('RESULT_CACHE_DIR', 'JOBS_DIR', 'METRICS_DIR', 'DATASET_DIR'):
+    os.environ[name] = os.path.join(SCRATCH, name.lower())
+os.environ['FRAGMENT_CACHE_PATH'] = os.path.join(SCRATCH, 'fragments.sqlite3')
+os.environ['RENDER_WORKERS'] = '1'
+
+from benchmarks.synthetic import write_network_csv  # noqa: E402
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SCRATCH, ignore_errors=True)
+
+@pytest.fixture(scope='session')
+def network_csv():
+    f = io.StringIO()
+    write_network_csv(f, 600)
+    return f.getvalue()
+
+@pytest.fixture(scope='session')
+def source(network_csv):
+    import app
+    sites, cells, _ = app.parse_coverage_csv(network_csv.splitlines(True))
+    return app.prepare_dataset((sites, cells))
+
+@pytest.fixture
+def client():
+    import app
+    return app.app.test_client()
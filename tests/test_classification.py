@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from classification import DEFAULT_CONFIG, Classifier
+
+@pytest.fixture(scope='module')
+def classifier():
+    return Classifier(DEFAULT_CONFIG)
+
+@pytest.mark.parametrize('usage, layer', [
+    (0, 1), (50, 1), (50.5, 2), (200, 2), (201, 3), (1000, 3),
+    # Nhánh 5G của mã gốc xét > 1000 trước > 5000 nên lớp 4 không bao giờ tới được
+    (1000.5, 4), (5000, 4), (5001, 5), (10000, 5), (10001, 6),
+])
+def test_5g_layers(classifier, usage, layer):
+    assert classifier.data_layers([usage], ['5G']).tolist() == [layer]
+
+@pytest.mark.parametrize('tech, usage, layer', [
+    ('2G', 1, 1), ('2G', 1.5, 2), ('2G', 30, 4), ('2G', 31, 5),
+    ('3G', 0.3, 1), ('3G', 0.31, 2), ('3G', 5, 4), ('3G', 6, 5),
+    ('4G', 10, 1), ('4G', 11, 2), ('4G', 500, 4), ('4G', 501, 5),
+])
+def test_other_tech_layers(classifier, tech, usage, layer):
+    assert classifier.data_layers([usage], [tech]).tolist() == [layer]
+
+def test_layers_for_mixed_column(classifier):
+    usage = [2000, 2000, 2000, np.nan]
+    techs = ['5G', '4G', 'WIFI', '5G']
+    # Công nghệ lạ dùng ngưỡng 'default'; giá trị rỗng (nan) là lớp 1
+    assert classifier.data_layers(usage, techs).tolist() == [4, 5, 4, 1]
+
+def test_unsorted_thresholds_are_sorted():
+    config = dict(DEFAULT_CONFIG, data_layers={'default': [5000, 50, 1000, 200, 10000]})
+    layers = Classifier(config).data_layers([3000, 7000], ['5G', '5G'])
+    assert layers.tolist() == [4, 5]
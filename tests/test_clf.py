@@ -0,0 +1,45 @@
+import csv
+import io
+
+import pytest
+
+import render
+from ingest import CLF_FIELDS, ParseErrors
+
+@pytest.mark.parametrize('count', [0, 1, 2, 3, 4, 6, 7, 10])
+def test_iter_clf_chunks_join_parity(monkeypatch, count):
+    monkeypatch.setattr(render, 'CLF_CHUNK_LINES', 3)
+    lines = [f'line {i}' for i in range(count)]
+    chunks = list(render.iter_clf_chunks(iter(lines)))
+    assert b''.join(chunks) == '\n'.join(lines).encode('utf-8')
+    assert all(chunks)
+    assert all(chunk.count(b'\n') <= 3 for chunk in chunks)
+
+def test_iter_clf_chunks_matches_convert_csv_to_clf(monkeypatch, network_csv):
+    monkeypatch.setattr(render, 'CLF_CHUNK_LINES', 7)
+    expected = render.convert_csv_to_clf(network_csv.splitlines(True))
+    chunks = render.iter_clf_chunks(render.iter_clf_lines(network_csv.splitlines(True)))
+    assert b''.join(chunks).decode('utf-8') == expected
+
+def test_iter_clf_lines_records_bad_rows():
+    header = ','.join(CLF_FIELDS)
+    good = ','.join(str(i) for i in range(len(CLF_FIELDS)))
+    text = '\n'.join([header, good, good.replace('0', 'x\udcff', 1), ','.join(['1', '2']), good]) + '\n'
+    errors = ParseErrors()
+    lines = list(render.iter_clf_lines(io.StringIO(text), errors=errors))
+    assert len(lines) == 2
+    assert errors.rows == 4
+    assert [sample['line'] for sample in errors.samples] == [3, 4]
+
+def test_iter_clf_lines_records_csv_errors():
+    header = ','.join(CLF_FIELDS)
+    good = ','.join(str(i) for i in range(len(CLF_FIELDS)))
+    text = '\n'.join([header, good, 'x' * 100 + good, good]) + '\n'
+    errors = ParseErrors()
+    limit = csv.field_size_limit(64)
+    try:
+        lines = list(render.iter_clf_lines(io.StringIO(text), errors=errors))
+    finally:
+        csv.field_size_limit(limit)
+    assert len(lines) == 2
+    assert errors.count == 1
@@ -0,0 +1,44 @@
+import io
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pytest
+
+# Giá trị có ký tự đặc biệt của XML trong các cột văn bản
+SPECIAL = {'VENDOR': 'AT&T', 'DESC': 'Roof & <Tower>', 'PROVINCE': 'A&B'}
+
+def special_csv(network_csv):
+    lines = network_csv.splitlines()
+    header = lines[0].split(',')
+    for k in range(1, len(lines)):
+        row = lines[k].split(',')
+        for column, value in SPECIAL.items():
+            row[header.index(column)] = value
+        for column in ('SITEID', 'CELLNAME'):
+            row[header.index(column)] += '&<x>'
+        lines[k] = ','.join(row)
+    return '\n'.join(lines) + '\n'
+
+def kml_documents(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        return [z.read(name) for name in z.namelist() if name.endswith('.kml')]
+
+@pytest.mark.parametrize('path', ['/coverage-kmz', '/points-kmz'])
+@pytest.mark.parametrize('tiled', [False, True])
+def test_compact_kml_is_well_formed(client, network_csv, path, tiled):
+    form = {'file': (io.BytesIO(special_csv(network_csv).encode('utf-8')), 'network.csv'), 'compact': '1'}
+    if tiled:
+        form.update(tiled='1', tile_max_features='100')
+    r = client.post(path, data=form, content_type='multipart/form-data')
+    assert r.status_code == 200, r.data
+
+    documents = kml_documents(r.data)
+    assert len(documents) > (1 if tiled else 0)
+    names, values = set(), set()
+    for document in documents:
+        root = ET.fromstring(document)
+        names.update(element.text for element in root.iter('{http://www.opengis.net/kml/2.2}name'))
+        values.update(element.text for element in root.iter('{http://www.opengis.net/kml/2.2}value'))
+    assert any(name.endswith('&<x>') for name in names if name)
+    if path == '/coverage-kmz' and not tiled:
+        assert {'AT&T', 'Roof & <Tower>', 'A&B'} <= values
@@ -0,0 +1,81 @@
+import io
+
+import numpy as np
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import app
+
+def filters(**values):
+    return app.dataset_filters(MultiDict(values))
+
+def test_dataset_filters():
+    assert filters() == ()
+    assert filters(bbox='105,20,106.5,21', tech='5G, 4G,4G', LAYER='3,1', plt='2') == (
+        ('bbox', (105.0, 20.0, 106.5, 21.0)), ('tech', ('4G', '5G')), ('layer', (1, 3)), ('plt', (2,)))
+
+@pytest.mark.parametrize('values', [{'bbox': '105,20,106'}, {'bbox': 'a,b,c,d'}, {'bbox': '1,2,3,4,5'},
+                                    {'layer': 'x'}, {'plt': '1,two'}])
+def test_malformed_filters(values):
+    with pytest.raises(app.DatasetQueryError) as info:
+        filters(**values)
+    assert info.value.status == 400
+
+def test_select_dataset(source):
+    techs = sorted(set(source['techs']))
+    sites, cells, site_cell_counts, site_has_ibc = app.select_dataset(source, (('tech', (techs[0],)),))
+    expected = np.flatnonzero(source['tech_array'] == techs[0])
+    assert len(cells) == len(expected)
+    assert list(cells.cell_name) == [source['cells'].cell_name[k] for k in expected]
+    # Chỉ số site được đánh lại theo tập site con; số cell của site vẫn tính trên toàn dataset
+    site_ids = np.asarray(source['sites'].ids)
+    assert np.asarray(sites.ids)[cells.site].tolist() == site_ids[source['cells'].site[expected]].tolist()
+    assert site_cell_counts.tolist() == source['site_cell_counts'][np.unique(source['cells'].site[expected])].tolist()
+
+def test_select_dataset_combines_filters(source):
+    lon, lat = source['cell_lon'], source['cell_lat']
+    bbox = (float(np.median(lon)), float(lat.min()), float(lon.max()), float(np.median(lat)))
+    layer = int(source['layers'][0])
+    _, cells, _, _ = app.select_dataset(source, (('bbox', bbox), ('layer', (layer,))))
+    mask = (lon >= bbox[0]) & (lon <= bbox[2]) & (lat >= bbox[1]) & (lat <= bbox[3]) & (source['layers'] == layer)
+    assert len(cells) == mask.sum() > 0
+
+def test_select_dataset_without_match(source):
+    with pytest.raises(app.DatasetQueryError) as info:
+        app.select_dataset(source, (('tech', ('9G',)),))
+    assert info.value.status == 404
+
+@pytest.fixture
+def dataset_id(client, network_csv):
+    form = {'file': (io.BytesIO(network_csv.encode('utf-8')), 'network.csv')}
+    r = client.post('/datasets', data=form, content_type='multipart/form-data')
+    assert r.status_code == 201, r.data
+    return r.get_json()['dataset']
+
+def test_created_dataset_is_kept_loaded(dataset_id):
+    # Bản đã prepare khi tạo dataset được dùng luôn, không nạp lại từ file
+    def prepare(tables):
+        raise AssertionError("dataset was prepared again")
+    assert app.dataset_store.load(dataset_id, prepare) is not None
+
+def test_dataset_query_errors(client, dataset_id):
+    assert client.get(f'/datasets/{dataset_id}/clf?bbox=1,2,3').status_code == 400
+    assert client.get(f'/datasets/{dataset_id}/clf?layer=x').status_code == 400
+    r = client.get(f'/datasets/{dataset_id}/clf?tech=9G')
+    assert r.status_code == 404
+    assert r.get_json()['error'] == "No cells match the filters."
+    assert client.get('/datasets/' + '0' * 64 + '/clf').status_code == 404
+
+def test_dataset_query_filters_cells(client, dataset_id, source):
+    tech = sorted(set(source['techs']))[0]
+    r = client.get(f'/datasets/{dataset_id}/clf?tech={tech}')
+    assert r.status_code == 200
+    assert int(r.headers['X-Cells']) == int((source['tech_array'] == tech).sum())
+
+def test_tile_times_dataset_load(client, dataset_id, monkeypatch):
+    # Cùng tên giai đoạn 'load' như truy vấn dataset
+    monkeypatch.setattr(app, 'tile_cache', app.TileCache(1024 * 1024))
+    r = client.get(f'/tiles/sites/0/0/0.pbf?dataset={dataset_id}')
+    assert r.status_code == 200
+    stages = [item.split(';')[0] for item in r.headers['Server-Timing'].split(', ')]
+    assert 'load' in stages and 'parse' not in stages
@@ -0,0 +1,47 @@
+import io
+import json
+import zipfile
+
+def post_export(client, csv_text, **form):
+    form['file'] = (io.BytesIO(csv_text.encode('utf-8')), 'network.csv')
+    r = client.post('/export', data=form, content_type='multipart/form-data')
+    assert r.status_code == 200, r.data
+    return zipfile.ZipFile(io.BytesIO(r.get_data())), r.headers
+
+def test_export_manifest(client, network_csv):
+    z, headers = post_export(client, network_csv)
+    assert z.namelist() == ['manifest.json', 'Network_Coverage.kmz', 'Network_Sites.kmz', 'Network.clf']
+    manifest = json.loads(z.read('manifest.json'))
+    rows = len(network_csv.splitlines()) - 1
+    assert manifest['rows'] == rows
+    assert [item['artifact'] for item in manifest['artifacts']] == ['coverage-kmz', 'points-kmz', 'convert-clf']
+    assert [item['file'] for item in manifest['artifacts']] == z.namelist()[1:]
+    assert all(item['error'] is None and item['rows'] == rows for item in manifest['artifacts'])
+    assert headers['X-Files'] == '3' and headers['X-Rows'] == str(rows)
+    # KMZ nằm nguyên trong zip ngoài và vẫn là KMZ hợp lệ
+    assert z.getinfo('Network_Coverage.kmz').compress_type == zipfile.ZIP_STORED
+    with zipfile.ZipFile(io.BytesIO(z.read('Network_Coverage.kmz'))) as kmz:
+        assert kmz.namelist() == ['doc.kml']
+
+def test_export_records_failed_artifact(client, network_csv):
+    # Cột của points-kmz đủ nhưng không dòng nào là cell hợp lệ: coverage-kmz lỗi, points-kmz vẫn xuất
+    lines = network_csv.splitlines()
+    header = lines[0].split(',')
+    rows = []
+    for line in lines[1:20]:
+        values = line.split(',')
+        values[header.index('AZIMUTH')] = 'x'
+        rows.append(','.join(values))
+    z, headers = post_export(client, '\n'.join([lines[0]] + rows) + '\n', artifacts='coverage-kmz,points-kmz')
+    manifest = json.loads(z.read('manifest.json'))
+    coverage, points = manifest['artifacts']
+    assert coverage['file'] is None and coverage['error']
+    assert points['file'] == 'Network_Sites.kmz' and points['error'] is None
+    assert z.namelist() == ['manifest.json', 'Network_Sites.kmz']
+    assert headers['X-Files'] == '1'
+
+def test_export_unknown_artifact(client, network_csv):
+    form = {'file': (io.BytesIO(network_csv.encode('utf-8')), 'network.csv'), 'artifacts': 'nope'}
+    r = client.post('/export', data=form, content_type='multipart/form-data')
+    assert r.status_code == 500
+    assert 'Unknown artifact' in r.get_json()['error']
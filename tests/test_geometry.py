@@ -0,0 +1,71 @@
+import math
+
+import numpy as np
+import pytest
+
+import render
+
+def reference(xs, ys, precision=None):
+    # Cách định dạng ban đầu: f-string cho từng đỉnh
+    if precision is None:
+        return [''.join(f'{x},{y},0\n' for x, y in zip(row_x, row_y)) for row_x, row_y in zip(xs.tolist(), ys.tolist())]
+    xs, ys = np.round(xs, precision), np.round(ys, precision)
+    return [' '.join(f'{x},{y}' for x, y in zip(row_x, row_y)) + '\n'
+            for row_x, row_y in zip(xs.tolist(), ys.tolist())]
+
+def coordinates(rows, cols, seed=0):
+    rng = np.random.default_rng(seed)
+    xs = 105 + rng.standard_normal((rows, cols))
+    ys = 20 + rng.standard_normal((rows, cols))
+    # Giá trị có repr đặc biệt: số nguyên, dạng mũ, số âm, -0.0
+    n = min(xs.size, 4)
+    xs.ravel()[:n] = [106.0, 1e-05, -3.5, -0.0][:n]
+    ys.ravel()[:n] = [1e16, 21.0, -1e-07, 0.1 + 0.2][:n]
+    return xs, ys
+
+@pytest.mark.parametrize('precision', [None, render.COMPACT_PRECISION, 0])
+@pytest.mark.parametrize('shape', [(1, 1), (1, 5), (7, 3), (50, 33)])
+def test_format_matches_per_vertex_format(shape, precision):
+    xs, ys = coordinates(*shape)
+    assert render.format_coordinates(xs, ys, precision) == reference(xs, ys, precision)
+
+@pytest.mark.parametrize('precision', [None, render.COMPACT_PRECISION])
+@pytest.mark.parametrize('value', [np.inf, -np.inf, np.nan])
+def test_format_non_finite_values(value, precision):
+    xs, ys = coordinates(4, 6)
+    xs[1, 2] = value
+    ys[3, 5] = value
+    assert render.format_coordinates(xs, ys, precision) == reference(xs, ys, precision)
+
+def test_format_no_rows():
+    xs = np.empty((0, 4))
+    assert render.format_coordinates(xs, xs) == []
+
+def per_cell_vertices(lon, lat, azimuth, radius, beamwidth, sector):
+    # Công thức của mã gốc cho từng cell
+    if sector:
+        points = [(lon, lat)]
+        for i in range(render.SECTOR_STEPS, -1, -1):
+            angle = math.pi * (azimuth - beamwidth / 2 + i * beamwidth / render.SECTOR_STEPS) / 180
+            points.append((lon + radius * math.sin(angle), lat + radius * math.cos(angle)))
+        points.append((lon, lat))
+    else:
+        points = [(lon + radius * math.cos(2 * math.pi * i / render.CIRCLE_STEPS),
+                   lat + radius * math.sin(2 * math.pi * i / render.CIRCLE_STEPS))
+                  for i in range(render.CIRCLE_STEPS + 1)]
+    return np.array(points)
+
+def test_cell_vertices_match_per_cell_formula(source):
+    # Công thức cộng góc chỉ được lệch ở chữ số cuối so với tính từng đỉnh
+    sites, cells, radius, beamwidths = source['sites'], source['cells'], source['radius'], source['beamwidths']
+    sector = cells.type == 0
+    steps = np.where(sector, render.SECTOR_STEPS, render.CIRCLE_STEPS)
+    checked = 0
+    for idx, xs, ys in render.cell_vertices(cells, sites, radius, beamwidths, steps):
+        for k, row_x, row_y in zip(idx.tolist(), xs, ys):
+            site = cells.site[k]
+            expected = per_cell_vertices(float(sites.lon[site]), float(sites.lat[site]), float(cells.azimuth[k]),
+                                         float(radius[k]), float(beamwidths[k]), bool(sector[k]))
+            np.testing.assert_allclose(np.stack([row_x, row_y], axis=1), expected, rtol=0, atol=1e-12)
+            checked += 1
+    assert checked == len(cells)
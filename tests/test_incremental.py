@@ -0,0 +1,53 @@
+import io
+import zipfile
+
+import pytest
+
+import app
+from benchmarks.synthetic import write_network_csv
+
+def network(seed, rows=300):
+    f = io.StringIO()
+    write_network_csv(f, rows, seed=seed)
+    return f.getvalue()
+
+def change_data(csv_text, row):
+    # Đổi lưu lượng của một dòng: chỉ Placemark của cell đó phải render lại
+    lines = csv_text.splitlines(True)
+    header = lines[0].rstrip('\n').split(',')
+    values = lines[row].rstrip('\n').split(',')
+    values[header.index('DATA')] = '123456.5'
+    lines[row] = ','.join(values) + '\n'
+    return ''.join(lines)
+
+def post(client, csv_text, **form):
+    form['file'] = (io.BytesIO(csv_text.encode('utf-8')), 'network.csv')
+    r = client.post('/coverage-kmz', data=form, content_type='multipart/form-data')
+    assert r.status_code == 200, r.data
+    # Đọc hết và đóng response dạng luồng trước request kế tiếp
+    r.get_data()
+    r.close()
+    return r
+
+def doc_kml(r):
+    with zipfile.ZipFile(io.BytesIO(r.data)) as z:
+        return z.read('doc.kml')
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_incremental_counts_and_output(client, monkeypatch, workers):
+    monkeypatch.setattr(app, 'RENDER_WORKERS', workers)
+    monkeypatch.setattr(app, 'CELL_BATCH_SIZE', 100)
+    first_csv = network(seed=100 + workers)
+    first = post(client, first_csv, incremental='1')
+    total = int(first.headers['X-Cells-Rendered'])
+    assert total > 0
+    assert first.headers['X-Cells-Reused'] == '0'
+
+    second_csv = change_data(first_csv, 5)
+    second = post(client, second_csv, incremental='1')
+    assert second.headers['X-Cells-Reused'] == str(total - 1)
+    assert second.headers['X-Cells-Rendered'] == '1'
+    # Kết quả ghép từ cache giống hệt render toàn bộ (bỏ qua dòng <name> có thời điểm tạo)
+    full = post(client, second_csv)
+    strip = lambda kml: [line for line in kml.splitlines() if b'<name>Network' not in line]
+    assert strip(doc_kml(second)) == strip(doc_kml(full))
@@ -0,0 +1,107 @@
+import io
+import threading
+import time
+
+import pytest
+
+import app
+import render
+from jobs import JobManager, JobQueueFull
+from uploads import Upload
+
+def wait_for(manager, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = manager.status(job_id)
+        if status['status'] in ('done', 'failed'):
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+@pytest.fixture
+def manager(tmp_path):
+    return JobManager(str(tmp_path / 'jobs'), max_workers=1, max_pending=1, ttl=3600)
+
+def upload(data=b'SITEID,LAT,LONG\nA,1,2\n'):
+    return Upload(io.BytesIO(data))
+
+def test_job_lifecycle(manager):
+    release = threading.Event()
+
+    def run(job_upload, params, progress, stats):
+        with job_upload.text() as lines:
+            data = lines.read()
+        progress('rendering', 1)
+        release.wait(10)
+        stats['rows'] = 1
+        yield data.upper().encode('utf-8')
+
+    job_id = manager.submit('convert-clf', upload(), (), run, 'text/plain', 'x.clf')
+    status = manager.status(job_id)
+    assert status['status'] in ('queued', 'running')
+    assert status['progress']['total_rows'] == 1
+    # Hàng đợi đầy (max_pending=1) cho tới khi job đầu xong
+    with pytest.raises(JobQueueFull):
+        manager.submit('convert-clf', upload(), (), run, 'text/plain', 'x.clf')
+    release.set()
+    status = wait_for(manager, job_id)
+    assert status['status'] == 'done'
+    assert status['stats'] == {'rows': 1}
+    assert status['progress'] == {'stage': 'rendering', 'processed': 1, 'total_rows': 1}
+    with open(manager.result_path(job_id), 'rb') as f:
+        assert f.read() == b'SITEID,LAT,LONG\nA,1,2\n'.upper()
+    assert status['size'] == len(b'SITEID,LAT,LONG\nA,1,2\n')
+    # Xong job thì nhận job mới
+    wait_for(manager, manager.submit('convert-clf', upload(), (), run, 'text/plain', 'x.clf'))
+
+def test_failed_job(manager):
+    def run(job_upload, params, progress, stats):
+        raise ValueError("No valid data to create KML.")
+        yield b''
+
+    status = wait_for(manager, manager.submit('coverage-kmz', upload(), (), run, 'text/plain', 'x.kmz'))
+    assert status['status'] == 'failed'
+    assert status['error'] == "No valid data to create KML."
+
+def test_unknown_job(manager):
+    assert manager.status('0' * 32) is None
+    assert manager.status('../x') is None
+    assert manager.result_path('../x') is None
+
+def test_job_endpoints(client, network_csv):
+    form = {'file': (io.BytesIO(network_csv.encode('utf-8')), 'network.csv'), 'kind': 'convert-clf'}
+    r = client.post('/jobs', data=form, content_type='multipart/form-data')
+    assert r.status_code == 202
+    job = r.get_json()
+    status = wait_for(app.job_manager, job['job_id'])
+    assert status['status'] == 'done', status
+    assert client.get(job['status_url']).get_json()['status'] == 'done'
+    result = client.get(job['result_url'])
+    assert result.status_code == 200
+    assert result.data == render.convert_csv_to_clf(network_csv.splitlines(True)).encode('utf-8')
+
+def test_job_not_found_and_unknown_kind(client, network_csv):
+    assert client.get('/jobs/' + '0' * 32).status_code == 404
+    assert client.get('/jobs/' + '0' * 32 + '/result').status_code == 404
+    form = {'file': (io.BytesIO(network_csv.encode('utf-8')), 'network.csv'), 'kind': 'nope'}
+    assert client.post('/jobs', data=form, content_type='multipart/form-data').status_code == 400
+
+def test_pending_job_result_and_full_queue(client, network_csv, manager, monkeypatch):
+    release = threading.Event()
+
+    def run(job_upload, params, progress, stats):
+        release.wait(10)
+        yield b'done'
+
+    monkeypatch.setattr(app, 'job_manager', manager)
+    job_id = manager.submit('convert-clf', upload(), (), run, 'text/plain', 'x.clf')
+    try:
+        assert client.get(f'/jobs/{job_id}/result').status_code == 409
+        form = {'file': (io.BytesIO(network_csv.encode('utf-8')), 'network.csv'), 'kind': 'convert-clf'}
+        r = client.post('/jobs', data=form, content_type='multipart/form-data')
+        assert r.status_code == 429
+        assert 'limit 1' in r.get_json()['error']
+    finally:
+        release.set()
+    wait_for(manager, job_id)
+    assert client.get(f'/jobs/{job_id}/result').data == b'done'
@@ -0,0 +1,46 @@
+import io
+import struct
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+
+import app
+
+def entries(chunks):
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as z:
+        return [(info, z.read(info)) for info in z.infolist()]
+
+def test_entries_carry_current_time():
+    before = datetime.now().replace(microsecond=0) - timedelta(seconds=2)
+    result = entries(app.iter_zip_entries([('doc.kml', [b'<kml/>']), ('files/a.kml', [b'a' * 1000])]))
+    assert [info.filename for info, _ in result] == ['doc.kml', 'files/a.kml']
+    for info, _ in result:
+        assert before <= datetime(*info.date_time) <= datetime.now() + timedelta(seconds=2)
+
+@pytest.mark.parametrize('level', [None, 0, 1, 9])
+def test_compression_level_is_applied(level):
+    data = b''.join(b'<Placemark>%d</Placemark>\n' % k for k in range(5000))
+    (info, content), = entries(app.iter_zip_entries([('doc.kml', [data])], compresslevel=level))
+    assert content == data
+    assert info.compress_type == zipfile.ZIP_DEFLATED
+    if level == 0:
+        assert info.compress_size >= len(data)
+    else:
+        assert info.compress_size < len(data) // 4
+
+def test_zip_file_has_sizes_in_local_headers(tmp_path):
+    # Entry stored phải đọc được khi giải nén dạng luồng: CRC trong local header, không có data descriptor
+    inner = b''.join(app.iter_kmz(['<kml/>']))
+    path = str(tmp_path / 'out.zip')
+    app.write_zip_file(path, [('manifest.json', [b'{}']), ('a.kmz', [inner[:10], inner[10:]])], stored=['a.kmz'])
+    with open(path, 'rb') as f:
+        data = f.read()
+    result = entries([data])
+    assert [info.compress_type for info, _ in result] == [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED]
+    assert result[1][1] == inner
+    for info, _ in result:
+        signature, _, flags, _, _, _, crc = struct.unpack_from('<4s5HL', data, info.header_offset)
+        assert signature == b'PK\x03\x04'
+        assert not flags & 0x08
+        assert crc == info.CRC
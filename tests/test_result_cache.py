@@ -0,0 +1,58 @@
+import io
+import os
+
+import pytest
+
+import app
+from storage import private_directory
+
+def post_coverage(client, network_csv, **headers):
+    form = {'file': (io.BytesIO(network_csv.encode('utf-8')), 'network.csv')}
+    r = client.post('/coverage-kmz', data=form, content_type='multipart/form-data', headers=headers)
+    # Kết quả chỉ vào cache khi đã stream hết
+    r.get_data()
+    r.close()
+    return r
+
+def test_repeated_upload_is_served_from_cache(client, network_csv):
+    first = post_coverage(client, network_csv)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    # ETag là khoá cache; lần sau đọc từ cache nên cùng bytes dù thời điểm trong zip phụ thuộc lúc tạo
+    cached = app.result_cache.open(etag.strip('"'))
+    assert cached is not None
+    with cached:
+        assert cached.read() == first.data
+    second = post_coverage(client, network_csv)
+    assert second.status_code == 200
+    assert second.headers['ETag'] == etag
+    assert second.data == first.data
+
+def test_matching_etag_returns_304(client, network_csv):
+    etag = post_coverage(client, network_csv).headers['ETag']
+    r = post_coverage(client, network_csv, **{'If-None-Match': etag})
+    assert r.status_code == 304
+    assert r.data == b''
+    assert r.headers['ETag'] == etag
+
+def test_etag_depends_on_upload(client, network_csv):
+    etag = post_coverage(client, network_csv).headers['ETag']
+    changed = network_csv + network_csv.splitlines(True)[1]
+    r = post_coverage(client, changed, **{'If-None-Match': etag})
+    assert r.status_code == 200
+    assert r.headers['ETag'] != etag
+
+def test_private_directory_is_created_owner_only(tmp_path):
+    directory = str(tmp_path / 'store')
+    assert private_directory(directory) == directory
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+    # Thư mục đã có, đúng chủ và không cho người khác ghi thì vẫn dùng được
+    private_directory(directory)
+
+@pytest.mark.parametrize('mode', [0o777, 0o775, 0o1777])
+def test_private_directory_rejects_shared_directory(tmp_path, mode):
+    directory = tmp_path / 'shared'
+    directory.mkdir()
+    directory.chmod(mode)
+    with pytest.raises(PermissionError):
+        private_directory(str(directory))
@@ -0,0 +1,45 @@
+import io
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import app
+
+def params(**values):
+    return app.tiling_params(MultiDict(dict(tiled='1', **values)))
+
+def test_tiling_params():
+    assert app.tiling_params(MultiDict()) is None
+    assert params() == (app.TILE_MAX_DEPTH, app.TILE_MAX_FEATURES)
+    assert params(tile_depth='0', tile_max_features='1') == (0, 1)
+    assert params(tile_depth='16') == (16, app.TILE_MAX_FEATURES)
+
+@pytest.mark.parametrize('values', [{'tile_depth': '-1'}, {'tile_depth': '17'}, {'tile_depth': '3000'},
+                                    {'tile_max_features': '0'}, {'tile_max_features': '-5'}])
+def test_tiling_params_out_of_range(values):
+    with pytest.raises(ValueError):
+        params(**values)
+
+def test_tree_splits_until_max_features():
+    points = [(105 + 0.01 * k, 20 + 0.01 * (k % 7), 1, k) for k in range(50)]
+    tree = app.build_tile_tree(points, 16, 4)
+    leaves = app.tile_leaves(tree)
+    assert sorted(item for leaf in leaves for item in leaf['items']) == list(range(50))
+    assert all(len(leaf['items']) <= 4 for leaf in leaves)
+
+def test_tree_stops_at_max_depth():
+    points = [(105 + 0.01 * k, 20, 1, k) for k in range(50)]
+    tree = app.build_tile_tree(points, 0, 1)
+    assert tree['children'] == [] and len(tree['items']) == 50
+
+def test_tree_does_not_split_identical_points():
+    # Các site cùng toạ độ không chia được: giữ trong một lá thay vì tách tới max_depth
+    points = [(105.5, 20.5, 3, k) for k in range(20)]
+    tree = app.build_tile_tree(points, 16, 1)
+    assert tree['children'] == [] and tree['items'] == list(range(20))
+
+def test_tiled_endpoint_rejects_deep_tree(client, network_csv):
+    form = {'file': (io.BytesIO(network_csv.encode('utf-8')), 'network.csv'), 'tiled': '1',
+            'tile_depth': '3000', 'tile_max_features': '0'}
+    r = client.post('/coverage-kmz', data=form, content_type='multipart/form-data')
+    assert 'tile_depth' in r.get_json()['error']
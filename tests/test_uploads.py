@@ -0,0 +1,64 @@
+import gzip
+import io
+import zipfile
+
+import pytest
+
+import app
+from uploads import Upload, UploadTooLarge
+
+def gzipped(data):
+    return gzip.compress(data)
+
+def zipped(data):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('network.csv', data)
+    return buffer.getvalue()
+
+@pytest.mark.parametrize('compress', [gzipped, zipped])
+def test_decompressed_size_within_limit(network_csv, compress):
+    data = network_csv.encode('utf-8')
+    upload = Upload(io.BytesIO(compress(data)), len(data))
+    assert upload.binary().read() == data
+    with upload.text() as lines:
+        assert lines.read() == network_csv
+
+@pytest.mark.parametrize('compress', [gzipped, zipped])
+def test_decompressed_size_over_limit(network_csv, compress):
+    data = network_csv.encode('utf-8')
+    upload = Upload(io.BytesIO(compress(data)), len(data) - 1)
+    with pytest.raises(UploadTooLarge):
+        upload.binary().read()
+    with pytest.raises(UploadTooLarge), upload.text() as lines:
+        for _ in lines:
+            pass
+
+def test_limit_stops_reading_early():
+    # Khối nén rất lớn: lỗi phải báo ngay sau giới hạn chứ không giải nén hết
+    upload = Upload(io.BytesIO(gzipped(b'0' * (64 * 1024 * 1024))), 1024)
+    stream = upload.binary()
+    with pytest.raises(UploadTooLarge):
+        stream.read()
+    assert stream._f.tell() < 4 * 1024 * 1024
+
+def test_uncompressed_upload_is_not_limited(network_csv):
+    data = network_csv.encode('utf-8')
+    assert Upload(io.BytesIO(data), 10).binary().read() == data
+
+def test_endpoint_rejects_large_decompressed_upload(client, network_csv, monkeypatch):
+    monkeypatch.setattr(app, 'UPLOAD_MAX_DECOMPRESSED_BYTES', 1000)
+    r = client.post('/coverage-kmz', data=gzipped(network_csv.encode('utf-8')), content_type='application/gzip')
+    assert r.status_code == 413
+    assert 'exceeds' in r.get_json()['error']
+
+@pytest.mark.parametrize('multipart', [False, True])
+def test_endpoint_rejects_large_request(client, network_csv, monkeypatch, multipart):
+    monkeypatch.setitem(app.app.config, 'MAX_CONTENT_LENGTH', 1000)
+    data = network_csv.encode('utf-8')
+    if multipart:
+        r = client.post('/coverage-kmz', data={'file': (io.BytesIO(data), 'network.csv')},
+                        content_type='multipart/form-data')
+    else:
+        r = client.post('/coverage-kmz', data=data, content_type='text/csv')
+    assert r.status_code == 413
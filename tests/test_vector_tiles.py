@@ -0,0 +1,91 @@
+import math
+
+import mapbox_vector_tile
+import numpy as np
+from shapely.geometry import shape
+
+import app
+from vector_tiles import BUFFER, EXTENT, LayerBuilder, encode_tile, project, tile_ring
+
+def decode(data):
+    return mapbox_vector_tile.decode(data, default_options={'y_coord_down': True})
+
+def tile_of(lon, lat, z):
+    n = 2 ** z
+    lat_rad = math.radians(lat)
+    return int((lon + 180) / 360 * n), int((1 - math.asinh(math.tan(lat_rad)) / math.pi) / 2 * n)
+
+def test_encode_tile_roundtrip():
+    layer = LayerBuilder('test')
+    layer.add_point((10, 20), {'name': 'A', 'plt': 3, 'ratio': 1.5, 'offset': -2, 'ibc': True, 'skip': None},
+                    feature_id=7)
+    layer.add_polygon([(0, 0), (100, 0), (100, 100), (0, 100)], {'name': 'P'}, feature_id=8)
+    tile = decode(encode_tile([layer, LayerBuilder('empty')]))
+
+    assert list(tile) == ['test']
+    assert tile['test']['extent'] == EXTENT
+    point, polygon = tile['test']['features']
+    assert point['id'] == 7
+    assert point['geometry'] == {'type': 'Point', 'coordinates': [10, 20]}
+    assert point['properties'] == {'name': 'A', 'plt': 3, 'ratio': 1.5, 'offset': -2, 'ibc': True}
+    assert polygon['id'] == 8
+    assert polygon['geometry'] == {'type': 'Polygon',
+                                   'coordinates': [[[0, 0], [100, 0], [100, 100], [0, 100], [0, 0]]]}
+    assert polygon['properties'] == {'name': 'P'}
+
+def test_encode_tile_without_features_is_empty():
+    assert encode_tile([LayerBuilder('coverage'), LayerBuilder('sites')]) == b''
+
+def test_tile_ring_outside_or_degenerate():
+    far = np.array([EXTENT + BUFFER + 10.0, EXTENT + BUFFER + 20.0, EXTENT + BUFFER + 15.0])
+    assert tile_ring(far, np.array([10.0, 10.0, 20.0])) is None
+    assert tile_ring(np.array([1.0, 2.0, 3.0]), np.array([1.0, 2.0, 3.0])) is None
+
+def test_tile_ring_clipped_and_clockwise():
+    ring = tile_ring(np.array([-500.0, 5000.0, 5000.0, -500.0]), np.array([-500.0, -500.0, 5000.0, 5000.0]))
+    lo, hi = -BUFFER, EXTENT + BUFFER
+    assert sorted(ring) == sorted([(lo, lo), (hi, lo), (hi, hi), (lo, hi)])
+    area = sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1]))
+    assert area > 0
+
+def test_sites_layer(source):
+    sites = source['sites']
+    z = 13
+    x, y = tile_of(float(sites.lon[0]), float(sites.lat[0]), z)
+    tile = decode(app.build_vector_tile(source, 'sites', z, x, y))
+
+    features = tile['sites']['features']
+    assert features
+    assert any(feature['id'] == 0 for feature in features)
+    for feature in features:
+        i = feature['id']
+        assert feature['properties'] == {'name': sites.ids[i], 'plt': int(sites.plt[i]), 'province': sites.province[i],
+                                         'desc': sites.desc[i], 'vendor': sites.vendor[i]}
+        px, py = project(sites.lon[i], sites.lat[i], z, x, y)
+        assert feature['geometry'] == {'type': 'Point', 'coordinates': [int(np.rint(px)), int(np.rint(py))]}
+
+def test_coverage_layer(source):
+    sites, cells = source['sites'], source['cells']
+    z = 14
+    x, y = tile_of(float(sites.lon[0]), float(sites.lat[0]), z)
+    tile = decode(app.build_vector_tile(source, 'coverage', z, x, y))
+
+    features = tile['coverage']['features']
+    assert features
+    rows = list(cells.rows())
+    lo, hi = -BUFFER, EXTENT + BUFFER
+    for feature in features:
+        i = feature['id']
+        cell = rows[i]
+        assert feature['properties'] == {'name': cell.cell_name, 'tech': source['techs'][i], 'freq': source['freqs'][i],
+                                         'layer': int(source['layers'][i]), 'plt': cell.plt, 'vendor': cell.vendor,
+                                         'type': cell.type}
+        assert feature['geometry']['type'] == 'Polygon'
+        (ring,) = feature['geometry']['coordinates']
+        assert len(ring) >= 4 and ring[0] == ring[-1]
+        assert all(lo <= px <= hi and lo <= py <= hi for px, py in ring)
+        assert shape(feature['geometry']).is_valid
+
+def test_tile_outside_dataset_is_empty(source):
+    assert app.build_vector_tile(source, 'coverage', 10, 0, 0) == b''
+    assert app.build_vector_tile(source, 'sites', 10, 0, 0) == b''
@@ -0,0 +1,158 @@
+import codecs
+import gzip
+import hashlib
+import io
+import shutil
+import tempfile
+import zipfile
+from functools import partial
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File upload được đọc dần từ file tạm (spooled: nhỏ thì giữ trong RAM, lớn thì ghi ra đĩa) thay vì đọc hết vào bytes.
+# Nội dung có thể là CSV thô hoặc CSV nén gzip / zstd / zip, nhận diện theo magic bytes;
+# text() giải nén và giải mã UTF-8 dần theo từng khối để csv.reader đọc từng dòng.
+# Upload không nén được kiểm tra UTF-8 ngay trong lượt tính digest, nên lỗi mã hoá được báo trước khi
+# response bắt đầu stream; upload nén chỉ biết được khi giải nén (xem errors của text()).
+# max_decompressed giới hạn số byte sau giải nén (chống "zip bomb"): đếm ngay khi đọc, vượt thì báo UploadTooLarge.
+
+COPY_CHUNK_SIZE = 1024 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+ZIP_MAGIC = b'PK\x03\x04'
+
+class UploadTooLarge(ValueError):
+    pass
+
+def detect_compression(head):
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    if head.startswith(ZIP_MAGIC):
+        return 'zip'
+    return None
+
+class _KeepOpen(io.BufferedIOBase):
+    # Đóng luồng text bọc ngoài không đóng file upload, để upload còn đọc lại được
+    def __init__(self, f):
+        self._f = f
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._f.read(size)
+
+    read1 = read
+
+class _Limited(io.BufferedIOBase):
+    # Đếm số byte đã giải nén trả ra; đóng luồng này thì đóng luồng giải nén bên trong
+    def __init__(self, f, limit):
+        self._f = f
+        self._limit = limit
+        self._total = 0
+
+    def readable(self):
+        return True
+
+    def _count(self, data):
+        self._total += len(data)
+        if self._total > self._limit:
+            raise UploadTooLarge(f"Decompressed upload exceeds {self._limit} bytes")
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            # Đọc hết theo từng khối để dừng ngay khi vượt giới hạn, không giải nén toàn bộ vào bộ nhớ trước
+            return b''.join(iter(partial(self.read1, COPY_CHUNK_SIZE), b''))
+        return self._count(self._f.read(size))
+
+    def read1(self, size=-1):
+        if size is None or size < 0:
+            size = COPY_CHUNK_SIZE
+        return self._count(self._f.read1(size))
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+def _check_utf8(decoder, chunk, offset, final=False):
+    try:
+        decoder.decode(chunk, final)
+    except UnicodeDecodeError as e:
+        raise ValueError(f"Upload is not valid UTF-8 (near byte {max(offset + e.start, 0)}): {e.reason}") from None
+
+class Upload:
+    def __init__(self, f, max_decompressed=None):
+        # f: file nhị phân seek được; một lượt đọc để tính digest (khoá cache), kích thước và số dòng
+        self.file = f
+        self.max_decompressed = max_decompressed
+        f.seek(0)
+        self.compression = detect_compression(f.read(4))
+        f.seek(0)
+        digest = hashlib.sha256()
+        decoder = None if self.compression else codecs.getincrementaldecoder('utf-8')()
+        size = 0
+        lines = 0
+        while True:
+            chunk = f.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            if decoder is not None:
+                _check_utf8(decoder, chunk, size)
+            size += len(chunk)
+            lines += chunk.count(b'\n')
+        if decoder is not None:
+            _check_utf8(decoder, b'', size, final=True)
+        f.seek(0)
+        self.digest = digest.hexdigest()
+        self.size = size
+        # Chỉ ước lượng được số dòng dữ liệu khi upload không nén
+        self.total_rows = None if self.compression else max(lines - 1, 0)
+
+    @classmethod
+    def from_stream(cls, stream, max_memory, max_decompressed=None):
+        # Body thô của request: chép từng khối vào file tạm, vượt max_memory byte thì chuyển ra đĩa
+        f = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        shutil.copyfileobj(stream, f, COPY_CHUNK_SIZE)
+        return cls(f, max_decompressed)
+
+    def binary(self):
+        # Luồng nhị phân đã giải nén, đọc từ đầu
+        stream = self._decompressed()
+        if self.compression is None or self.max_decompressed is None:
+            return stream
+        return _Limited(stream, self.max_decompressed)
+
+    def _decompressed(self):
+        self.file.seek(0)
+        if self.compression == 'gzip':
+            return gzip.GzipFile(fileobj=self.file, mode='rb')
+        if self.compression == 'zstd':
+            if zstandard is None:
+                raise ValueError("zstd-compressed uploads require the zstandard package")
+            return zstandard.ZstdDecompressor().stream_reader(self.file, read_across_frames=True, closefd=False)
+        if self.compression == 'zip':
+            archive = zipfile.ZipFile(self.file)
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            csv_members = [info for info in members if info.filename.lower().endswith('.csv')]
+            if len(csv_members) == 1:
+                return archive.open(csv_members[0])
+            if len(members) == 1:
+                return archive.open(members[0])
+            raise ValueError("ZIP upload must contain exactly one CSV file")
+        return _KeepOpen(self.file)
+
+    def text(self, errors='strict'):
+        # utf-8-sig bỏ BOM nếu có; newline='' theo yêu cầu của module csv.
+        # errors='surrogateescape': byte không hợp lệ thành ký tự surrogate để người đọc tự ghi lỗi theo dòng
+        return io.TextIOWrapper(self.binary(), encoding='utf-8-sig', errors=errors, newline='')
+
+    def close(self):
+        self.file.close()
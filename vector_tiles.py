@@ -0,0 +1,201 @@
+import math
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Mapbox Vector Tile (MVT 2.1) cho front-end web, không cần thư viện ngoài: protobuf được ghi trực tiếp.
+# Toạ độ lon/lat được chiếu Web Mercator vào lưới EXTENT x EXTENT của tile, polygon được cắt theo khung tile
+# (thêm lề BUFFER) rồi làm tròn thành số nguyên. Tile đã sinh được giữ trong LRU theo dung lượng (TileCache).
+
+EXTENT = 4096
+BUFFER = 64
+MAX_LATITUDE = 85.0511287798
+
+GEOM_POINT = 1
+GEOM_POLYGON = 3
+CMD_MOVE_TO = 1
+CMD_LINE_TO = 2
+CMD_CLOSE_PATH = 7
+
+def tile_bounds(z, x, y):
+    # (west, south, east, north) của tile theo độ
+    n = 2 ** z
+
+    def lat(t):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * t / n))))
+
+    return (x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y))
+
+def project(lon, lat, z, x, y):
+    # Mảng lon/lat -> toạ độ (số thực) trong tile, gốc ở góc trên trái, trục y hướng xuống
+    n = 2 ** z
+    lat_rad = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    px = ((lon + 180) / 360 * n - x) * EXTENT
+    py = ((1 - np.arcsinh(np.tan(lat_rad)) / math.pi) / 2 * n - y) * EXTENT
+    return px, py
+
+def _clip_edge(points, inside, intersect):
+    clipped = []
+    prev = points[-1]
+    prev_in = inside(prev)
+    for point in points:
+        point_in = inside(point)
+        if point_in != prev_in:
+            clipped.append(intersect(prev, point))
+        if point_in:
+            clipped.append(point)
+        prev, prev_in = point, point_in
+    return clipped
+
+def clip_ring(points, lo, hi):
+    # Sutherland-Hodgman theo khung vuông [lo, hi]; đa giác sector/hình tròn đủ gần lồi nên kết quả đúng
+    def x_at(a, b, x):
+        return (x, a[1] + (b[1] - a[1]) * (x - a[0]) / (b[0] - a[0]))
+
+    def y_at(a, b, y):
+        return (a[0] + (b[0] - a[0]) * (y - a[1]) / (b[1] - a[1]), y)
+
+    for inside, intersect in ((lambda p: p[0] >= lo, lambda a, b: x_at(a, b, lo)),
+                              (lambda p: p[0] <= hi, lambda a, b: x_at(a, b, hi)),
+                              (lambda p: p[1] >= lo, lambda a, b: y_at(a, b, lo)),
+                              (lambda p: p[1] <= hi, lambda a, b: y_at(a, b, hi))):
+        if not points:
+            break
+        points = _clip_edge(points, inside, intersect)
+    return points
+
+def tile_ring(px, py):
+    # Một hàng đỉnh (đã chiếu vào tile) -> vòng ngoài số nguyên theo chiều kim đồng hồ, None nếu nằm ngoài/suy biến
+    lo, hi = -BUFFER, EXTENT + BUFFER
+    if px.max() < lo or px.min() > hi or py.max() < lo or py.min() > hi:
+        return None
+    points = list(zip(px.tolist(), py.tolist()))
+    if px.min() < lo or px.max() > hi or py.min() < lo or py.max() > hi:
+        points = clip_ring(points, lo, hi)
+    ring = []
+    for x, y in points:
+        point = (int(round(x)), int(round(y)))
+        if not ring or ring[-1] != point:
+            ring.append(point)
+    while len(ring) > 1 and ring[0] == ring[-1]:
+        ring.pop()
+    if len(ring) < 3:
+        return None
+    area = sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1]))
+    if area == 0:
+        return None
+    # Vòng ngoài MVT phải có diện tích dương (theo chiều kim đồng hồ khi trục y hướng xuống)
+    return ring if area > 0 else ring[::-1]
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+def _field(number, data):
+    # Trường length-delimited (wire type 2)
+    return _varint(number << 3 | 2) + _varint(len(data)) + data
+
+def _varint_field(number, value):
+    return _varint(number << 3) + _varint(value)
+
+def _packed(number, values):
+    return _field(number, b''.join(_varint(value) for value in values))
+
+def _command(command, count):
+    return command | (count << 3)
+
+def _value(value):
+    if isinstance(value, bool):
+        return _varint_field(7, int(value))
+    if isinstance(value, int):
+        return _varint_field(6, _zigzag(value)) if value < 0 else _varint_field(5, value)
+    if isinstance(value, float):
+        return _varint(3 << 3 | 1) + struct.pack('<d', value)
+    return _field(1, str(value).encode('utf-8'))
+
+class LayerBuilder:
+    def __init__(self, name):
+        self.name = name
+        self.keys = {}
+        self.values = {}
+        self.features = []
+
+    def __len__(self):
+        return len(self.features)
+
+    def _tags(self, properties):
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(self.keys.setdefault(key, len(self.keys)))
+            tags.append(self.values.setdefault((type(value), value), len(self.values)))
+        return tags
+
+    def _add(self, geom_type, geometry, properties, feature_id):
+        feature = b''
+        if feature_id is not None:
+            feature += _varint_field(1, feature_id)
+        feature += _packed(2, self._tags(properties)) + _varint_field(3, geom_type) + _packed(4, geometry)
+        self.features.append(feature)
+
+    def add_point(self, point, properties, feature_id=None):
+        self._add(GEOM_POINT, [_command(CMD_MOVE_TO, 1), _zigzag(point[0]), _zigzag(point[1])],
+                  properties, feature_id)
+
+    def add_polygon(self, ring, properties, feature_id=None):
+        # ring: các đỉnh số nguyên, không lặp lại đỉnh đầu ở cuối (ClosePath tự đóng vòng)
+        geometry = [_command(CMD_MOVE_TO, 1), _zigzag(ring[0][0]), _zigzag(ring[0][1]),
+                    _command(CMD_LINE_TO, len(ring) - 1)]
+        for (x0, y0), (x1, y1) in zip(ring, ring[1:]):
+            geometry.append(_zigzag(x1 - x0))
+            geometry.append(_zigzag(y1 - y0))
+        geometry.append(_command(CMD_CLOSE_PATH, 1))
+        self._add(GEOM_POLYGON, geometry, properties, feature_id)
+
+    def encode(self):
+        data = [_varint_field(15, 2), _field(1, self.name.encode('utf-8'))]
+        data.extend(_field(2, feature) for feature in self.features)
+        data.extend(_field(3, key.encode('utf-8')) for key in self.keys)
+        data.extend(_field(4, _value(value)) for _, value in self.values)
+        data.append(_varint_field(5, EXTENT))
+        return b''.join(data)
+
+def encode_tile(layers):
+    # Layer rỗng bị bỏ; tile không có feature nào là chuỗi rỗng (hợp lệ với MVT)
+    return b''.join(_field(3, layer.encode()) for layer in layers if len(layer))
+
+class TileCache:
+    # LRU theo dung lượng, trong bộ nhớ của từng process
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)